@@ -1,27 +1,398 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, has_app_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import QueuePool
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from jinja2 import FileSystemBytecodeCache
+from collections import OrderedDict, namedtuple
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+import gzip
+import hashlib
+import json
+import math
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import pickle
+import shutil
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import click
+import cProfile
+import io
+import pstats
+import random
+import re
+
+try:
+    import brotli  # Optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
 # Get configuration from environment variables
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///yarn_system.db')
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '500'))
+# Cold storage for archived orders; defaults to archive tables in the main database
+ARCHIVE_DATABASE_URL = os.environ.get('ARCHIVE_DATABASE_URL')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+# Chat on archived orders older than this is pruned ('delete') or moved to cold storage with its order ('archive')
+CHAT_RETENTION_DAYS = int(os.environ.get('CHAT_RETENTION_DAYS', '180'))
+CHAT_RETENTION_ACTION = os.environ.get('CHAT_RETENTION_ACTION', 'delete')
+# Change feed: how long a gap in change ids may be an uncommitted write, how many changes one poll reads,
+# and how long changes are kept for clients to catch up
+CHANGE_FEED_SETTLE_SECONDS = float(os.environ.get('CHANGE_FEED_SETTLE_SECONDS', '5'))
+CHANGE_FEED_BATCH = int(os.environ.get('CHANGE_FEED_BATCH', '500'))
+CHANGE_FEED_RETENTION_HOURS = int(os.environ.get('CHANGE_FEED_RETENTION_HOURS', '24'))
+# Orders created without an agent go to the least-loaded active agent
+AUTO_ASSIGN_ORDERS = os.environ.get('AUTO_ASSIGN_ORDERS', '0') == '1'
+# Raw order rows listed under a report; totals come from the daily rollup
+REPORT_DRILLDOWN_ROWS = int(os.environ.get('REPORT_DRILLDOWN_ROWS', '200'))
+# Optional read-only replica for the heavy analytical pages
+READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL')
+REPLICA_STALENESS_SECONDS = float(os.environ.get('REPLICA_STALENESS_SECONDS', '5'))
+REPLICA_HEALTH_INTERVAL = float(os.environ.get('REPLICA_HEALTH_INTERVAL', '10'))
+# Caches: 'memory' is per process, 'sqlite' is a file shared by all workers on the host
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'yarn_system_cache.db'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '60'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+# Presence: a user is online until PRESENCE_TTL seconds after their last heartbeat (pages beat every 15s).
+# Shared by default: with per-process presence a heartbeat and the lookup that should see it land on different workers
+PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'sqlite')
+PRESENCE_TTL = float(os.environ.get('PRESENCE_TTL', '45'))
+PRESENCE_LOOKUP_LIMIT = int(os.environ.get('PRESENCE_LOOKUP_LIMIT', '500'))
+# Admission control: per-user token buckets on polled and chatty routes ('sqlite' shared by the host's workers,
+# 'memory' per process, which multiplies every limit by the number of workers), and per-process caps on concurrent
+# expensive requests
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', '2'))
+REPORT_CONCURRENCY = int(os.environ.get('REPORT_CONCURRENCY', '4'))
+# How long a request waits for a free slot before it is turned away with 503
+CONCURRENCY_WAIT_SECONDS = float(os.environ.get('CONCURRENCY_WAIT_SECONDS', '2'))
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))
+# Rendered order cards kept in memory; 0 disables fragment caching
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '10000'))
+FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', '3600'))
+# Compiled templates persist here so new workers skip Jinja compilation
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'yarn_system_jinja'))
+# Bearer token for /metrics scrapers; without it only logged-in admins can read metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Request profiling: admins send "X-Profile: 1", or a fraction of requests is sampled
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'yarn_system_profiles'))
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', '50'))
+# 'cprofile' (stdlib) or 'pyinstrument' (optional dependency)
+PROFILER = os.environ.get('PROFILER', 'cprofile')
+# SQL statements slower than this are recorded with the endpoint that issued them
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '200'))
+
+# Metrics (per process, exposed in Prometheus text format at /metrics)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class MetricsRegistry:
+    """Minimal thread-safe counters and histograms"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self.callbacks = []  # [(metric type, callable)]
+    
+    def inc(self, name, labels=None, value=1, help_text=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help_text:
+                self.help.setdefault(name, help_text)
+    
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS, help_text=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            if help_text:
+                self.help.setdefault(name, help_text)
+    
+    def gauge(self, callback):
+        """Register a callable returning [(name, labels, value)] evaluated at scrape time"""
+        self.callbacks.append(('gauge', callback))
+        return callback
+    
+    def counter(self, callback):
+        """Like gauge, for totals that another object keeps and that only go up"""
+        self.callbacks.append(('counter', callback))
+        return callback
+    
+    def render(self):
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+        
+        lines = []
+        typed = set()
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+        
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, 'counter')
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, 'histogram')
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {histogram['count']}")
+        
+        for kind, callback in self.callbacks:
+            for name, labels, value in callback():
+                header(name, kind)
+                lines.append(f"{name}{fmt_labels(sorted(labels.items()))} {value}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+class SlowQueryLog:
+    """Aggregates slow SQL statements by (endpoint, statement), keeping the worst offenders"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries = {}
+    
+    def record(self, endpoint, statement, elapsed):
+        statement = re.sub(r'\s+', ' ', statement).strip()[:1000]
+        metrics.inc('db_slow_queries_total', {'endpoint': endpoint}, help_text=f'SQL statements slower than {SLOW_QUERY_MS:g} ms')
+        with self._lock:
+            entry = self.entries.get((endpoint, statement))
+            if entry is None:
+                if len(self.entries) >= self.max_entries:
+                    # Drop the entry with the least total time to make room
+                    del self.entries[min(self.entries, key=lambda key: self.entries[key]['total'])]
+                entry = self.entries[(endpoint, statement)] = {
+                    'endpoint': endpoint, 'statement': statement, 'count': 0, 'total': 0.0, 'max': 0.0
+                }
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['last_seen'] = datetime.utcnow()
+        app.logger.warning("Slow query (%.0f ms) in %s: %s", elapsed * 1000, endpoint, statement[:200])
+    
+    def top(self, limit=10):
+        with self._lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        return sorted(entries, key=lambda entry: entry['total'], reverse=True)[:limit]
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_LOG_SIZE)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.perf_counter() - start,
+                            help_text='Time spent waiting for a pooled database connection')
+
+# Maximum SQL statements per request, declared on each route with @query_budget
+QUERY_BUDGETS = {}
+
+def query_budget(limit):
+    """Declare how many SQL statements a route may issue; must sit below @app.route"""
+    def decorator(f):
+        QUERY_BUDGETS[f.__name__] = limit
+        return f
+    return decorator
+
+class QueryCounter:
+    """SQL statements captured by count_queries()"""
+    
+    def __init__(self):
+        self.statements = []
+    
+    @property
+    def count(self):
+        return len(self.statements)
+
+@contextmanager
+def count_queries():
+    """Record every SQL statement executed on any engine inside the block"""
+    counter = QueryCounter()
+    def record(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+    
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'after_cursor_execute', record)
+    try:
+        yield counter
+    finally:
+        for engine in engines:
+            event.remove(engine, 'after_cursor_execute', record)
+
+def instrument_engine(engine, bind_key):
+    """Count and time every SQL statement, attributing it to the current request"""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+    
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context():
+            g.sql_count = g.get('sql_count', 0) + 1
+            g.sql_time = g.get('sql_time', 0.0) + elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'background'
+            slow_query_log.record(endpoint, statement, elapsed)
+        metrics.observe('db_statement_duration_seconds', elapsed, {'bind': bind_key or 'default'},
+                        help_text='SQL statement execution time')
+    
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute, so drop its start time here
+        if context.execution_context is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+    
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+# Named engine profiles; DB_PROFILE overrides the profile picked from DATABASE_URL
+ENGINE_PROFILES = {
+    'sqlite': {
+        'engine_options': {
+            'connect_args': {'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '30000')) / 1000},
+        },
+        # WAL lets readers run alongside the single writer across gunicorn workers
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '30000')),
+            'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        },
+    },
+    'postgres': {
+        'engine_options': {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+            'pool_pre_ping': True,
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        },
+        'pragmas': {},
+    },
+    'default': {
+        'engine_options': {},
+        'pragmas': {},
+    },
+}
+
+def select_engine_profile(database_url, override=None):
+    """Pick the engine profile name for a database URL; override (DB_PROFILE) must name a profile that suits it"""
+    if database_url.startswith('sqlite'):
+        profile_name = 'sqlite'
+    elif database_url.startswith(('postgres://', 'postgresql')):
+        profile_name = 'postgres'
+    else:
+        profile_name = 'default'
+    if not override:
+        return profile_name
+    if override not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {override!r}; expected one of {', '.join(ENGINE_PROFILES)}")
+    # 'default' only drops the tuning; the other profiles carry driver-specific connect args and pragmas
+    if override not in ('default', profile_name):
+        raise ValueError(f"DB_PROFILE {override!r} does not fit a {profile_name} database URL")
+    return override
+
+def engine_options(database_url, profile_name):
+    """Engine options for one database: its profile's, on a timed pool unless it is in-memory SQLite"""
+    options = dict(ENGINE_PROFILES[profile_name]['engine_options'])
+    if ':memory:' not in database_url and database_url != 'sqlite://':
+        options['poolclass'] = TimedQueuePool
+    return options
+
+def configure_engine(engine, profile_name):
+    """Attach per-connection settings (SQLite pragmas) for a profile to an engine"""
+    pragmas = ENGINE_PROFILES[profile_name]['pragmas']
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+    
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+
+DB_PROFILE = select_engine_profile(DATABASE_URL, os.environ.get('DB_PROFILE'))
+
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(JINJA_CACHE_DIR)}
 
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL, DB_PROFILE)
+
+# Each extra bind gets the profile of its own URL, so SQLite and Postgres can be mixed
+BIND_PROFILES = {None: DB_PROFILE}
+SQLALCHEMY_BINDS = {}
+for bind_key, bind_url in (('archive', ARCHIVE_DATABASE_URL), ('replica', READ_DATABASE_URL)):
+    if bind_url:
+        BIND_PROFILES[bind_key] = select_engine_profile(bind_url)
+        SQLALCHEMY_BINDS[bind_key] = {'url': bind_url, **engine_options(bind_url, BIND_PROFILES[bind_key])}
+app.config['SQLALCHEMY_BINDS'] = SQLALCHEMY_BINDS
 
 # Print configuration for debugging (remove in production)
 print(f"SECRET_KEY configured: {'Yes' if SECRET_KEY != 'your-secret-key-here' else 'No'}")
 print(f"DATABASE_URL configured: {'Yes' if DATABASE_URL != 'sqlite:///yarn_system.db' else 'No'}")
 
-db = SQLAlchemy(app)
+class RoutingSession(Session):
+    """Session that sends reads from designated endpoints to the read replica"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        # Only primary-database reads are rerouted; flushes always go to the primary
+        if (bind is None and not self._flushing and has_app_context() and g.get('use_read_replica')
+                and engine is db.engines[None]):
+            return db.engines['replica']
+        return engine
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+with app.app_context():
+    for bind_key, engine in db.engines.items():
+        configure_engine(engine, BIND_PROFILES[bind_key])
+        instrument_engine(engine, bind_key)
 
 # Database Models
 class User(db.Model):
@@ -33,28 +404,49 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)  # Display spelling, copied into Order.customer_name
+    normalized_name = db.Column(db.String(200), unique=True, nullable=False)  # Dedupe and prefix-search key
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class YarnType(db.Model):
+    id = db.Column(db.SmallInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)  # Small key stored on every order
+    name = db.Column(db.String(100), nullable=False)
+    normalized_name = db.Column(db.String(100), unique=True, nullable=False)
+    family = db.Column(db.String(20), nullable=False, default='other')  # cotton, wool, silk, ... or other
+    color_start = db.Column(db.String(7), nullable=False)  # Card gradient, precomputed from the family
+    color_end = db.Column(db.String(7), nullable=False)
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(50), unique=True, nullable=False)  # e.g., PO-1052
     customer_name = db.Column(db.String(200), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), index=True)
     yarn_type = db.Column(db.String(100), nullable=False)
+    yarn_type_id = db.Column(db.SmallInteger, db.ForeignKey('yarn_type.id'), index=True)
     quantity_kg = db.Column(db.Float, nullable=False)
     startup_date = db.Column(db.Date, nullable=False)
     order_type = db.Column(db.String(20), nullable=False)  # Local / Export
     amount_usd = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), nullable=False, default='New Order')
+    status_changed_at = db.Column(db.DateTime)  # Entered the current status; None on rows older than the transition log
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     assigned_agent = db.Column(db.Integer, db.ForeignKey('user.id'))  # Primary agent
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Optimistic locking counter
     
     # Relationships
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_orders')
     agent = db.relationship('User', foreign_keys=[assigned_agent], backref='assigned_orders')
+    customer = db.relationship('Customer', backref='orders')
+    
+    __mapper_args__ = {'version_id_col': version}
 
 class OrderAgent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -64,7 +456,7 @@ class OrderAgent(db.Model):
 
 class Contract(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -88,24 +480,153 @@ class AuditLog(db.Model):
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Retention scans by age
     
     # Relationships
     order = db.relationship('Order', backref='chat_messages')
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     tagged_agents = db.relationship('ChatTag', backref='message', cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_chat_message_order_created', 'order_id', 'created_at'),)
 
 class ChatTag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    message_id = db.Column(db.Integer, db.ForeignKey('chat_message.id'), nullable=False)
+    message_id = db.Column(db.Integer, db.ForeignKey('chat_message.id', ondelete='CASCADE'), nullable=False, index=True)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Relationships
     agent = db.relationship('User', backref='tagged_messages')
 
+class OrderDraft(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    base_version = db.Column(db.Integer, nullable=False)  # Order.version the edits were made against
+    fields = db.Column(db.Text, nullable=False, default='{}')  # JSON of edited form fields only
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('order_id', 'user_id'),)
+
+class OrderStatusTransition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)  # No FK: the history stays when the order moves to cold storage
+    from_status = db.Column(db.String(50))  # None for the status an order was created in
+    to_status = db.Column(db.String(50), nullable=False)
+    changed_by = db.Column(db.Integer, db.ForeignKey('user.id'))  # None for maintenance jobs
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    seconds_in_previous = db.Column(db.Float)  # Time the order spent in from_status
+    agent_id = db.Column(db.Integer)  # Primary agent and yarn type when the change happened
+    yarn_type_id = db.Column(db.SmallInteger)
+
+# Per-day stage rollup of OrderStatusTransition, updated in the same transaction as each transition
+class StageMetric(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    stage = db.Column(db.String(50), primary_key=True)
+    agent_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 when no agent was assigned
+    yarn_type_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 when the yarn type was not linked
+    entered = db.Column(db.Integer, nullable=False, default=0)  # Orders that moved into the stage (throughput)
+    exited = db.Column(db.Integer, nullable=False, default=0)  # Orders that moved out of the stage
+    seconds_in_stage = db.Column(db.Float, nullable=False, default=0)  # Summed over exits; average = seconds_in_stage / exited
+
+# Per-day order totals for reports, keyed by startup date; every order write moves its contribution between rows
+class OrderDailyRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)  # Order.startup_date
+    order_type = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    agent_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 when no agent is assigned
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity_kg = db.Column(db.Float, nullable=False, default=0)
+    amount_usd = db.Column(db.Float, nullable=False, default=0)
+
+# Open orders and kilograms per agent, kept up to date with OrderDailyRollup. The load index is the
+# priority queue auto-assignment reads its least-loaded agent from
+class AgentWorkload(db.Model):
+    agent_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    open_orders = db.Column(db.Integer, nullable=False, default=0)
+    open_kg = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (db.Index('ix_agent_workload_load', 'open_orders', 'open_kg', 'agent_id'),)
+
+# Append-only log of order mutations; the id is the /api/changes cursor
+class OrderChange(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)  # No FK: deletions are changes too
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    __table_args__ = {'sqlite_autoincrement': True}  # Ids are never reused, so cursors only move forward
+
+class ReferenceDataVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # e.g. users
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+# Cold-tier copies of archived orders. Hot-path queries never touch these tables.
+class ArchivedOrder(db.Model):
+    __bind_key__ = 'archive' if ARCHIVE_DATABASE_URL else None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False, index=True)  # Order.id before archiving
+    order_id = db.Column(db.String(50), nullable=False, index=True)
+    customer_name = db.Column(db.String(200), nullable=False)
+    yarn_type = db.Column(db.String(100), nullable=False)
+    quantity_kg = db.Column(db.Float, nullable=False)
+    startup_date = db.Column(db.Date, nullable=False, index=True)
+    order_type = db.Column(db.String(20), nullable=False)
+    amount_usd = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    created_by = db.Column(db.Integer, nullable=False)
+    assigned_agent = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships (users may live in another database, so no foreign keys)
+    creator = db.relationship('User', primaryjoin='foreign(ArchivedOrder.created_by) == User.id', viewonly=True)
+    agent = db.relationship('User', primaryjoin='foreign(ArchivedOrder.assigned_agent) == User.id', viewonly=True)
+    assigned_agents = db.relationship('ArchivedOrderAgent', backref='order', cascade='all, delete-orphan')
+    contracts = db.relationship('ArchivedContract', backref='order', cascade='all, delete-orphan')
+    chat_messages = db.relationship('ArchivedChatMessage', backref='order', cascade='all, delete-orphan')
+
+class ArchivedOrderAgent(db.Model):
+    __bind_key__ = 'archive' if ARCHIVE_DATABASE_URL else None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    archived_order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id', ondelete='CASCADE'), nullable=False, index=True)
+    agent_id = db.Column(db.Integer, nullable=False)
+    assigned_at = db.Column(db.DateTime)
+
+class ArchivedContract(db.Model):
+    __bind_key__ = 'archive' if ARCHIVE_DATABASE_URL else None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    archived_order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    uploaded_by = db.Column(db.Integer, nullable=False)
+    uploaded_at = db.Column(db.DateTime)
+
+class ArchivedChatMessage(db.Model):
+    __bind_key__ = 'archive' if ARCHIVE_DATABASE_URL else None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    archived_order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id', ondelete='CASCADE'), nullable=False, index=True)
+    sender_id = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime)
+    
+    # Relationships
+    tagged_agents = db.relationship('ArchivedChatTag', backref='message', cascade='all, delete-orphan')
+
+class ArchivedChatTag(db.Model):
+    __bind_key__ = 'archive' if ARCHIVE_DATABASE_URL else None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    archived_message_id = db.Column(db.Integer, db.ForeignKey('archived_chat_message.id', ondelete='CASCADE'), nullable=False)
+    agent_id = db.Column(db.Integer, nullable=False)
+
 # Email notification function
 def send_notification_email(to_email, subject, message):
     """Send email notification (simplified version for demo)"""
@@ -141,7 +662,6 @@ def log_audit(user_id, action, entity_type, entity_id, details=None):
 # Generate order ID
 def generate_order_id():
     """Generate unique order ID like PO-1052"""
-    import random
     return f"PO-{random.randint(1000, 9999)}"
 
 # Order status progression
@@ -153,6 +673,9 @@ ORDER_STATUSES = {
     'Archived': 5
 }
 
+# Orders in these statuses no longer count toward an agent's workload
+CLOSED_STATUSES = ('Archived',)
+
 def can_move_order(user_role, from_status, to_status):
     """Check if user can move order from one status to another"""
     if user_role == 'admin':
@@ -165,14 +688,1584 @@ def can_move_order(user_role, from_status, to_status):
     else:  # user
         return False
 
+def status_transition(order, from_status, to_status, user_id, now):
+    """Values for an OrderStatusTransition row; order can be an Order or a row with the same columns"""
+    entered_at = order.status_changed_at or order.created_at
+    return {
+        'order_id': order.id, 'from_status': from_status, 'to_status': to_status, 'changed_by': user_id, 'changed_at': now,
+        'seconds_in_previous': max((now - entered_at).total_seconds(), 0.0) if from_status and entered_at else None,
+        'agent_id': order.assigned_agent, 'yarn_type_id': order.yarn_type_id,
+    }
+
+def increment_rollups(model, deltas):
+    """Add {primary key tuple: {column: amount}} to rollup rows, inserting the missing ones (no commit)"""
+    key_columns = [column.name for column in model.__table__.primary_key.columns]
+    # Sorted so concurrent writers take row locks in the same order
+    for key, amounts in sorted(deltas.items()):
+        match = dict(zip(key_columns, key))
+        increment = (db.update(model).filter_by(**match)
+                     .values({name: getattr(model, name) + amount for name, amount in amounts.items()})
+                     .execution_options(synchronize_session=False))
+        if db.session.execute(increment).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**match, **amounts))
+        except sa_exc.IntegrityError:
+            # Another worker created the row first
+            db.session.execute(increment)
+
+def bump_stage_metrics(transitions, sign=1):
+    """Fold transitions into the StageMetric rollup, or take them back out with sign=-1 (no commit)"""
+    deltas = {}
+    for transition in transitions:
+        day, agent_id, yarn_type_id = transition['changed_at'].date(), transition['agent_id'] or 0, transition['yarn_type_id'] or 0
+        entered = deltas.setdefault((day, transition['to_status'], agent_id, yarn_type_id),
+                                    {'entered': 0, 'exited': 0, 'seconds_in_stage': 0.0})
+        entered['entered'] += sign
+        if transition['from_status']:
+            exited = deltas.setdefault((day, transition['from_status'], agent_id, yarn_type_id),
+                                       {'entered': 0, 'exited': 0, 'seconds_in_stage': 0.0})
+            exited['exited'] += sign
+            exited['seconds_in_stage'] += sign * (transition['seconds_in_previous'] or 0.0)
+    increment_rollups(StageMetric, deltas)
+
+def record_status_transitions(transitions):
+    """Insert transition rows and update the stage rollups in the caller's transaction (no commit)"""
+    if not transitions:
+        return
+    with db.session.no_autoflush:
+        db.session.execute(db.insert(OrderStatusTransition), transitions)
+        bump_stage_metrics(transitions)
+
+def log_order_changes(order_ids):
+    """Append orders to the change feed in the caller's transaction (no commit)"""
+    now = datetime.utcnow()
+    rows = [{'order_id': order_id, 'changed_at': now} for order_id in dict.fromkeys(order_ids)]
+    if rows:
+        with db.session.no_autoflush:
+            db.session.execute(db.insert(OrderChange), rows)
+
+def rollup_entry(order, status=None):
+    """An order's contribution to OrderDailyRollup as (key, amounts); order can be an Order or a row with the same columns"""
+    return ((order.startup_date, order.order_type, status or order.status, order.assigned_agent or 0),
+            (1, order.quantity_kg or 0.0, order.amount_usd or 0.0))
+
+def bump_order_rollups(removed=(), added=()):
+    """Move orders' contributions between OrderDailyRollup rows; entries come from rollup_entry() (no commit)"""
+    totals = {}
+    for entries, sign in ((removed, -1), (added, 1)):
+        for key, amounts in entries:
+            total = totals.setdefault(key, [0, 0.0, 0.0])
+            for i, amount in enumerate(amounts):
+                total[i] += sign * amount
+    # An entry removed and added back unchanged cancels out and costs no statement
+    deltas = {key: {'order_count': count, 'quantity_kg': kg, 'amount_usd': usd}
+              for key, (count, kg, usd) in totals.items() if count or kg or usd}
+    # The same deltas, summed per agent over the open statuses, keep AgentWorkload current
+    workloads = {}
+    for (day, order_type, status, agent_id), amounts in deltas.items():
+        if agent_id and status not in CLOSED_STATUSES:
+            workload = workloads.setdefault((agent_id,), {'open_orders': 0, 'open_kg': 0.0})
+            workload['open_orders'] += amounts['order_count']
+            workload['open_kg'] += amounts['quantity_kg']
+    workloads = {key: amounts for key, amounts in workloads.items() if amounts['open_orders'] or amounts['open_kg']}
+    if deltas:
+        with db.session.no_autoflush:
+            increment_rollups(OrderDailyRollup, deltas)
+            increment_rollups(AgentWorkload, workloads)
+
+# Agents this process knows to have an AgentWorkload row; agents without one are given a zero row on first pick
+workload_agent_ids = set()
+
+def ensure_workload_rows(agent_ids):
+    """Give agents a zero AgentWorkload row, so the load index can rank them (no commit)"""
+    missing = set(agent_ids) - workload_agent_ids
+    if missing:
+        present = {row.agent_id for row in db.session.query(AgentWorkload.agent_id).filter(AgentWorkload.agent_id.in_(missing))}
+        increment_rollups(AgentWorkload, {(agent_id,): {'open_orders': 0} for agent_id in missing - present})
+        # Rows inserted here are only trusted once a later pick sees them committed
+        workload_agent_ids.update(present)
+
+def least_loaded_agent(eligible_ids=None):
+    """Id of the active agent with the fewest open orders, then the fewest open kg; None when nobody is eligible"""
+    candidates = [agent.id for agent in all_agents() if agent.is_active and (eligible_ids is None or agent.id in eligible_ids)]
+    if not candidates:
+        return None
+    ensure_workload_rows(candidates)
+    # Read off the front of the load index instead of counting every agent's orders. The pick is a no-op UPDATE of
+    # the chosen row, so it holds the row until the caller commits the assignment with its workload increment.
+    # A concurrent pick skips that agent (SKIP LOCKED on Postgres, waiting only when every candidate is taken);
+    # SQLite lets one writer through at a time, so a second pick cannot commit on the same stale front either.
+    for skip_locked in (True, False):
+        front = db.select(AgentWorkload.agent_id).where(AgentWorkload.agent_id.in_(candidates)) \
+            .order_by(AgentWorkload.open_orders, AgentWorkload.open_kg, AgentWorkload.agent_id).limit(1) \
+            .with_for_update(skip_locked=skip_locked).scalar_subquery()
+        agent_id = db.session.execute(db.update(AgentWorkload).where(AgentWorkload.agent_id == front)
+                                      .values(open_orders=AgentWorkload.open_orders).returning(AgentWorkload.agent_id)
+                                      .execution_options(synchronize_session=False)).scalar()
+        if agent_id is not None:
+            return agent_id
+    return None
+
+def agent_workloads(agent_ids):
+    """{agent id: (open orders, open kg)}; agents without a row have no open orders"""
+    rows = db.session.query(AgentWorkload.agent_id, AgentWorkload.open_orders, AgentWorkload.open_kg) \
+        .filter(AgentWorkload.agent_id.in_(list(agent_ids))).all()
+    workloads = {agent_id: (0, 0.0) for agent_id in agent_ids}
+    workloads.update((agent_id, (open_orders, open_kg)) for agent_id, open_orders, open_kg in rows)
+    return workloads
+
+def change_order_status(order, new_status, user_id):
+    """Set the order's status and record the transition; call after the order's other changes (no commit)"""
+    if new_status == order.status:
+        return
+    now = datetime.utcnow()
+    transition = status_transition(order, order.status, new_status, user_id, now)
+    order.status = new_status
+    order.status_changed_at = now
+    record_status_transitions([transition])
+
+def order_card(order, user):
+    """Serialize an order as a board card so the client can patch it in place"""
+    return {
+        'id': order.id,
+        'status': order.status,
+        'version': order.version,
+        'html': render_template('_order_card.html', order=order, user=user)
+    }
+
+def can_edit_order(user, order):
+    """Admins edit any order, agents the orders they are assigned to, users their own"""
+    if user.role == 'agent':
+        return (order.assigned_agent == user.id or
+                OrderAgent.query.filter_by(order_id=order.id, agent_id=user.id).first() is not None)
+    if user.role == 'user':
+        return order.created_by == user.id
+    return True
+
+def wants_json():
+    """True for fetch() callers that asked for JSON instead of a redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+@app.errorhandler(500)
+def internal_server_error(error):
+    """Unhandled errors are logged by Flask first; fetch() callers get JSON they can show instead of an HTML page"""
+    if wants_json():
+        return jsonify({'success': False, 'message': 'Internal server error'}), 500
+    return error
+
+# Editable order fields and how the raw form value is converted for the Order row
+ORDER_FORM_FIELDS = {
+    'customer_name': str,
+    'yarn_type': str,
+    'quantity_kg': float,
+    'startup_date': lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+    'order_type': str,
+    'amount_usd': float,
+    'status': str,
+    'assigned_agent': lambda value: int(value) if value else None,
+    'agent_ids': lambda values: sorted({int(agent_id) for agent_id in values}),
+}
+ADMIN_ORDER_FIELDS = {'status', 'assigned_agent', 'agent_ids'}
+MAX_DRAFT_VALUE_LENGTH = 1000
+
+def editable_fields(user):
+    return [name for name in ORDER_FORM_FIELDS if user.role == 'admin' or name not in ADMIN_ORDER_FIELDS]
+
+def order_changes(order, raw, user):
+    """Converted values from raw form fields that differ from the order; raises ValueError on bad input"""
+    changes = {}
+    for name in editable_fields(user):
+        if name not in raw:
+            continue
+        value = ORDER_FORM_FIELDS[name](raw[name])
+        # 'Confirmed' is set by the confirm flow rather than the board, but editing such an order keeps it
+        if name == 'status' and value not in ORDER_STATUSES and value != 'Confirmed':
+            raise ValueError(f"Unknown status {value}")
+        current = sorted(row.agent_id for row in order.assigned_agents) if name == 'agent_ids' else getattr(order, name)
+        if value != current:
+            changes[name] = value
+    return changes
+
+def apply_order_changes(order, changes, user_id):
+    """Write only the changed columns; agent rows are touched only when the agent set changed (no commit)"""
+    before = rollup_entry(order)
+    if 'agent_ids' in changes:
+        wanted = {row.id for row in db.session.query(User.id).filter(User.id.in_(changes['agent_ids']), User.role == 'agent')}
+        current = {row.agent_id for row in order.assigned_agents}
+        if current - wanted:
+            OrderAgent.query.filter(OrderAgent.order_id == order.id, OrderAgent.agent_id.in_(current - wanted)).delete(synchronize_session=False)
+        if wanted - current:
+            db.session.execute(db.insert(OrderAgent), [{'order_id': order.id, 'agent_id': agent_id, 'assigned_at': datetime.utcnow()}
+                                                       for agent_id in sorted(wanted - current)])
+        db.session.expire(order, ['assigned_agents'])
+    # Resolve both catalogs before touching the order, so their queries cannot autoflush a partial UPDATE
+    customer = resolve_customers([changes['customer_name']])[changes['customer_name']] if 'customer_name' in changes else None
+    yarn = resolve_yarn_types([changes['yarn_type']])[changes['yarn_type']] if 'yarn_type' in changes else None
+    if customer:
+        changes['customer_name'] = customer.name
+        order.customer_id = customer.id
+    if yarn:
+        changes['yarn_type'] = yarn.name
+        order.yarn_type_id = yarn.id
+    for name, value in changes.items():
+        if name not in ('agent_ids', 'status'):
+            setattr(order, name, value)
+    order.updated_at = datetime.utcnow()
+    if 'status' in changes:
+        change_order_status(order, changes['status'], user_id)
+    bump_order_rollups([before], [rollup_entry(order)])
+    log_order_changes([order.id])
+
+def merge_draft_patch(draft, patch):
+    """Apply a field-level patch to a draft; None removes a field. Returns True if the draft changed."""
+    fields = json.loads(draft.fields or '{}')
+    merged = dict(fields)
+    for name, value in patch.items():
+        if value is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = value
+    if merged == fields and draft.id is not None:
+        return False
+    draft.fields = json.dumps(merged, sort_keys=True)
+    draft.updated_at = datetime.utcnow()
+    return True
+
+def clean_draft_patch(patch, user):
+    """Keep known fields the user may edit, as strings (lists of strings for agent_ids)"""
+    if not isinstance(patch, dict):
+        raise ValueError('patch must be an object')
+    allowed = editable_fields(user)
+    cleaned = {}
+    for name, value in patch.items():
+        if name not in allowed:
+            continue
+        if value is None:
+            cleaned[name] = None
+        elif name == 'agent_ids':
+            cleaned[name] = sorted({str(agent_id) for agent_id in (value if isinstance(value, list) else [value])})
+        else:
+            cleaned[name] = str(value)[:MAX_DRAFT_VALUE_LENGTH]
+    return cleaned
+
+# Columns added after the first release; create_all() does not alter existing tables
+SCHEMA_UPGRADES = [
+    ('order', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('order', 'customer_id', 'INTEGER REFERENCES customer(id)'),
+    ('order', 'yarn_type_id', 'SMALLINT REFERENCES yarn_type(id)'),
+    ('order', 'status_changed_at', 'TIMESTAMP'),
+]
+
+def upgrade_schema():
+    """Add columns and indexes that are missing from tables created by older versions"""
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table, column, ddl in SCHEMA_UPGRADES:
+        if not inspector.has_table(table):
+            continue
+        existing = [col['name'] for col in inspector.get_columns(table)]
+        if column not in existing:
+            db.session.execute(db.text(f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column)} {ddl}"))
+    db.session.commit()
+    
+    # Indexes declared on the models are likewise only created along with new tables
+    for table in db.metadata.sorted_tables:
+        if inspector.has_table(table.name):
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+# Contract files are removed by a background worker so deletes never wait on disk I/O
+file_cleanup_queue = queue.Queue()
+_file_cleanup_thread = None
+
+def _file_cleanup_worker():
+    while True:
+        file_path = file_cleanup_queue.get()
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as e:
+            print(f"File cleanup failed for {file_path}: {e}")
+        finally:
+            file_cleanup_queue.task_done()
+
+def queue_file_removal(file_paths):
+    """Hand file paths to the background cleaner, starting it on first use"""
+    global _file_cleanup_thread
+    # Started lazily (and restarted after a fork) rather than at import time
+    if _file_cleanup_thread is None or not _file_cleanup_thread.is_alive():
+        _file_cleanup_thread = threading.Thread(target=_file_cleanup_worker, name='file-cleanup', daemon=True)
+        _file_cleanup_thread.start()
+    for file_path in file_paths:
+        file_cleanup_queue.put(file_path)
+
+def delete_chat_messages(*criteria):
+    """Delete the chat messages matching criteria and their tags using set-based statements (no commit)"""
+    message_ids = db.select(ChatMessage.id).where(*criteria)
+    
+    # Tags first so the statements work with or without ON DELETE CASCADE enforcement
+    ChatTag.query.filter(ChatTag.message_id.in_(message_ids)).delete(synchronize_session=False)
+    return ChatMessage.query.filter(*criteria).delete(synchronize_session=False)
+
+def delete_order_rows(order_ids):
+    """Delete orders with their chat, agent and contract rows using set-based statements (no commit)"""
+    # Children first so the statements work with or without ON DELETE CASCADE enforcement
+    delete_chat_messages(ChatMessage.order_id.in_(order_ids))
+    OrderAgent.query.filter(OrderAgent.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Contract.query.filter(Contract.order_id.in_(order_ids)).delete(synchronize_session=False)
+    OrderDraft.query.filter(OrderDraft.order_id.in_(order_ids)).delete(synchronize_session=False)
+    return Order.query.filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
+
+def purge_orders(order_ids, user_id=None, batch_size=None):
+    """Delete orders and every child row with set-based statements, one bounded transaction per batch"""
+    batch_size = batch_size or BULK_BATCH_SIZE
+    order_ids = list(order_ids)
+    deleted = 0
+    
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        
+        orders = db.session.query(Order.id, Order.order_id, Order.customer_name, Order.amount_usd, Order.quantity_kg, Order.status,
+                                  Order.startup_date, Order.order_type, Order.assigned_agent).filter(Order.id.in_(batch)).all()
+        file_paths = [row.file_path for row in db.session.query(Contract.file_path).filter(Contract.order_id.in_(batch))]
+        AuditLog.query.filter(AuditLog.entity_type == 'order', AuditLog.entity_id.in_(batch)).delete(synchronize_session=False)
+        # Take the purged orders' transitions back out of the cycle-time rollup, so it still matches a rebuild
+        transitions = db.session.execute(db.select(OrderStatusTransition.__table__)
+                                         .where(OrderStatusTransition.order_id.in_(batch))).mappings().all()
+        bump_stage_metrics(transitions, sign=-1)
+        OrderStatusTransition.query.filter(OrderStatusTransition.order_id.in_(batch)).delete(synchronize_session=False)
+        deleted += delete_order_rows(batch)
+        bump_order_rollups(removed=[rollup_entry(order) for order in orders])
+        log_order_changes([order.id for order in orders])
+        
+        if user_id:
+            for order in orders:
+                db.session.add(AuditLog(user_id=user_id, action='order_deleted', entity_type='order', entity_id=order.id,
+                                        details=f"Deleted Order {order.order_id} - {order.customer_name} - ${order.amount_usd}"))
+        
+        db.session.commit()
+        queue_file_removal(file_paths)
+    
+    invalidate_order_caches()
+    return deleted
+
+def archive_orders(order_ids, user_id=None, batch_size=None):
+    """Move orders to Archived with set-based updates, one bounded transaction per batch"""
+    batch_size = batch_size or BULK_BATCH_SIZE
+    order_ids = list(order_ids)
+    archived = 0
+    
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        now = datetime.utcnow()
+        moving = db.session.query(Order.id, Order.status, Order.status_changed_at, Order.created_at, Order.assigned_agent,
+                                  Order.yarn_type_id, Order.startup_date, Order.order_type, Order.quantity_kg, Order.amount_usd
+                                  ).filter(Order.id.in_(batch), Order.status != 'Archived').all()
+        result = db.session.execute(
+            db.update(Order)
+            .where(Order.id.in_([row.id for row in moving]), Order.status != 'Archived')
+            .values(status='Archived', version=Order.version + 1, updated_at=now, status_changed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        archived += result.rowcount
+        record_status_transitions([status_transition(row, row.status, 'Archived', user_id, now) for row in moving])
+        bump_order_rollups([rollup_entry(row) for row in moving], [rollup_entry(row, 'Archived') for row in moving])
+        log_order_changes([row.id for row in moving])
+        
+        if user_id:
+            # Only the orders this batch actually archived; missing or already archived ids are skipped
+            for row in moving:
+                db.session.add(AuditLog(user_id=user_id, action='order_archived', entity_type='order', entity_id=row.id,
+                                        details=f"Archived order {row.id} in bulk"))
+        
+        db.session.commit()
+    
+    db.session.expire_all()
+    invalidate_order_caches()
+    return archived
+
+def move_to_cold_storage(older_than_days=None, batch_size=None):
+    """Copy archived orders older than the cutoff into the archive tables and drop them from the hot tables"""
+    older_than_days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    order_ids = [row.id for row in db.session.query(Order.id).filter(Order.status == 'Archived', Order.updated_at < cutoff)]
+    return move_orders_to_cold_storage(order_ids, batch_size)
+
+def move_orders_to_cold_storage(order_ids, batch_size=None):
+    """Move the given orders with all their child rows into the archive tables, one transaction per batch"""
+    batch_size = batch_size or BULK_BATCH_SIZE
+    moved = 0
+    
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        orders = Order.query.filter(Order.id.in_(batch)).options(
+            db.selectinload(Order.assigned_agents),
+            db.selectinload(Order.contracts),
+            db.selectinload(Order.chat_messages).selectinload(ChatMessage.tagged_agents)
+        ).all()
+        keys = {order.id: order.order_id for order in orders}
+        # A run cut short between the two commits below already copied some of these
+        copied = archived_order_keys(keys)
+        
+        for order in orders:
+            if (order.id, order.order_id) in copied:
+                continue
+            db.session.add(ArchivedOrder(
+                original_id=order.id, order_id=order.order_id, customer_name=order.customer_name,
+                yarn_type=order.yarn_type, quantity_kg=order.quantity_kg, startup_date=order.startup_date,
+                order_type=order.order_type, amount_usd=order.amount_usd, status=order.status,
+                created_by=order.created_by, assigned_agent=order.assigned_agent,
+                created_at=order.created_at, updated_at=order.updated_at, version=order.version,
+                assigned_agents=[ArchivedOrderAgent(agent_id=oa.agent_id, assigned_at=oa.assigned_at) for oa in order.assigned_agents],
+                contracts=[ArchivedContract(filename=c.filename, file_path=c.file_path, uploaded_by=c.uploaded_by,
+                                            uploaded_at=c.uploaded_at) for c in order.contracts],
+                chat_messages=[ArchivedChatMessage(sender_id=msg.sender_id, message=msg.message, created_at=msg.created_at,
+                                                   tagged_agents=[ArchivedChatTag(agent_id=tag.agent_id) for tag in msg.tagged_agents])
+                               for msg in order.chat_messages]
+            ))
+        
+        # The archive may be another database, so the copy commits on its own first. Only orders
+        # confirmed to be in the archive are then deleted, which makes a rerun after a crash safe.
+        # Contract files stay on disk; they are still reachable through the archive rows
+        db.session.commit()
+        db.session.expunge_all()
+        copied = archived_order_keys(keys)
+        confirmed = [order_pk for order_pk, number in keys.items() if (order_pk, number) in copied]
+        if confirmed:
+            moved += delete_order_rows(confirmed)
+            log_order_changes(confirmed)
+        db.session.commit()
+    
+    invalidate_order_caches()
+    return moved
+
+def archived_order_keys(orders):
+    """(original id, PO number) pairs already in the archive for {order id: PO number}"""
+    if not orders:
+        return set()
+    # The PO number is matched too: on SQLite a new order can reuse the id of one moved out
+    return {(row.original_id, row.order_id) for row in db.session.query(ArchivedOrder.original_id, ArchivedOrder.order_id)
+            .filter(ArchivedOrder.original_id.in_(list(orders)))} & set(orders.items())
+
+def apply_chat_retention(older_than_days=None, action=None, batch_size=None):
+    """Prune or archive chat older than the cutoff on archived orders in bounded batches; returns rows affected"""
+    older_than_days = CHAT_RETENTION_DAYS if older_than_days is None else older_than_days
+    action = action or CHAT_RETENTION_ACTION
+    batch_size = batch_size or BULK_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    old_messages = db.select(ChatMessage.order_id).where(ChatMessage.created_at < cutoff)
+    
+    if action == 'archive':
+        # Messages move to cold storage together with their order, so the chat history stays whole
+        order_ids = [row.id for row in db.session.query(Order.id).filter(Order.status == 'Archived', Order.id.in_(old_messages))]
+        return move_orders_to_cold_storage(order_ids, batch_size)
+    if action != 'delete':
+        raise ValueError(f"Unknown chat retention action {action}")
+    
+    deleted = 0
+    while True:
+        batch = [row.id for row in db.session.query(ChatMessage.id).join(Order, Order.id == ChatMessage.order_id).filter(
+            Order.status == 'Archived', ChatMessage.created_at < cutoff).order_by(ChatMessage.id).limit(batch_size)]
+        if not batch:
+            break
+        deleted += delete_chat_messages(ChatMessage.id.in_(batch))
+        db.session.commit()
+    
+    if deleted:
+        invalidate_order_caches()
+    return deleted
+
+def delete_archived_rows(archived_ids):
+    """Delete cold-tier orders and their child rows using set-based statements (no commit)"""
+    message_ids = db.select(ArchivedChatMessage.id).where(ArchivedChatMessage.archived_order_id.in_(archived_ids))
+    ArchivedChatTag.query.filter(ArchivedChatTag.archived_message_id.in_(message_ids)).delete(synchronize_session=False)
+    ArchivedChatMessage.query.filter(ArchivedChatMessage.archived_order_id.in_(archived_ids)).delete(synchronize_session=False)
+    ArchivedOrderAgent.query.filter(ArchivedOrderAgent.archived_order_id.in_(archived_ids)).delete(synchronize_session=False)
+    ArchivedContract.query.filter(ArchivedContract.archived_order_id.in_(archived_ids)).delete(synchronize_session=False)
+    return ArchivedOrder.query.filter(ArchivedOrder.id.in_(archived_ids)).delete(synchronize_session=False)
+
+def restore_archived_orders(original_ids):
+    """Move cold-tier orders back into the live tables; returns (restored ids, skipped ids)"""
+    restored = []
+    skipped = []
+    archived_orders = ArchivedOrder.query.filter(ArchivedOrder.original_id.in_(original_ids)).options(
+        db.selectinload(ArchivedOrder.assigned_agents),
+        db.selectinload(ArchivedOrder.contracts),
+        db.selectinload(ArchivedOrder.chat_messages).selectinload(ArchivedChatMessage.tagged_agents)
+    ).all()
+    
+    # The id or PO number may have been reused while the order was in cold storage
+    taken_ids = {row.id for row in db.session.query(Order.id).filter(
+        Order.id.in_([archived.original_id for archived in archived_orders]))}
+    taken_numbers = {row.order_id for row in db.session.query(Order.order_id).filter(
+        Order.order_id.in_([archived.order_id for archived in archived_orders]))}
+    restored_rows = []
+    customers = resolve_customers([archived.customer_name for archived in archived_orders]) if archived_orders else {}
+    yarn_types = resolve_yarn_types([archived.yarn_type for archived in archived_orders]) if archived_orders else {}
+    
+    for archived in archived_orders:
+        if archived.original_id in taken_ids or archived.order_id in taken_numbers:
+            skipped.append(archived.original_id)
+            continue
+        taken_ids.add(archived.original_id)
+        taken_numbers.add(archived.order_id)
+        
+        db.session.add(Order(
+            id=archived.original_id, order_id=archived.order_id,
+            customer_id=customers[archived.customer_name].id, customer_name=customers[archived.customer_name].name,
+            yarn_type_id=yarn_types[archived.yarn_type].id, yarn_type=yarn_types[archived.yarn_type].name,
+            quantity_kg=archived.quantity_kg, startup_date=archived.startup_date,
+            order_type=archived.order_type, amount_usd=archived.amount_usd, status=archived.status,
+            created_by=archived.created_by, assigned_agent=archived.assigned_agent,
+            created_at=archived.created_at, updated_at=archived.updated_at, status_changed_at=archived.updated_at,
+            assigned_agents=[OrderAgent(agent_id=oa.agent_id, assigned_at=oa.assigned_at) for oa in archived.assigned_agents],
+            contracts=[Contract(filename=c.filename, file_path=c.file_path, uploaded_by=c.uploaded_by,
+                                uploaded_at=c.uploaded_at) for c in archived.contracts],
+            chat_messages=[ChatMessage(sender_id=msg.sender_id, message=msg.message, created_at=msg.created_at,
+                                       tagged_agents=[ChatTag(agent_id=tag.agent_id) for tag in msg.tagged_agents])
+                           for msg in archived.chat_messages]
+        ))
+        restored_rows.append(archived.id)
+        restored.append(archived.original_id)
+    
+    db.session.flush()
+    delete_archived_rows(restored_rows)
+    log_order_changes(restored)
+    if restored:
+        advance_order_id_sequence(max(restored))
+    db.session.commit()
+    invalidate_order_caches()
+    return restored, skipped
+
+def advance_order_id_sequence(inserted_id):
+    """After inserting orders with explicit ids, keep Postgres from handing one of them out again (no commit)"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    sequence = db.session.execute(db.text("SELECT pg_get_serial_sequence(:table, 'id')"),
+                                  {'table': f'"{Order.__tablename__}"'}).scalar()
+    if sequence:
+        # Never move the sequence backwards past ids it already gave out
+        db.session.execute(db.text(f"SELECT setval(:sequence, GREATEST(:inserted_id, (SELECT last_value FROM {sequence})))"),
+                           {'sequence': sequence, 'inserted_id': inserted_id})
+
+# Read replica routing
+_replica_health = {'ok': True, 'checked_at': 0.0}
+
+def replica_available():
+    """Check (at most every REPLICA_HEALTH_INTERVAL seconds) that the replica answers"""
+    if not READ_DATABASE_URL:
+        return False
+    now = time.monotonic()
+    if now - _replica_health['checked_at'] >= REPLICA_HEALTH_INTERVAL:
+        try:
+            with db.engines['replica'].connect() as conn:
+                conn.execute(db.text('SELECT 1'))
+            _replica_health['ok'] = True
+        except sa_exc.SQLAlchemyError as e:
+            print(f"Read replica unavailable: {e}")
+            _replica_health['ok'] = False
+        _replica_health['checked_at'] = now
+    return _replica_health['ok']
+
+def wrote_recently():
+    """True while this user's own writes may not have reached the replica yet"""
+    last_write_at = session.get('last_write_at')
+    return last_write_at is not None and time.time() - last_write_at < REPLICA_STALENESS_SECONDS
+
+def read_replica(view):
+    """Serve a read-only view from the replica, falling back to the primary"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_read_replica = replica_available() and not wrote_recently()
+        if not g.use_read_replica:
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        except sa_exc.OperationalError as e:
+            print(f"Read replica query failed, retrying on primary: {e}")
+            _replica_health.update(ok=False, checked_at=time.monotonic())
+            db.session.rollback()
+            g.use_read_replica = False
+            return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def remember_last_write(response):
+    """Pin a user to the primary for a short window after they change something"""
+    if (READ_DATABASE_URL and request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and 'user_id' in session and response.status_code < 400):
+        session['last_write_at'] = time.time()
+    return response
+
+# Caching
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL"""
+    
+    def __init__(self, name, max_entries=256, ttl=60):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+def connect_cache_file(local, path, schema):
+    """SQLite connection to a file shared by the host's workers, creating the schema on first use"""
+    # One connection per thread and per process (connections must not cross a fork)
+    conn = getattr(local, 'conn', None)
+    if conn is None or local.pid != os.getpid():
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in schema:
+            conn.execute(statement)
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
+
+class SQLiteCache:
+    """LRU/TTL cache in a SQLite file so every worker on the host shares entries and invalidations"""
+    
+    def __init__(self, name, max_entries=256, ttl=60, path=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or CACHE_PATH
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+    
+    def _connect(self):
+        return connect_cache_file(self._local, self.path, (
+            'CREATE TABLE IF NOT EXISTS cache_entry (namespace TEXT NOT NULL, key TEXT NOT NULL, '
+            'value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+            'PRIMARY KEY (namespace, key))',
+            'CREATE INDEX IF NOT EXISTS ix_cache_entry_lru ON cache_entry (namespace, accessed_at)',
+        ))
+    
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT value, expires_at FROM cache_entry WHERE namespace = ? AND key = ?',
+                           (self.name, key)).fetchone()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+        conn.execute('UPDATE cache_entry SET accessed_at = ? WHERE namespace = ? AND key = ?', (now, self.name, key))
+        self.hits += 1
+        return pickle.loads(row[0])
+    
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO cache_entry (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                     (self.name, key, pickle.dumps(value), now + (ttl or self.ttl), now))
+        # Evict expired entries, then the least recently used ones beyond the bound
+        conn.execute('DELETE FROM cache_entry WHERE namespace = ? AND expires_at < ?', (self.name, now))
+        conn.execute('DELETE FROM cache_entry WHERE namespace = ? AND key IN (SELECT key FROM cache_entry '
+                     'WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                     (self.name, self.name, self.max_entries))
+    
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache_entry WHERE namespace = ? AND key = ?', (self.name, key))
+    
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entry WHERE namespace = ?', (self.name,))
+    
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache_entry WHERE namespace = ?', (self.name,)).fetchone()[0]
+
+CACHE_BACKENDS = {'memory': MemoryCache, 'sqlite': SQLiteCache}
+
+def make_cache(name, max_entries, ttl, backend=None):
+    """Create a named cache on the configured backend"""
+    return CACHE_BACKENDS[backend or CACHE_BACKEND](name, max_entries=max_entries, ttl=ttl)
+
+response_cache = make_cache('response', RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+class MemoryPresence:
+    """Who is online and which order they are viewing, kept in process with heartbeat expiry"""
+    
+    def __init__(self, ttl=None):
+        self.ttl = ttl or PRESENCE_TTL
+        # user id -> {viewed order id (0 for none): expires_at}, order id -> {user id: expires_at}
+        self._views = {}
+        self._viewers = {}
+        self._names = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def touch(self, user_id, username, order_id=0):
+        now = time.monotonic()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._views.setdefault(user_id, {})[order_id] = expires_at
+            self._viewers.setdefault(order_id, {})[user_id] = expires_at
+            self._names[user_id] = username
+            if now - self._swept_at > self.ttl:
+                self._sweep(now)
+    
+    def leave(self, user_id, order_id=None):
+        """Forget one view, or every view of the user when order_id is None"""
+        with self._lock:
+            views = self._views.get(user_id, {})
+            for viewed in ([order_id] if order_id is not None else list(views)):
+                views.pop(viewed, None)
+                self._viewers.get(viewed, {}).pop(user_id, None)
+    
+    def _sweep(self, now):
+        for index in (self._views, self._viewers):
+            for key, entries in list(index.items()):
+                for inner, expires_at in list(entries.items()):
+                    if expires_at < now:
+                        del entries[inner]
+                if not entries:
+                    del index[key]
+        self._names = {user_id: name for user_id, name in self._names.items() if user_id in self._views}
+        self._swept_at = now
+    
+    def online(self, user_ids):
+        now = time.monotonic()
+        with self._lock:
+            return {user_id for user_id in user_ids
+                    if any(expires_at >= now for expires_at in self._views.get(user_id, {}).values())}
+    
+    def viewers(self, order_ids):
+        """{order id: [(user id, username)]} for the orders someone is viewing"""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for order_id in order_ids:
+                users = [(user_id, self._names.get(user_id)) for user_id, expires_at in self._viewers.get(order_id, {}).items()
+                         if expires_at >= now]
+                if users:
+                    result[order_id] = sorted(users)
+        return result
+    
+    def __len__(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for views in self._views.values() if any(expires_at >= now for expires_at in views.values()))
+
+class SQLitePresence:
+    """Presence in the shared cache file, so a heartbeat sent to one worker is seen by all of them"""
+    
+    def __init__(self, ttl=None, path=None):
+        self.ttl = ttl or PRESENCE_TTL
+        self.path = path or CACHE_PATH
+        self._swept_at = 0
+        self._local = threading.local()
+    
+    def _connect(self):
+        return connect_cache_file(self._local, self.path, (
+            'CREATE TABLE IF NOT EXISTS presence (user_id INTEGER NOT NULL, order_id INTEGER NOT NULL, '
+            'username TEXT, expires_at REAL NOT NULL, PRIMARY KEY (user_id, order_id))',
+            'CREATE INDEX IF NOT EXISTS ix_presence_order ON presence (order_id)',
+        ))
+    
+    def touch(self, user_id, username, order_id=0):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO presence (user_id, order_id, username, expires_at) VALUES (?, ?, ?, ?)',
+                     (user_id, order_id, username, now + self.ttl))
+        if now - self._swept_at > self.ttl:
+            conn.execute('DELETE FROM presence WHERE expires_at < ?', (now,))
+            self._swept_at = now
+    
+    def leave(self, user_id, order_id=None):
+        if order_id is None:
+            self._connect().execute('DELETE FROM presence WHERE user_id = ?', (user_id,))
+        else:
+            self._connect().execute('DELETE FROM presence WHERE user_id = ? AND order_id = ?', (user_id, order_id))
+    
+    def online(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        rows = self._connect().execute(
+            f"SELECT DISTINCT user_id FROM presence WHERE expires_at >= ? AND user_id IN ({', '.join('?' * len(user_ids))})",
+            [time.time()] + user_ids)
+        return {row[0] for row in rows}
+    
+    def viewers(self, order_ids):
+        order_ids = list(order_ids)
+        if not order_ids:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT order_id, user_id, username FROM presence WHERE expires_at >= ? AND order_id IN ({', '.join('?' * len(order_ids))}) "
+            'ORDER BY order_id, user_id', [time.time()] + order_ids)
+        result = {}
+        for order_id, user_id, username in rows:
+            result.setdefault(order_id, []).append((user_id, username))
+        return result
+    
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(DISTINCT user_id) FROM presence WHERE expires_at >= ?',
+                                       (time.time(),)).fetchone()[0]
+
+PRESENCE_BACKENDS = {'memory': MemoryPresence, 'sqlite': SQLitePresence}
+
+# Presence is kept outside the main database, so heartbeats stay cheap however often pages send them
+presence = PRESENCE_BACKENDS[PRESENCE_BACKEND]()
+
+class MemoryRateLimiter:
+    """Token buckets kept in process; the least recently used buckets are dropped beyond max_entries"""
+    
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def take(self, key, per_second, burst):
+        """Spend a token; returns 0 when allowed, else the seconds until the next token"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * per_second)
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            self._buckets[key] = (tokens if wait else tokens - 1, now)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+class SQLiteRateLimiter:
+    """Token buckets in the shared cache file, so a client's requests count against one bucket whichever worker serves them"""
+    
+    def __init__(self, path=None):
+        self.path = path or CACHE_PATH
+        self._swept_at = 0
+        self._local = threading.local()
+    
+    def _connect(self):
+        return connect_cache_file(self._local, self.path, (
+            'CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)',
+        ))
+    
+    def take(self, key, per_second, burst):
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE serializes the read-modify-write across workers
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * per_second)
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            conn.execute('INSERT OR REPLACE INTO rate_bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens if wait else tokens - 1, now))
+            # Buckets idle for an hour have refilled; dropping them changes nothing
+            if now - self._swept_at > 3600:
+                conn.execute('DELETE FROM rate_bucket WHERE updated_at < ?', (now - 3600,))
+                self._swept_at = now
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+RATE_LIMIT_BACKENDS = {'memory': MemoryRateLimiter, 'sqlite': SQLiteRateLimiter}
+
+rate_limiter = RATE_LIMIT_BACKENDS[RATE_LIMIT_BACKEND]()
+
+class ConcurrencyPool:
+    """At most `limit` requests at a time through a group of expensive routes in this process"""
+    
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+    
+    def acquire(self, timeout):
+        if not self._semaphore.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+    
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+concurrency_pools = {
+    'export': ConcurrencyPool('export', EXPORT_CONCURRENCY),
+    'reports': ConcurrencyPool('reports', REPORT_CONCURRENCY),
+}
+
+def admission_rejected(reason, status, retry_after, message):
+    """429/503 with Retry-After; JSON for API calls, plain text for pages"""
+    metrics.inc('http_requests_rejected_total', {'endpoint': request.endpoint, 'reason': reason},
+                help_text='Requests turned away by rate limits and concurrency caps')
+    if request.is_json or not request.accept_mimetypes.accept_html:
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = app.response_class(message, mimetype='text/plain')
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def rate_limit(per_minute, burst):
+    """Token bucket per user and route: `burst` requests at once, refilled at `per_minute`"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Anonymous requests are sent to the login page by the view itself
+            if RATE_LIMIT_ENABLED and 'user_id' in session:
+                wait = rate_limiter.take(f"{request.endpoint}:{session['user_id']}", per_minute / 60.0, burst)
+                if wait:
+                    return admission_rejected('rate_limit', 429, wait, f"Too many requests, try again in {math.ceil(wait)}s")
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def concurrency_limit(pool_name):
+    """Queue briefly for a slot in the named pool, then turn the request away with 503"""
+    pool = concurrency_pools[pool_name]
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not pool.acquire(timeout=CONCURRENCY_WAIT_SECONDS):
+                return admission_rejected('concurrency', 503, CONCURRENCY_WAIT_SECONDS,
+                                          'The server is busy with other requests like this one, try again shortly')
+            try:
+                return view(*args, **kwargs)
+            finally:
+                pool.release()
+        return wrapper
+    return decorator
+
+def admin_required(view):
+    """Check the stored user, not the session, is an active admin; wrap cached pages so hits are checked too"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        
+        user = User.query.get(session['user_id'])
+        if not user or user.role != 'admin' or not user.is_active:
+            flash('Access denied. Admin privileges required.', 'error')
+            return redirect(url_for('dashboard'))
+        return view(*args, **kwargs)
+    return wrapper
+
+def cached_response(view=None, *, depends_on=()):
+    """Cache a rendered page per route, role and query arguments; `depends_on` callables add to the key what else the page shows"""
+    if view is None:
+        return lambda view: cached_response(view, depends_on=depends_on)
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pages render pending flash messages, so those requests bypass the cache
+        if 'user_id' not in session or '_flashes' in session:
+            return view(*args, **kwargs)
+        
+        query = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+        stamps = [stamp() for stamp in depends_on]
+        key = f"{request.endpoint}|{session.get('role')}|{sorted(kwargs.items())}|{query}|{stamps}"
+        cached = response_cache.get(key)
+        if cached is not None:
+            body, mimetype = cached
+            return app.response_class(body, mimetype=mimetype)
+        
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough and '_flashes' not in session:
+            response_cache.set(key, (response.get_data(), response.mimetype))
+        return response
+    return wrapper
+
+def invalidate_order_caches():
+    """Drop cached pages derived from orders; called after every order mutation"""
+    response_cache.clear()
+
+# Reference data (user and agent lists) shared by every request in the process
+UserRef = namedtuple('UserRef', 'id username email role is_active created_at')
+
+def bump_reference_version(name):
+    """Mark reference data as changed (call before committing the change)"""
+    updated = ReferenceDataVersion.query.filter_by(name=name).update(
+        {ReferenceDataVersion.version: ReferenceDataVersion.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(ReferenceDataVersion(name=name, version=1))
+
+class ReferenceDataCache:
+    """In-memory snapshot of a reference table, reloaded only when its shared version changes"""
+    
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._rows = []
+        self._lock = threading.Lock()
+    
+    def current_version(self):
+        # One primary-key lookup per request, however many times the data is used
+        versions = g.setdefault('reference_versions', {})
+        if self.name not in versions:
+            row = db.session.get(ReferenceDataVersion, self.name)
+            versions[self.name] = row.version if row else 0
+        return versions[self.name]
+    
+    def get(self):
+        version = self.current_version()
+        with self._lock:
+            if version != self._version:
+                self._rows = self.loader()
+                self._version = version
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self._rows
+
+def load_user_refs():
+    return [UserRef(u.id, u.username, u.email, u.role, u.is_active, u.created_at)
+            for u in User.query.order_by(User.id).all()]
+
+user_reference_data = ReferenceDataCache('users', load_user_refs)
+
+def all_users():
+    """Every user, served from the reference-data cache"""
+    return user_reference_data.get()
+
+def all_agents():
+    """Users with the agent role, served from the reference-data cache"""
+    return [u for u in user_reference_data.get() if u.role == 'agent']
+
+# Catalog tables (customers, yarn types): orders keep the display name and a key to a deduplicated row
+def normalize_name(name):
+    """Catalog key: case, punctuation and repeated whitespace are ignored"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name or '').casefold().split())
+
+def resolve_catalog(model, names, reference, attributes=None):
+    """Map raw names to rows of a catalog table, creating the missing ones (no commit)"""
+    keys = {name: normalize_name(name) for name in names}
+    found = {row.normalized_name: row for row in model.query.filter(model.normalized_name.in_(set(keys.values())))}
+    
+    # The first spelling seen for a key becomes the display name
+    created = []
+    for name, key in keys.items():
+        if key not in found:
+            found[key] = model(name=' '.join(name.split()), normalized_name=key, **(attributes(key) if attributes else {}))
+            created.append(found[key])
+    if created:
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(created)
+        except sa_exc.IntegrityError:
+            # Another worker created some of them first
+            found = {row.normalized_name: row for row in model.query.filter(model.normalized_name.in_(set(keys.values())))}
+        bump_reference_version(reference)
+    return {name: found[key] for name, key in keys.items()}
+
+def link_orders_to_catalog(name_attr, id_attr, resolve, batch_size=None):
+    """Point orders with no catalog key at rows for their name, rewriting the name to the catalog spelling"""
+    batch_size = batch_size or BULK_BATCH_SIZE
+    name_column, id_column = getattr(Order, name_attr), getattr(Order, id_attr)
+    
+    # Most common spelling first, so it becomes the display name
+    names = [row[0] for row in db.session.query(name_column).filter(id_column.is_(None))
+             .group_by(name_column).order_by(db.func.count().desc(), name_column)]
+    row_for = {}
+    for start in range(0, len(names), batch_size):
+        row_for.update({name: (row.id, row.name) for name, row in resolve(names[start:start + batch_size]).items()})
+        db.session.commit()
+    
+    order_table = Order.__table__
+    link = (db.update(order_table).where(order_table.c.id == db.bindparam('order_pk'))
+            .values({id_attr: db.bindparam('catalog_id'), name_attr: db.bindparam('canonical'), 'version': order_table.c.version + 1}))
+    linked = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Order.id, name_column).filter(id_column.is_(None), Order.id > last_id) \
+            .order_by(Order.id).limit(batch_size).all()
+        if not rows:
+            break
+        missing = [name for name in {row[1] for row in rows} if name not in row_for]
+        if missing:
+            row_for.update({name: (row.id, row.name) for name, row in resolve(missing).items()})
+        db.session.execute(link, [{'order_pk': row[0], 'catalog_id': row_for[row[1]][0], 'canonical': row_for[row[1]][1]}
+                                  for row in rows])
+        log_order_changes([row[0] for row in rows])
+        db.session.commit()
+        linked += len(rows)
+        last_id = rows[-1][0]
+    
+    if linked:
+        invalidate_order_caches()
+    return linked
+
+# Customers are looked up through an in-memory prefix index
+def resolve_customers(names):
+    """Map raw customer names to Customer rows, creating the missing ones (no commit)"""
+    return resolve_catalog(Customer, names, 'customers')
+
+class CustomerPrefixIndex:
+    """Sorted keys for every word suffix of every customer name, searched with bisect"""
+    
+    def __init__(self, customers):
+        self.names = {}
+        entries = []
+        for customer_id, name, normalized_name in customers:
+            self.names[customer_id] = name
+            words = normalized_name.split()
+            # "acme yarn ltd" is found by "acme", "yarn l" and "ltd"
+            entries.extend((' '.join(words[i:]), customer_id) for i in range(len(words)))
+        entries.sort()
+        self.keys = [key for key, customer_id in entries]
+        self.ids = [customer_id for key, customer_id in entries]
+    
+    def search(self, prefix, limit=None):
+        """Ids of customers with a word starting with prefix, in key order"""
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        matches = []
+        seen = set()
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix) or (limit and len(matches) >= limit):
+                break
+            if self.ids[i] not in seen:
+                seen.add(self.ids[i])
+                matches.append(self.ids[i])
+        return matches
+
+def load_customer_index():
+    return CustomerPrefixIndex(db.session.query(Customer.id, Customer.name, Customer.normalized_name))
+
+customer_reference_data = ReferenceDataCache('customers', load_customer_index)
+
+def customer_index():
+    """Prefix index over all customers, rebuilt when a customer is added"""
+    return customer_reference_data.get()
+
+def link_order_customers(batch_size=None):
+    """Deduplicate customer names on unlinked orders; returns (orders linked, customers created)"""
+    customers_before = Customer.query.count()
+    linked = link_orders_to_catalog('customer_name', 'customer_id', resolve_customers, batch_size)
+    return linked, Customer.query.count() - customers_before
+
+# Yarn types: display colors are worked out once per catalog entry instead of once per rendered card
+YARN_FAMILIES = [
+    ('cotton', '#ff6b6b', '#4ecdc4'),
+    ('wool', '#a8e6cf', '#ffd93d'),
+    ('silk', '#ff9a9e', '#fecfef'),
+    # The cards have always drawn these three in the default colors
+    ('polyester', '#667eea', '#764ba2'),
+    ('acrylic', '#667eea', '#764ba2'),
+    ('blend', '#667eea', '#764ba2'),
+]
+DEFAULT_YARN_COLORS = ('#667eea', '#764ba2')
+# Offered by the yarn type picker before any order has used them
+DEFAULT_YARN_TYPES = ['Cotton', 'Wool', 'Silk', 'Polyester', 'Acrylic', 'Blend']
+YarnTypeRef = namedtuple('YarnTypeRef', 'id name family gradient')
+UNKNOWN_YARN_TYPE = YarnTypeRef(None, 'Other', 'other', ', '.join(DEFAULT_YARN_COLORS))
+
+def yarn_display_attributes(normalized_name):
+    for family, color_start, color_end in YARN_FAMILIES:
+        if family in normalized_name:
+            return {'family': family, 'color_start': color_start, 'color_end': color_end}
+    return {'family': 'other', 'color_start': DEFAULT_YARN_COLORS[0], 'color_end': DEFAULT_YARN_COLORS[1]}
+
+def resolve_yarn_types(names):
+    """Map raw yarn type names to YarnType rows, creating the missing ones (no commit)"""
+    return resolve_catalog(YarnType, names, 'yarn_types', yarn_display_attributes)
+
+def load_yarn_types():
+    return {row.id: YarnTypeRef(row.id, row.name, row.family, f"{row.color_start}, {row.color_end}")
+            for row in YarnType.query.order_by(YarnType.name)}
+
+yarn_type_reference_data = ReferenceDataCache('yarn_types', load_yarn_types)
+
+def yarn_catalog():
+    """{yarn_type_id: YarnTypeRef}, served from the reference-data cache"""
+    return yarn_type_reference_data.get()
+
+@app.template_global()
+def yarn_type_info(yarn_type_id):
+    """Catalog entry (name, family, gradient) for a card or preview"""
+    return yarn_catalog().get(yarn_type_id, UNKNOWN_YARN_TYPE)
+
+def seed_yarn_types():
+    """Add the missing default yarn types and bring stored colors in line with YARN_FAMILIES"""
+    resolve_yarn_types(DEFAULT_YARN_TYPES)
+    recolored = False
+    for row in YarnType.query:
+        for name, value in yarn_display_attributes(row.normalized_name).items():
+            if getattr(row, name) != value:
+                setattr(row, name, value)
+                recolored = True
+    if recolored:
+        bump_reference_version('yarn_types')
+    db.session.commit()
+
+def link_order_yarn_types(batch_size=None):
+    """Dictionary-encode yarn types on unlinked orders; returns (orders linked, yarn types created)"""
+    types_before = YarnType.query.count()
+    linked = link_orders_to_catalog('yarn_type', 'yarn_type_id', resolve_yarn_types, batch_size)
+    return linked, YarnType.query.count() - types_before
+
+# Conditional GETs, compression and fingerprinted static assets
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                          'application/javascript', 'text/javascript', 'image/svg+xml'}
+ASSET_MANIFEST_PATH = os.path.join(app.static_folder, 'dist', 'manifest.json')
+_asset_manifest = None
+compressed_static_cache = MemoryCache('compressed_static', max_entries=128, ttl=24 * 3600)
+
+def asset_manifest():
+    """Map of static filenames to fingerprinted copies written by `flask build-assets`"""
+    global _asset_manifest
+    if _asset_manifest is None:
+        try:
+            with open(ASSET_MANIFEST_PATH) as manifest_file:
+                _asset_manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            _asset_manifest = {}
+    return _asset_manifest
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    """Make url_for('static', ...) point at the fingerprinted copy when one was built"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = asset_manifest().get(values['filename'], values['filename'])
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+@app.after_request
+def optimize_response(response):
+    """ETag revalidation for pages/JSON, long-lived caching for fingerprinted assets, and compression"""
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    
+    is_static = request.endpoint == 'static'
+    if is_static:
+        if request.view_args.get('filename', '').startswith('dist/'):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    elif response.mimetype in ('text/html', 'application/json') and not response.direct_passthrough:
+        # Browsers revalidate with If-None-Match and get an empty 304 when nothing changed
+        etag = hashlib.md5(response.get_data()).hexdigest()
+        response.headers.setdefault('Cache-Control', 'private, no-cache')
+        if any(request.if_none_match.contains(candidate) for candidate in (etag, f"{etag}-gzip", f"{etag}-br")):
+            response.status_code = 304
+            response.set_data(b'')
+            response.set_etag(etag)
+            return response
+        response.set_etag(etag)
+    
+    encoding = negotiate_encoding()
+    if encoding is None or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if is_static:
+        # Static files are compressed once per version and then served from memory
+        cache_key = f"{request.path}|{response.get_etag()[0]}|{encoding}"
+        body = compressed_static_cache.get(cache_key)
+        if body is None:
+            response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_SIZE:
+                return response
+            body = compress_body(data, encoding)
+            compressed_static_cache.set(cache_key, body)
+        else:
+            # Release the file handle send_file opened; the cached body replaces it
+            if hasattr(response.response, 'close'):
+                response.response.close()
+            response.direct_passthrough = False
+    elif response.direct_passthrough or response.is_streamed:
+        return response
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        body = compress_body(data, encoding)
+    
+    etag, weak = response.get_etag()
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Static files keep their tag (weak, so it still matches send_file's revalidation)
+        if is_static:
+            response.set_etag(etag, weak=True)
+        else:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Copy CSS/JS to content-hashed filenames under static/dist and write the manifest."""
+    dist_dir = os.path.join(app.static_folder, 'dist')
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for folder in ('css', 'js'):
+        source_dir = os.path.join(app.static_folder, folder)
+        for filename in sorted(os.listdir(source_dir)):
+            with open(os.path.join(source_dir, filename), 'rb') as source_file:
+                content = source_file.read()
+            stem, ext = os.path.splitext(filename)
+            fingerprinted = f"{stem}.{hashlib.md5(content).hexdigest()[:12]}{ext}"
+            os.makedirs(os.path.join(dist_dir, folder), exist_ok=True)
+            with open(os.path.join(dist_dir, folder, fingerprinted), 'wb') as target_file:
+                target_file.write(content)
+            manifest[f"{folder}/{filename}"] = f"dist/{folder}/{fingerprinted}"
+    with open(ASSET_MANIFEST_PATH, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    click.echo(f"Fingerprinted {len(manifest)} assets into {dist_dir}")
+
+# Template fragment caching
+fragment_cache = MemoryCache('fragment', max_entries=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL)
+
+@app.template_global()
+def cache_fragment(name, *key_parts, caller):
+    """Render a {% call %} block once per key and reuse the markup until the key changes"""
+    if not FRAGMENT_CACHE_SIZE:
+        return caller()
+    key = '|'.join([name] + [str(part) for part in key_parts])
+    html = fragment_cache.get(key)
+    if html is None:
+        html = caller()
+        fragment_cache.set(key, html)
+    return html
+
+@app.template_global()
+def reference_version(name):
+    """Current version of a reference table; part of fragment keys that show user names"""
+    return user_reference_data.current_version() if name == 'users' else 0
+
+# Request metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-endpoint latency, SQL statement count and SQL time"""
+    if 'request_start' not in g:
+        return response
+    labels = {'endpoint': request.endpoint or 'unmatched', 'method': request.method}
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_start, labels,
+                    help_text='Request latency by endpoint')
+    metrics.observe('http_request_sql_statements', g.sql_count, labels, buckets=COUNT_BUCKETS,
+                    help_text='SQL statements issued per request')
+    metrics.observe('http_request_sql_seconds', g.sql_time, labels,
+                    help_text='Time spent in SQL per request')
+    metrics.inc('http_requests_total', dict(labels, status=response.status_code), help_text='Requests by endpoint and status')
+    
+    budget = QUERY_BUDGETS.get(request.endpoint)
+    if budget is not None and g.sql_count > budget:
+        metrics.inc('http_query_budget_exceeded_total', {'endpoint': request.endpoint}, help_text='Requests that issued more SQL than their budget')
+        app.logger.warning("%s issued %d SQL statements (budget %d)", request.endpoint, g.sql_count, budget)
+    return response
+
+def metered_caches():
+    return [response_cache, fragment_cache, compressed_static_cache, user_reference_data]
+
+@metrics.counter
+def cache_counters():
+    samples = []
+    for cache in metered_caches():
+        samples.append(('cache_hits_total', {'cache': cache.name}, cache.hits))
+        samples.append(('cache_misses_total', {'cache': cache.name}, cache.misses))
+    return samples
+
+@metrics.gauge
+def cache_gauges():
+    samples = []
+    for cache in metered_caches():
+        total = cache.hits + cache.misses
+        samples.append(('cache_hit_ratio', {'cache': cache.name}, round(cache.hits / total, 4) if total else 0))
+    return samples
+
+@metrics.gauge
+def queue_gauges():
+    # Work waiting in background queues (the file cleaner is the only outbox today)
+    return [('background_queue_depth', {'queue': 'file_cleanup'}, file_cleanup_queue.qsize())]
+
+@metrics.gauge
+def presence_gauges():
+    return [('presence_online_users', {}, len(presence))]
+
+@metrics.gauge
+def admission_gauges():
+    return [('admission_in_flight', {'pool': pool.name}, pool.in_flight) for pool in concurrency_pools.values()]
+
+@metrics.gauge
+def pool_gauges():
+    samples = []
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if isinstance(engine.pool, QueuePool):
+                labels = {'bind': bind_key or 'default'}
+                samples.append(('db_pool_checked_out', labels, engine.pool.checkedout()))
+                samples.append(('db_pool_size', labels, engine.pool.size()))
+                samples.append(('db_pool_overflow', labels, engine.pool.overflow()))
+    return samples
+
+@app.route('/metrics')
+@query_budget(0)
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            return "Unauthorized", 401
+    elif session.get('role') != 'admin':
+        return "Admin only", 403
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Request profiling
+def profiling_requested():
+    if request.headers.get('X-Profile') and session.get('role') == 'admin':
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start_profiler():
+    if PROFILER == 'pyinstrument':
+        try:
+            # Imported lazily so the optional dependency costs nothing unless used
+            from pyinstrument import Profiler
+        except ImportError:
+            pass
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def save_profile(profiler, duration):
+    """Write a finished profile into the on-disk ring and return its file name"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = re.sub(r'[^A-Za-z0-9_]', '_', request.endpoint or 'unmatched')
+    base = f"{int(time.time() * 1000)}-{os.getpid()}-{endpoint}-{int(duration * 1000)}ms"
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        name = base + '.prof'
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    else:
+        profiler.stop()
+        name = base + '.html'
+        with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+            f.write(profiler.output_html())
+    
+    # Keep only the newest PROFILE_RING_SIZE profiles
+    for old in list_profiles()[PROFILE_RING_SIZE:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old['name']))
+        except OSError:
+            pass
+    return name
+
+def list_profiles():
+    """Profiles in the ring, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        stem, ext = os.path.splitext(name)
+        parts = stem.split('-')
+        if ext not in ('.prof', '.html') or len(parts) < 4 or not parts[0].isdigit():
+            continue
+        profiles.append({
+            'name': name,
+            'created_at': datetime.utcfromtimestamp(int(parts[0]) / 1000),
+            'endpoint': '-'.join(parts[2:-1]),
+            'duration_ms': int(parts[-1].rstrip('ms') or 0),
+        })
+    return sorted(profiles, key=lambda profile: profile['name'], reverse=True)
+
+@app.before_request
+def begin_profiling():
+    if request.endpoint in ('static', 'metrics_endpoint', 'view_profile') or not profiling_requested():
+        return
+    g.profiler = start_profiler()
+    g.profile_start = time.perf_counter()
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        try:
+            response.headers['X-Profile-Id'] = save_profile(profiler, time.perf_counter() - g.profile_start)
+        except OSError as e:
+            app.logger.warning("Could not save profile: %s", e)
+    return response
+
+@app.route('/admin/profiles/<name>')
+@query_budget(0)
+def view_profile(name):
+    """Show a saved profile (cProfile stats as text, pyinstrument as HTML)"""
+    if session.get('role') != 'admin':
+        return "Admin only", 403
+    if name not in {profile['name'] for profile in list_profiles()}:
+        return "Profile not found", 404
+    path = os.path.join(PROFILE_DIR, name)
+    if name.endswith('.html'):
+        with open(path) as f:
+            return f.read()
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats('cumulative').print_stats(60)
+    return app.response_class(out.getvalue(), mimetype='text/plain')
+
 # Routes
 @app.route('/')
+@query_budget(0)
 def index():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     return redirect(url_for('dashboard'))
 
 @app.route('/health')
+@query_budget(0)
 def health_check():
     """Simple health check endpoint for debugging"""
     return jsonify({
@@ -182,6 +2275,7 @@ def health_check():
     })
 
 @app.route('/login', methods=['GET', 'POST'])
+@query_budget(2)
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -201,6 +2295,7 @@ def login():
     return render_template('futuristic-login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
+@query_budget(5)
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -226,6 +2321,7 @@ def register():
         )
         
         db.session.add(user)
+        bump_reference_version('users')
         db.session.commit()
         
         flash('Registration successful! Please login.', 'success')
@@ -233,18 +2329,12 @@ def register():
     
     return render_template('futuristic-register.html')
 
-@app.route('/dashboard')
-def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    
-    # Get search and filter parameters
-    search_query = request.args.get('search', '')
-    status_filter = request.args.get('status', '')
-    agent_filter = request.args.get('agent', '')
-    order_type_filter = request.args.get('order_type', '')
+def dashboard_orders(user, args):
+    """Orders the user may see on the board, narrowed by the dashboard's search and filter arguments"""
+    search_query = args.get('search', '')
+    status_filter = args.get('status', '')
+    agent_filter = args.get('agent', '')
+    order_type_filter = args.get('order_type', '')
     
     # Get orders based on user role
     if user.role == 'admin':
@@ -274,10 +2364,13 @@ def dashboard():
     
     # Apply search filter
     if search_query:
+        search_key = normalize_name(search_query)
+        yarn_type_ids = [yarn.id for yarn in yarn_catalog().values() if search_key and search_key in normalize_name(yarn.name)]
         orders_query = orders_query.filter(
             (Order.order_id.contains(search_query)) |
+            # The name copied onto the order, so the search stays one bounded predicate rather than an id list
             (Order.customer_name.contains(search_query)) |
-            (Order.yarn_type.contains(search_query))
+            (Order.yarn_type_id.in_(yarn_type_ids))
         )
     
     # Apply status filter
@@ -292,7 +2385,32 @@ def dashboard():
     if order_type_filter:
         orders_query = orders_query.filter_by(order_type=order_type_filter)
     
-    orders = orders_query.order_by(Order.created_at.desc()).all()
+    return orders_query
+
+def latest_change_id():
+    return db.session.query(db.func.max(OrderChange.id)).scalar() or 0
+
+@app.route('/dashboard')
+@query_budget(9)
+def dashboard():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    user = User.query.get(session['user_id'])
+    presence.touch(user.id, user.username)
+    
+    # Get search and filter parameters
+    search_query = request.args.get('search', '')
+    status_filter = request.args.get('status', '')
+    agent_filter = request.args.get('agent', '')
+    order_type_filter = request.args.get('order_type', '')
+    
+    # Read the feed cursor before the orders, so a change made in between is replayed rather than missed
+    changes_cursor = latest_change_id()
+    orders_query = dashboard_orders(user, request.args)
+    
+    # Cards show the primary agent, so load those users in one query
+    orders = orders_query.options(db.selectinload(Order.agent)).order_by(Order.created_at.desc()).all()
     
     # Organize orders by status
     orders_by_status = {}
@@ -300,7 +2418,7 @@ def dashboard():
         orders_by_status[status] = [order for order in orders if order.status == status]
     
     # Get agents for admin to assign orders
-    agents = User.query.filter_by(role='agent').all() if user.role == 'admin' else []
+    agents = all_agents() if user.role == 'admin' else []
     
     # For agents, get their assigned order IDs for template use
     agent_assigned_order_ids = []
@@ -314,10 +2432,10 @@ def dashboard():
     total_value = sum(order.amount_usd for order in all_orders)
     completion_rate = (len(orders_by_status.get('Archived', [])) / total_orders * 100) if total_orders > 0 else 0
     
-    # Calculate yarn type distribution
-    yarn_types = {}
-    for order in all_orders:
-        yarn_types[order.yarn_type] = yarn_types.get(order.yarn_type, 0) + 1
+    # Yarn type distribution: counted per small-int key in the database, named from the catalog
+    yarn_type_counts = orders_query.with_entities(Order.yarn_type_id, db.func.count()).group_by(Order.yarn_type_id) \
+        .order_by(db.func.count().desc()).all()
+    yarn_types = [(yarn_type_info(yarn_type_id), count) for yarn_type_id, count in yarn_type_counts]
     
     return render_template('futuristic-dashboard.html', 
                          orders_by_status=orders_by_status, 
@@ -333,9 +2451,11 @@ def dashboard():
                          active_orders=active_orders,
                          total_value=total_value,
                          completion_rate=completion_rate,
-                         yarn_types=yarn_types)
+                         yarn_types=yarn_types,
+                         changes_cursor=changes_cursor)
 
 @app.route('/create_order', methods=['POST'])
+@query_budget(28)
 def create_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -348,26 +2468,37 @@ def create_order():
         return redirect(url_for('dashboard'))
     
     try:
-        # Get agent IDs from form
-        agent_ids = request.form.getlist('agent_ids')
+        # Get agent IDs from form (only admins assign by hand)
+        agent_ids = request.form.getlist('agent_ids') if user.role == 'admin' else []
+        if not agent_ids and (AUTO_ASSIGN_ORDERS or (user.role == 'admin' and request.form.get('auto_assign'))):
+            agent_id = least_loaded_agent()
+            agent_ids = [agent_id] if agent_id else []
+        customer = resolve_customers([request.form['customer_name']])[request.form['customer_name']]
+        yarn = resolve_yarn_types([request.form['yarn_type']])[request.form['yarn_type']]
         
         order = Order(
             order_id=generate_order_id(),
-            customer_name=request.form['customer_name'],
-            yarn_type=request.form['yarn_type'],
+            customer=customer,
+            customer_name=customer.name,
+            yarn_type_id=yarn.id,
+            yarn_type=yarn.name,
             quantity_kg=float(request.form['quantity_kg']),
             startup_date=datetime.strptime(request.form['startup_date'], '%Y-%m-%d').date(),
             order_type=request.form['order_type'],
             amount_usd=float(request.form['amount_usd']),
             created_by=user.id,
-            assigned_agent=int(agent_ids[0]) if agent_ids and user.role == 'admin' else None
+            assigned_agent=int(agent_ids[0]) if agent_ids else None,
+            status_changed_at=datetime.utcnow()
         )
         
         db.session.add(order)
         db.session.flush()  # Get the order ID
+        record_status_transitions([status_transition(order, None, order.status, user.id, order.status_changed_at)])
+        bump_order_rollups(added=[rollup_entry(order)])
+        log_order_changes([order.id])
         
-        # Add multiple agent assignments if admin
-        if user.role == 'admin' and agent_ids:
+        # Add multiple agent assignments
+        if agent_ids:
             for agent_id in agent_ids:
                 agent_id = int(agent_id)
                 agent = User.query.get(agent_id)
@@ -376,6 +2507,7 @@ def create_order():
                     db.session.add(order_agent)
         
         db.session.commit()
+        invalidate_order_caches()
         
         # Log audit
         agent_names = [User.query.get(int(aid)).username for aid in agent_ids] if agent_ids else []
@@ -399,6 +2531,7 @@ def create_order():
     return redirect(url_for('dashboard'))
 
 @app.route('/move_order', methods=['POST'])
+@query_budget(26)
 def move_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -409,7 +2542,8 @@ def move_order():
     try:
         data = request.json or {}
         order_id = data.get('order_id')
-        new_status = data.get('status')
+        new_status = data.get('status') or data.get('new_status')
+        expected_version = data.get('version')
         
         if not order_id or not new_status:
             return jsonify({'success': False, 'message': 'Missing order_id or status'})
@@ -417,6 +2551,12 @@ def move_order():
     except Exception as e:
         return jsonify({'success': False, 'message': 'Invalid request data'})
     
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Invalid version'}), 400
+    
     order = Order.query.get(order_id)
     if not order:
         return jsonify({'success': False, 'message': 'Order not found'})
@@ -427,21 +2567,138 @@ def move_order():
     elif user.role == 'agent':
         return jsonify({'success': False, 'message': 'Agents cannot move orders between lists'})
     
+    # Reject moves based on a stale copy of the card
+    if expected_version is not None and expected_version != order.version:
+        return jsonify({'success': False, 'conflict': True,
+                        'message': 'Order was changed by someone else',
+                        'cards': [order_card(order, user)]})
+    
     # Check if move is allowed
     if not can_move_order(user.role, order.status, new_status):
-        return jsonify({'success': False, 'message': 'Invalid status transition'})
+        return jsonify({'success': False, 'message': 'Invalid status transition',
+                        'cards': [order_card(order, user)]})
+    
+    old_status = order.status
+    before = rollup_entry(order)
+    change_order_status(order, new_status, user.id)
+    bump_order_rollups([before], [rollup_entry(order)])
+    log_order_changes([order.id])
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        order = Order.query.get(order_id)
+        return jsonify({'success': False, 'conflict': True,
+                        'message': 'Order was changed by someone else',
+                        'cards': [order_card(order, user)] if order else []})
+    
+    invalidate_order_caches()
+    
+    # Log audit
+    log_audit(user.id, 'order_moved', 'order', order.id, 
+             f"Moved order {order.order_id} from {old_status} to {new_status}")
+    
+    return jsonify({'success': True, 'cards': [order_card(order, user)]})
+
+@app.route('/move_orders', methods=['POST'])
+@query_budget(19)
+def move_orders():
+    """Move many orders in one transaction, checking each card's version"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    user = User.query.get(session['user_id'])
+    
+    # Check permissions (same rules as move_order)
+    if user.role == 'user':
+        return jsonify({'success': False, 'message': 'Permission denied'})
+    elif user.role == 'agent':
+        return jsonify({'success': False, 'message': 'Agents cannot move orders between lists'})
+    
+    # Expected payload: {"moves": [{"order_id": 1, "status": "Booked", "version": 3}, ...]}
+    try:
+        moves = {}
+        for move in (request.json or {}).get('moves', []):
+            new_status = move.get('status') or move.get('new_status')
+            if not new_status:
+                return jsonify({'success': False, 'message': 'Missing order_id or status'})
+            version = move.get('version')
+            moves[int(move['order_id'])] = (new_status, int(version) if version is not None else None)
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Invalid request data'})
+    
+    if not moves:
+        return jsonify({'success': False, 'message': 'No moves provided'})
+    
+    orders = {order.id: order for order in Order.query.filter(Order.id.in_(moves.keys())).all()}
     
-    old_status = order.status
-    order.status = new_status
+    moved_ids = []
+    conflicts = []
+    errors = []
+    transitions = []
+    removed, added = [], []
+    now = datetime.utcnow()
+    
+    for order_pk, (new_status, expected_version) in moves.items():
+        order = orders.get(order_pk)
+        if not order:
+            errors.append({'order_id': order_pk, 'message': 'Order not found'})
+            continue
+        
+        if expected_version is not None and expected_version != order.version:
+            conflicts.append(order_pk)
+            continue
+        
+        if not can_move_order(user.role, order.status, new_status):
+            errors.append({'order_id': order_pk, 'message': 'Invalid status transition'})
+            continue
+        
+        # Compare-and-swap on the version so a concurrent writer is detected per order
+        values = {'status': new_status, 'version': Order.version + 1, 'updated_at': now}
+        if new_status != order.status:
+            values['status_changed_at'] = now
+        result = db.session.execute(
+            db.update(Order)
+            .where(Order.id == order_pk, Order.version == order.version)
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            conflicts.append(order_pk)
+            continue
+        
+        if new_status != order.status:
+            transitions.append(status_transition(order, order.status, new_status, user.id, now))
+            removed.append(rollup_entry(order))
+            added.append(rollup_entry(order, new_status))
+        db.session.add(AuditLog(user_id=user.id, action='order_moved', entity_type='order', entity_id=order_pk,
+                                details=f"Moved order {order.order_id} from {order.status} to {new_status}"))
+        moved_ids.append(order_pk)
+    
+    record_status_transitions(transitions)
+    bump_order_rollups(removed, added)
+    log_order_changes(moved_ids)
     db.session.commit()
+    if moved_ids:
+        invalidate_order_caches()
     
-    # Log audit
-    log_audit(user.id, 'order_moved', 'order', order.id, 
-             f"Moved order {order.order_id} from {old_status} to {new_status}")
+    # Return fresh cards for moved and conflicting orders so the client can patch its board
+    changed_ids = moved_ids + conflicts
+    cards = []
+    if changed_ids:
+        changed = Order.query.filter(Order.id.in_(changed_ids)).all()
+        cards = [order_card(order, user) for order in changed]
     
-    return jsonify({'success': True})
+    return jsonify({
+        'success': not conflicts and not errors,
+        'moved': moved_ids,
+        'conflicts': conflicts,
+        'errors': errors,
+        'cards': cards
+    })
 
 @app.route('/assign_order', methods=['POST'])
+@query_budget(19)
 def assign_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -457,6 +2714,12 @@ def assign_order():
     if not order:
         return jsonify({'success': False, 'message': 'Order not found'})
     
+    if request.json.get('auto'):
+        agent_id = least_loaded_agent()
+        if not agent_id:
+            return jsonify({'success': False, 'message': 'No active agents to assign'})
+        agent_ids = [agent_id]
+    
     # Validate agents
     agents = []
     for agent_id in agent_ids:
@@ -466,10 +2729,13 @@ def assign_order():
         agents.append(agent)
     
     # Set primary agent (first one)
+    before = rollup_entry(order)
     if agents:
         order.assigned_agent = agents[0].id
     else:
         order.assigned_agent = None
+    bump_order_rollups([before], [rollup_entry(order)])
+    log_order_changes([order.id])
     
     # Clear existing assignments and add new ones
     OrderAgent.query.filter_by(order_id=order_id).delete()
@@ -479,6 +2745,7 @@ def assign_order():
         db.session.add(order_agent)
     
     db.session.commit()
+    invalidate_order_caches()
     
     # Log audit
     agent_names = [agent.username for agent in agents]
@@ -494,6 +2761,7 @@ def assign_order():
     return jsonify({'success': True})
 
 @app.route('/assign_multiple_agents', methods=['POST'])
+@query_budget(16)
 def assign_multiple_agents():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -518,10 +2786,13 @@ def assign_multiple_agents():
         agents.append(agent)
     
     # Set primary agent (first one)
+    before = rollup_entry(order)
     if agents:
         order.assigned_agent = agents[0].id
     else:
         order.assigned_agent = None
+    bump_order_rollups([before], [rollup_entry(order)])
+    log_order_changes([order.id])
     
     # Clear existing assignments and add new ones
     OrderAgent.query.filter_by(order_id=order_id).delete()
@@ -531,6 +2802,7 @@ def assign_multiple_agents():
         db.session.add(order_agent)
     
     db.session.commit()
+    invalidate_order_caches()
     
     # Log audit
     agent_names = [agent.username for agent in agents]
@@ -546,12 +2818,13 @@ def assign_multiple_agents():
     return jsonify({'success': True})
 
 @app.route('/chat/<int:order_id>')
+@query_budget(8)
 def chat(order_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
-    order = Order.query.get(order_id)
+    order = Order.query.options(db.joinedload(Order.agent)).get(order_id)
     
     if not order:
         flash('Order not found', 'error')
@@ -575,10 +2848,13 @@ def chat(order_id):
     
     # Get chat messages based on privacy rules
     print(f"DEBUG: User role: {user.role}, Order ID: {order_id}")
+    # Senders and tags are shown for every message, so load them up front
+    message_options = (db.selectinload(ChatMessage.sender),
+                       db.selectinload(ChatMessage.tagged_agents).selectinload(ChatTag.agent))
     
     if user.role == 'admin':
         # Admin sees all messages for this order
-        messages = ChatMessage.query.filter_by(order_id=order_id).order_by(ChatMessage.created_at).all()
+        messages = ChatMessage.query.filter_by(order_id=order_id).options(*message_options).order_by(ChatMessage.created_at).all()
         print(f"DEBUG: Admin found {len(messages)} messages for order {order_id}")
         for msg in messages:
             print(f"DEBUG: Message from {msg.sender.username}: {msg.message[:50]}...")
@@ -600,7 +2876,7 @@ def chat(order_id):
                     ChatMessage.sender.has(User.role == 'admin')  # Only admin messages visible to all agents
                 )
             )
-        ).order_by(ChatMessage.created_at).all()
+        ).options(*message_options).order_by(ChatMessage.created_at).all()
         print(f"DEBUG: Agent {user.username} found {len(messages)} messages for order {order_id}")
         for msg in messages:
             tags = [tag.agent.username for tag in msg.tagged_agents] if msg.tagged_agents else []
@@ -610,12 +2886,12 @@ def chat(order_id):
         messages = ChatMessage.query.filter(
             ChatMessage.order_id == order_id,
             ChatMessage.sender_id == user.id
-        ).order_by(ChatMessage.created_at).all()
+        ).options(*message_options).order_by(ChatMessage.created_at).all()
     
     # Get available agents for admin to tag
     available_agents = []
     if user.role == 'admin':
-        assigned_agents = OrderAgent.query.filter_by(order_id=order_id).all()
+        assigned_agents = OrderAgent.query.filter_by(order_id=order_id).options(db.joinedload(OrderAgent.agent)).all()
         available_agents = [oa.agent for oa in assigned_agents]
         if order.assigned_agent and order.agent not in available_agents:
             available_agents.append(order.agent)
@@ -638,14 +2914,17 @@ def chat(order_id):
     seen = set()
     participants = [p for p in participants if not (p.id in seen or seen.add(p.id))]
     
-    # Simulate online users (in a real app, this would come from a session store)
-    online_users = [p.id for p in participants if p.is_active]  # Assume active users are online
+    # Opening the page counts as a heartbeat; the page keeps beating while it stays open
+    presence.touch(user.id, user.username, order.id)
+    online_users = presence.online([p.id for p in participants])
     
     return render_template('futuristic-chat.html', order=order, messages=messages, user=user, available_agents=available_agents, participants=participants, online_users=online_users)
 
 
 
 @app.route('/send_message', methods=['POST'])
+@query_budget(12)
+@rate_limit(30, burst=10)
 def send_message():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -674,14 +2953,15 @@ def send_message():
     
     # Validate tagged agents (only admin can tag agents)
     if user.role == 'admin' and tagged_agent_ids:
+        tagged_users = {u.id: u for u in User.query.filter(User.id.in_(tagged_agent_ids)).all()}
+        assigned_ids = {oa.agent_id for oa in OrderAgent.query.filter_by(order_id=order_id).all()}
+        assigned_ids.add(order.assigned_agent)
         for agent_id in tagged_agent_ids:
-            agent = User.query.get(agent_id)
+            agent = tagged_users.get(int(agent_id))
             if not agent or agent.role != 'agent':
                 return jsonify({'success': False, 'message': f'Invalid agent ID: {agent_id}'})
             # Check if agent is assigned to this order
-            is_assigned = (order.assigned_agent == agent.id or 
-                          OrderAgent.query.filter_by(order_id=order_id, agent_id=agent.id).first())
-            if not is_assigned:
+            if agent.id not in assigned_ids:
                 return jsonify({'success': False, 'message': f'Agent {agent.username} not assigned to this order'})
     
     # Create chat message
@@ -713,8 +2993,36 @@ def send_message():
     
     return jsonify({'success': True})
 
+@app.route('/clear_chat', methods=['POST'])
+@query_budget(6)
+def clear_chat():
+    """Delete an order's chat history and its agent tags"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    user = User.query.get(session['user_id'])
+    if user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Permission denied'})
+    
+    try:
+        order = Order.query.get(int(request.json['order_id']))
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Invalid request data'})
+    if not order:
+        return jsonify({'success': False, 'message': 'Order not found'})
+    
+    order_pk, order_code = order.id, order.order_id
+    deleted = delete_chat_messages(ChatMessage.order_id == order_pk)
+    db.session.commit()
+    invalidate_order_caches()
+    
+    log_audit(user.id, 'chat_cleared', 'order', order_pk, f"Cleared {deleted} messages in order {order_code}")
+    
+    return jsonify({'success': True, 'deleted': deleted})
+
 
 @app.route('/upload_file', methods=['POST'])
+@query_budget(4)
 def upload_file():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -758,6 +3066,7 @@ def upload_file():
 
 
 @app.route('/edit_order/<int:order_id>')
+@query_budget(5)
 def edit_order(order_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -770,23 +3079,89 @@ def edit_order(order_id):
         return redirect(url_for('dashboard'))
     
     # Check permissions
-    if user.role == 'agent':
-        # Check if agent is assigned to this order
-        is_assigned = (order.assigned_agent == user.id or 
-                      OrderAgent.query.filter_by(order_id=order_id, agent_id=user.id).first())
-        if not is_assigned:
-            flash('Permission denied', 'error')
-            return redirect(url_for('dashboard'))
-    elif user.role == 'user' and order.created_by != user.id:
+    if not can_edit_order(user, order):
         flash('Permission denied', 'error')
         return redirect(url_for('dashboard'))
     
     # Get agents for admin to assign
-    agents = User.query.filter_by(role='agent').all() if user.role == 'admin' else []
+    agents = all_agents() if user.role == 'admin' else []
+    
+    # Unsaved edits are restored only if nobody changed the order since they were made
+    draft = OrderDraft.query.filter_by(order_id=order.id, user_id=user.id).first()
+    draft_fields = json.loads(draft.fields) if draft and draft.base_version == order.version else None
+    
+    return render_template('futuristic-edit-order.html', order=order, user=user, agents=agents,
+                           ORDER_STATUSES=ORDER_STATUSES, draft=draft_fields,
+                           yarn_types=list(yarn_catalog().values()), default_yarn_gradient=UNKNOWN_YARN_TYPE.gradient)
+
+def save_order_draft():
+    """Shared by /auto_save_order and /save_draft: merge a field-level patch into the caller's draft"""
+    user = User.query.get(session['user_id'])
+    data = request.get_json(silent=True)
+    if data is None:
+        # Plain form posts carry the whole form as the patch
+        patch = request.form.to_dict()
+        patch['agent_ids'] = request.form.getlist('agent_ids')
+        data = {'order_id': request.form.get('order_id'), 'base_version': request.form.get('version'), 'patch': patch}
+    
+    try:
+        order = Order.query.get(int(data.get('order_id')))
+        patch = clean_draft_patch(data.get('patch') or {}, user)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid request data'})
     
-    return render_template('futuristic-edit-order.html', order=order, user=user, agents=agents, ORDER_STATUSES=ORDER_STATUSES)
+    if not order:
+        return jsonify({'success': False, 'message': 'Order not found'})
+    if not can_edit_order(user, order):
+        return jsonify({'success': False, 'message': 'Permission denied'})
+    
+    base_version = data.get('base_version')
+    if base_version not in (None, '') and str(base_version) != str(order.version):
+        return jsonify({'success': False, 'conflict': True, 'version': order.version,
+                        'message': 'Order was changed by someone else; reload to edit the latest version'})
+    
+    draft = OrderDraft.query.filter_by(order_id=order.id, user_id=user.id).first()
+    if draft is None:
+        draft = OrderDraft(order_id=order.id, user_id=user.id, base_version=order.version, fields='{}')
+        db.session.add(draft)
+    elif draft.base_version != order.version:
+        # Edits made against an older version are superseded by this one
+        draft.base_version = order.version
+        draft.fields = '{}'
+    
+    # Rapid saves of the same values coalesce into a no-op instead of another write
+    if merge_draft_patch(draft, patch):
+        db.session.commit()
+    
+    return jsonify({'success': True, 'version': order.version, 'fields': sorted(json.loads(draft.fields)),
+                    'saved_at': draft.updated_at.isoformat()})
+
+@app.route('/auto_save_order', methods=['POST'])
+@query_budget(6)
+@rate_limit(20, burst=5)
+def auto_save_order():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    return save_order_draft()
+
+@app.route('/save_draft', methods=['POST'])
+@query_budget(6)
+@rate_limit(20, burst=5)
+def save_draft():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    return save_order_draft()
+
+def order_update_response(success, message, **extra):
+    if wants_json():
+        return jsonify(dict(success=success, message=message, **extra))
+    flash(message, 'success' if success else 'error')
+    return redirect(url_for('dashboard'))
 
 @app.route('/update_order', methods=['POST'])
+@query_budget(27)
 def update_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -796,60 +3171,53 @@ def update_order():
     order = Order.query.get(order_id)
     
     if not order:
-        flash('Order not found', 'error')
-        return redirect(url_for('dashboard'))
+        return order_update_response(False, 'Order not found')
     
     # Check permissions
-    if user.role == 'agent':
-        # Check if agent is assigned to this order
-        is_assigned = (order.assigned_agent == user.id or 
-                      OrderAgent.query.filter_by(order_id=order_id, agent_id=user.id).first())
-        if not is_assigned:
-            flash('Permission denied', 'error')
-            return redirect(url_for('dashboard'))
-    elif user.role == 'user' and order.created_by != user.id:
-        flash('Permission denied', 'error')
-        return redirect(url_for('dashboard'))
+    if not can_edit_order(user, order):
+        return order_update_response(False, 'Permission denied')
+    
+    expected_version = request.form.get('version')
+    if expected_version and expected_version != str(order.version):
+        return order_update_response(False, 'Order was changed by someone else; reload and try again',
+                                     conflict=True, version=order.version)
+    
+    base_version = order.version
+    raw = request.form.to_dict()
+    if user.role == 'admin':
+        # Unchecking every agent sends no agent_ids at all
+        raw['agent_ids'] = request.form.getlist('agent_ids')
     
     try:
-        # Update order fields
-        order.customer_name = request.form['customer_name']
-        order.yarn_type = request.form['yarn_type']
-        order.quantity_kg = float(request.form['quantity_kg'])
-        order.startup_date = datetime.strptime(request.form['startup_date'], '%Y-%m-%d').date()
-        order.order_type = request.form['order_type']
-        order.amount_usd = float(request.form['amount_usd'])
-        
-        # Only admin can change status and assign agents
-        if user.role == 'admin':
-            order.status = request.form['status']
-            agent_id = request.form.get('assigned_agent', '')
-            order.assigned_agent = int(agent_id) if agent_id else None
-            
-            # Update agent assignments
-            OrderAgent.query.filter_by(order_id=order_id).delete()
-            agent_ids = request.form.getlist('agent_ids')
-            for agent_id in agent_ids:
-                agent_id = int(agent_id)
-                agent = User.query.get(agent_id)
-                if agent and agent.role == 'agent':
-                    order_agent = OrderAgent(order_id=order_id, agent_id=agent_id)
-                    db.session.add(order_agent)
-        
-        order.updated_at = datetime.utcnow()
+        changes = order_changes(order, raw, user)
+    except ValueError as e:
+        return order_update_response(False, f'Error updating order: {str(e)}')
+    
+    # Promote: only changed columns are written and the user's draft goes in the same transaction
+    try:
+        if changes:
+            apply_order_changes(order, changes, user.id)
+        OrderDraft.query.filter_by(order_id=order.id, user_id=user.id).delete(synchronize_session=False)
+        user_id, order_pk, order_code, new_version = user.id, order.id, order.order_id, base_version + (1 if changes else 0)
         db.session.commit()
-        
-        # Log audit
-        log_audit(user.id, 'order_updated', 'order', order.id, f"Updated order {order.order_id}")
-        
-        flash('Order updated successfully!', 'success')
-        
-    except Exception as e:
-        flash(f'Error updating order: {str(e)}', 'error')
+    except StaleDataError:
+        db.session.rollback()
+        return order_update_response(False, 'Order was changed by someone else; reload and try again', conflict=True)
+    except ValueError as e:
+        db.session.rollback()
+        response = order_update_response(False, f'Error updating order: {str(e)}')
+        return (response, 400) if wants_json() else response
     
-    return redirect(url_for('dashboard'))
+    if not changes:
+        return order_update_response(True, 'No changes to save', version=new_version)
+    
+    invalidate_order_caches()
+    log_audit(user_id, 'order_updated', 'order', order_pk, f"Updated order {order_code}: {', '.join(sorted(changes))}")
+    
+    return order_update_response(True, 'Order updated successfully!', version=new_version)
 
 @app.route('/edit_user/<int:user_id>')
+@query_budget(4)
 def edit_user(user_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -867,22 +3235,25 @@ def edit_user(user_id):
     return render_template('edit_user.html', user=user, current_user=current_user)
 
 @app.route('/contracts')
+@query_budget(6)
 def contracts():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
     
-    # Get orders that are Booked or Received Contract
+    # Get orders that are Booked or Received Contract, with everything the page shows per order
+    orders_query = Order.query.options(db.selectinload(Order.creator), db.selectinload(Order.agent),
+                                       db.selectinload(Order.contracts))
     if user.role == 'admin':
-        orders = Order.query.filter(Order.status.in_(['Booked', 'Received Contract'])).all()
+        orders = orders_query.filter(Order.status.in_(['Booked', 'Received Contract'])).all()
     elif user.role == 'agent':
-        orders = Order.query.filter(
+        orders = orders_query.filter(
             Order.status.in_(['Booked', 'Received Contract']),
             Order.assigned_agent == user.id
         ).all()
     else:
-        orders = Order.query.filter(
+        orders = orders_query.filter(
             Order.status.in_(['Booked', 'Received Contract']),
             Order.created_by == user.id
         ).all()
@@ -890,6 +3261,7 @@ def contracts():
     return render_template('contracts.html', orders=orders, user=user)
 
 @app.route('/upload_contract', methods=['POST'])
+@query_budget(20)
 def upload_contract():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -941,9 +3313,13 @@ def upload_contract():
         
         # Update order status to Received Contract
         if order.status == 'Booked':
-            order.status = 'Received Contract'
+            before = rollup_entry(order)
+            change_order_status(order, 'Received Contract', user.id)
+            bump_order_rollups([before], [rollup_entry(order)])
+            log_order_changes([order.id])
         
         db.session.commit()
+        invalidate_order_caches()
         
         # Log audit
         log_audit(user.id, 'contract_uploaded', 'contract', contract.id, 
@@ -953,56 +3329,91 @@ def upload_contract():
     
     return redirect(url_for('contracts'))
 
-@app.route('/reports')
-def reports():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    if user.role != 'admin':
-        flash('Access denied. Admin privileges required.', 'error')
-        return redirect(url_for('dashboard'))
-    
-    # Get filter parameters
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    agent_filter = request.args.get('agent')
-    customer_filter = request.args.get('customer')
-    order_type_filter = request.args.get('order_type')
-    
-    # Build query
-    orders_query = Order.query
-    
+def filter_report_orders(orders_query, model, start_date, end_date, agent_filter, customer_filter, order_type_filter):
+    """Apply the report filters to a query over Order or ArchivedOrder"""
     if start_date:
-        orders_query = orders_query.filter(Order.startup_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+        orders_query = orders_query.filter(model.startup_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
-        orders_query = orders_query.filter(Order.startup_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+        orders_query = orders_query.filter(model.startup_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
     if agent_filter:
         orders_query = orders_query.filter_by(assigned_agent=agent_filter)
     if customer_filter:
-        orders_query = orders_query.filter(Order.customer_name.contains(customer_filter))
+        # Both tiers match on the name copied onto the row (cold-tier rows keep only the name)
+        orders_query = orders_query.filter(model.customer_name.contains(customer_filter))
     if order_type_filter:
         orders_query = orders_query.filter_by(order_type=order_type_filter)
-    
-    orders = orders_query.all()
-    
-    # Calculate statistics
-    total_orders = len(orders)
-    total_amount = sum(order.amount_usd for order in orders)
-    
-    orders_by_status = {}
-    for status in ORDER_STATUSES.keys():
-        orders_by_status[status] = [order for order in orders if order.status == status]
-    
-    orders_by_type = {}
-    for order_type in ['Local', 'Export']:
-        orders_by_type[order_type] = [order for order in orders if order.order_type == order_type]
+    return orders_query
+
+def report_totals(start_date, end_date, agent_filter, customer_filter, order_type_filter):
+    """[(status, order_type, count, amount)] for the report filters, live and cold-tier orders together"""
+    if customer_filter:
+        # The rollup has no customer key, so a customer search aggregates the matching raw rows instead
+        rows = []
+        for model in (Order, ArchivedOrder):
+            rows += filter_report_orders(model.query, model, start_date, end_date, agent_filter, customer_filter, order_type_filter) \
+                .with_entities(model.status, model.order_type, db.func.count(), db.func.sum(model.amount_usd)) \
+                .group_by(model.status, model.order_type).all()
+        return rows
+    
+    query = db.session.query(OrderDailyRollup.status, OrderDailyRollup.order_type,
+                             db.func.sum(OrderDailyRollup.order_count), db.func.sum(OrderDailyRollup.amount_usd))
+    if start_date:
+        query = query.filter(OrderDailyRollup.day >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(OrderDailyRollup.day <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if agent_filter:
+        query = query.filter(OrderDailyRollup.agent_id == agent_filter)
+    if order_type_filter:
+        query = query.filter(OrderDailyRollup.order_type == order_type_filter)
+    return query.group_by(OrderDailyRollup.status, OrderDailyRollup.order_type).all()
+
+@app.route('/reports')
+@query_budget(11)
+@admin_required
+@cached_response
+@concurrency_limit('reports')
+@read_replica
+def reports():
+    # Get filter parameters
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    # Malformed ids are ignored rather than failing the page
+    agent_filter = request.args.get('agent', type=int)
+    customer_filter = request.args.get('customer')
+    order_type_filter = request.args.get('order_type')
+    status_filter = request.args.get('status')
+    filters = (start_date, end_date, agent_filter, customer_filter, order_type_filter)
+    
+    # Totals from the daily rollup
+    orders_by_status = {status: {'count': 0, 'amount': 0.0} for status in ORDER_STATUSES}
+    orders_by_type = {'Local': 0, 'Export': 0}
+    for status, order_type, count, amount in report_totals(*filters):
+        if not count:
+            continue
+        totals = orders_by_status.setdefault(status, {'count': 0, 'amount': 0.0})
+        totals['count'] += count
+        totals['amount'] += amount or 0.0
+        orders_by_type[order_type] = orders_by_type.get(order_type, 0) + count
+    total_orders = sum(totals['count'] for totals in orders_by_status.values())
+    total_amount = sum(totals['amount'] for totals in orders_by_status.values())
+    
+    # Drill-down: the latest raw rows, live orders plus the ones moved to cold storage
+    orders = []
+    for model in (Order, ArchivedOrder):
+        query = filter_report_orders(model.query, model, *filters)
+        if status_filter:
+            query = query.filter(model.status == status_filter)
+        orders += query.options(db.selectinload(model.creator), db.selectinload(model.agent)) \
+            .order_by(model.startup_date.desc(), model.id.desc()).limit(REPORT_DRILLDOWN_ROWS).all()
+    orders = sorted(orders, key=lambda order: order.startup_date, reverse=True)[:REPORT_DRILLDOWN_ROWS]
+    matching_orders = orders_by_status.get(status_filter, {'count': 0})['count'] if status_filter else total_orders
     
     # Get agents for filter
-    agents = User.query.filter_by(role='agent').all()
+    agents = all_agents()
     
     return render_template('reports.html', 
                          orders=orders,
+                         matching_orders=matching_orders,
                          orders_by_status=orders_by_status,
                          orders_by_type=orders_by_type,
                          total_orders=total_orders,
@@ -1012,9 +3423,80 @@ def reports():
                          end_date=end_date,
                          agent_filter=agent_filter,
                          customer_filter=customer_filter,
-                         order_type_filter=order_type_filter)
+                         order_type_filter=order_type_filter,
+                         status_filter=status_filter)
+
+# Cycle-time breakdowns a report can be grouped by
+CYCLE_TIME_GROUPS = {'agent': StageMetric.agent_id, 'yarn_type': StageMetric.yarn_type_id, 'day': StageMetric.day}
+
+def stage_summary(entered, exited, seconds):
+    return {'entered': entered or 0, 'exited': exited or 0,
+            'avg_days': (seconds or 0) / exited / 86400 if exited else None}
+
+@app.route('/reports/cycle_times')
+@query_budget(5)
+@admin_required
+@cached_response
+@concurrency_limit('reports')
+@read_replica
+def cycle_times():
+    """Average time in each stage and throughput, read from the StageMetric rollup"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    # Malformed ids are ignored rather than failing the page
+    agent_filter = request.args.get('agent', type=int)
+    yarn_type_filter = request.args.get('yarn_type', type=int)
+    group_by = request.args.get('group_by')
+    if group_by not in CYCLE_TIME_GROUPS:
+        group_by = 'agent'
+    
+    filters = []
+    if start_date:
+        filters.append(StageMetric.day >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        filters.append(StageMetric.day <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if agent_filter:
+        filters.append(StageMetric.agent_id == agent_filter)
+    if yarn_type_filter:
+        filters.append(StageMetric.yarn_type_id == yarn_type_filter)
+    sums = (db.func.sum(StageMetric.entered), db.func.sum(StageMetric.exited), db.func.sum(StageMetric.seconds_in_stage))
+    
+    # Known statuses in board order, then any others (e.g. Confirmed)
+    stages = {row[0]: stage_summary(*row[1:]) for row in
+              db.session.query(StageMetric.stage, *sums).filter(*filters).group_by(StageMetric.stage)}
+    stage_order = sorted(stages, key=lambda stage: (ORDER_STATUSES.get(stage, len(ORDER_STATUSES) + 1), stage))
+    
+    group_column = CYCLE_TIME_GROUPS[group_by]
+    breakdown = {}
+    for row in db.session.query(group_column, StageMetric.stage, *sums).filter(*filters).group_by(group_column, StageMetric.stage):
+        breakdown.setdefault(row[0], {})[row[1]] = stage_summary(*row[2:])
+    
+    agents = all_agents()
+    agent_names = {agent.id: agent.username for agent in all_users()}
+    if group_by == 'agent':
+        labels = {key: agent_names.get(key, 'Unassigned') for key in breakdown}
+    elif group_by == 'yarn_type':
+        labels = {key: yarn_type_info(key).name for key in breakdown}
+    else:
+        labels = {key: key.strftime('%m/%d/%Y') for key in breakdown}
+    groups = sorted(breakdown, reverse=True) if group_by == 'day' else sorted(breakdown, key=lambda key: labels[key].casefold())
+    
+    return render_template('cycle_times.html',
+                         stages=stages,
+                         stage_order=stage_order,
+                         breakdown=breakdown,
+                         groups=groups,
+                         labels=labels,
+                         agents=agents,
+                         yarn_types=list(yarn_catalog().values()),
+                         start_date=start_date,
+                         end_date=end_date,
+                         agent_filter=agent_filter,
+                         yarn_type_filter=yarn_type_filter,
+                         group_by=group_by)
 
 @app.route('/profile')
+@query_budget(4)
 def profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1023,6 +3505,7 @@ def profile():
     return render_template('profile.html', user=user)
 
 @app.route('/update_profile', methods=['POST'])
+@query_budget(3)
 def update_profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1037,26 +3520,34 @@ def update_profile():
     if request.form.get('password'):
         user.password_hash = generate_password_hash(request.form['password'])
     
+    bump_reference_version('users')
     db.session.commit()
     flash('Profile updated successfully!', 'success')
     return redirect(url_for('profile'))
 
+# Admin stats also lists users and recent messages, so its cached page is keyed on them too
+def users_version():
+    return user_reference_data.current_version()
+
+def latest_message_id():
+    return db.session.query(db.func.max(ChatMessage.id)).scalar()
+
 @app.route('/admin_stats')
+@query_budget(18)
+@admin_required
+@cached_response(depends_on=(users_version, latest_message_id))
+@read_replica
 def admin_stats():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
     user = User.query.get(session['user_id'])
-    if user.role != 'admin':
-        flash('Access denied. Admin privileges required.', 'error')
-        return redirect(url_for('dashboard'))
     
     # Get statistics
     total_orders = Order.query.count()
-    total_users = User.query.count()
-    total_agents = User.query.filter_by(role='agent').count()
-    total_admins = User.query.filter_by(role='admin').count()
-    total_regular_users = User.query.filter_by(role='user').count()
+    users = all_users()
+    agents = [u for u in users if u.role == 'agent']
+    total_users = len(users)
+    total_agents = len(agents)
+    total_admins = len([u for u in users if u.role == 'admin'])
+    total_regular_users = len([u for u in users if u.role == 'user'])
     
     # Orders by status
     orders_by_status = {}
@@ -1064,11 +3555,11 @@ def admin_stats():
         count = Order.query.filter_by(status=status).count()
         orders_by_status[status] = count
     
-    # Orders by agent
-    orders_by_agent = {}
-    for agent in User.query.filter_by(role='agent').all():
-        count = Order.query.filter_by(assigned_agent=agent.id).count()
-        orders_by_agent[agent.username] = count
+    # Orders by agent (one grouped count instead of a query per agent)
+    counts_by_agent = dict(db.session.query(Order.assigned_agent, db.func.count(Order.id)).group_by(Order.assigned_agent).all())
+    orders_by_agent = {agent.username: counts_by_agent.get(agent.id, 0) for agent in agents}
+    workloads = agent_workloads([agent.id for agent in agents])
+    open_by_agent = {agent.username: workloads[agent.id] for agent in agents}
     
     # Revenue statistics
     total_revenue = db.session.query(db.func.sum(Order.amount_usd)).scalar() or 0
@@ -1076,8 +3567,8 @@ def admin_stats():
     export_revenue = db.session.query(db.func.sum(Order.amount_usd)).filter_by(order_type='Export').scalar() or 0
     
     # Recent activity
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
-    recent_messages = ChatMessage.query.order_by(ChatMessage.created_at.desc()).limit(10).all()
+    recent_orders = Order.query.options(db.selectinload(Order.creator)).order_by(Order.created_at.desc()).limit(10).all()
+    recent_messages = ChatMessage.query.options(db.selectinload(ChatMessage.sender)).order_by(ChatMessage.created_at.desc()).limit(10).all()
     
     return render_template('admin_stats.html', 
                          user=user,
@@ -1088,6 +3579,7 @@ def admin_stats():
                          total_regular_users=total_regular_users,
                          orders_by_status=orders_by_status,
                          orders_by_agent=orders_by_agent,
+                         open_by_agent=open_by_agent,
                          total_revenue=total_revenue,
                          local_revenue=local_revenue,
                          export_revenue=export_revenue,
@@ -1095,6 +3587,9 @@ def admin_stats():
                          recent_messages=recent_messages)
 
 @app.route('/export_orders')
+@query_budget(5)
+@concurrency_limit('export')
+@read_replica
 def export_orders():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1104,8 +3599,8 @@ def export_orders():
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard'))
     
-    # Get all orders
-    orders = Order.query.all()
+    # Get all orders with the users named in each row
+    orders = Order.query.options(db.selectinload(Order.creator), db.selectinload(Order.agent)).all()
     
     # Create CSV content
     csv_content = "Order ID,Customer Name,Yarn Type,Quantity (kg),Startup Date,Order Type,Amount (USD),Status,Created By,Assigned Agent,Created At,Updated At\n"
@@ -1122,6 +3617,8 @@ def export_orders():
     )
 
 @app.route('/admin_panel')
+@query_budget(5)
+@read_replica
 def admin_panel():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1132,7 +3629,7 @@ def admin_panel():
         return redirect(url_for('dashboard'))
     
     # Get all users
-    users = User.query.all()
+    users = all_users()
     
     # Get all orders
     all_orders = Order.query.order_by(Order.created_at.desc()).all()
@@ -1140,9 +3637,11 @@ def admin_panel():
     # Get unassigned orders
     unassigned_orders = Order.query.filter_by(assigned_agent=None).all()
     
-    return render_template('futuristic-admin-panel.html', users=users, all_orders=all_orders, unassigned_orders=unassigned_orders, user=user)
+    return render_template('futuristic-admin-panel.html', users=users, all_orders=all_orders, unassigned_orders=unassigned_orders, user=user,
+                           slow_queries=slow_query_log.top(10), profiles=list_profiles()[:10], slow_query_ms=SLOW_QUERY_MS)
 
 @app.route('/update_user', methods=['POST'])
+@query_budget(7)
 def update_user():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1160,6 +3659,7 @@ def update_user():
     
     if action == 'deactivate':
         target_user.is_active = False
+        bump_reference_version('users')
         db.session.commit()
         
         # Log audit
@@ -1169,6 +3669,7 @@ def update_user():
         return jsonify({'success': True, 'message': 'User deactivated'})
     elif action == 'activate':
         target_user.is_active = True
+        bump_reference_version('users')
         db.session.commit()
         
         # Log audit
@@ -1180,6 +3681,7 @@ def update_user():
     return jsonify({'success': False, 'message': 'Invalid action'})
 
 @app.route('/download_contract/<int:contract_id>')
+@query_budget(5)
 def download_contract(contract_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1207,59 +3709,198 @@ def download_contract(contract_id):
     return send_file(contract.file_path, as_attachment=True, download_name=contract.filename)
 
 @app.route('/logout')
+@query_budget(0)
 def logout():
+    if 'user_id' in session:
+        presence.leave(session['user_id'])
     session.clear()
     flash('You have been logged out', 'info')
     return redirect(url_for('login'))
 
+def rebuild_stage_metrics(batch_size=None):
+    """Recompute the StageMetric rollup from the transition log in one transaction; returns transitions read"""
+    batch_size = batch_size or BULK_BATCH_SIZE
+    transitions = OrderStatusTransition.__table__
+    StageMetric.query.delete(synchronize_session=False)
+    folded = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(db.select(transitions).where(transitions.c.id > last_id)
+                                  .order_by(transitions.c.id).limit(batch_size)).mappings().all()
+        if not rows:
+            break
+        bump_stage_metrics(rows)
+        folded += len(rows)
+        last_id = rows[-1]['id']
+    db.session.commit()
+    invalidate_order_caches()
+    return folded
+
+@app.cli.command('rebuild-stage-metrics')
+@click.option('--batch-size', default=BULK_BATCH_SIZE, show_default=True, help='Transitions read per query.')
+def rebuild_stage_metrics_command(batch_size):
+    """Recompute the cycle-time rollup from the status transition log."""
+    folded = rebuild_stage_metrics(batch_size)
+    click.echo(f"Rebuilt stage metrics from {folded} status transitions")
+
+def rebuild_order_rollups():
+    """Recompute OrderDailyRollup from live and cold-tier orders in one transaction; returns rollup rows written"""
+    totals = {}
+    for model in (Order, ArchivedOrder):
+        agent_id = db.func.coalesce(model.assigned_agent, 0)
+        grouped = db.session.query(model.startup_date, model.order_type, model.status, agent_id, db.func.count(),
+                                   db.func.sum(model.quantity_kg), db.func.sum(model.amount_usd)) \
+            .group_by(model.startup_date, model.order_type, model.status, agent_id)
+        for day, order_type, status, agent, count, kg, usd in grouped:
+            total = totals.setdefault((day, order_type, status, agent), [0, 0.0, 0.0])
+            total[0] += count
+            total[1] += kg or 0.0
+            total[2] += usd or 0.0
+    
+    OrderDailyRollup.query.delete(synchronize_session=False)
+    if totals:
+        db.session.execute(db.insert(OrderDailyRollup), [
+            {'day': day, 'order_type': order_type, 'status': status, 'agent_id': agent,
+             'order_count': count, 'quantity_kg': kg, 'amount_usd': usd}
+            for (day, order_type, status, agent), (count, kg, usd) in totals.items()])
+    db.session.commit()
+    invalidate_order_caches()
+    return len(totals)
+
+@app.cli.command('rebuild-report-rollups')
+def rebuild_report_rollups_command():
+    """Recompute the daily report rollup from the order tables."""
+    rows = rebuild_order_rollups()
+    click.echo(f"Rebuilt {rows} daily report rollup rows")
+
+def rebuild_agent_workload():
+    """Recompute AgentWorkload from open orders, with a row for every agent; returns agents written"""
+    loads = {row.id: [0, 0.0] for row in db.session.query(User.id).filter(User.role == 'agent')}
+    grouped = db.session.query(Order.assigned_agent, db.func.count(), db.func.sum(Order.quantity_kg)) \
+        .filter(Order.assigned_agent.isnot(None), Order.status.notin_(CLOSED_STATUSES)).group_by(Order.assigned_agent)
+    for agent_id, count, kg in grouped:
+        loads[agent_id] = [count, kg or 0.0]
+    
+    AgentWorkload.query.delete(synchronize_session=False)
+    if loads:
+        db.session.execute(db.insert(AgentWorkload), [
+            {'agent_id': agent_id, 'open_orders': count, 'open_kg': kg} for agent_id, (count, kg) in loads.items()])
+    db.session.commit()
+    workload_agent_ids.clear()
+    workload_agent_ids.update(loads)
+    return len(loads)
+
+@app.cli.command('rebuild-agent-workload')
+def rebuild_agent_workload_command():
+    """Recompute per-agent open-order workload from the orders table."""
+    agents = rebuild_agent_workload()
+    click.echo(f"Rebuilt workload for {agents} agents")
+
 # Initialize database
+def init_db():
+    """Create missing tables and columns"""
+    db.create_all()
+    upgrade_schema()
+    # Orders from before the customer and yarn type catalogs existed
+    if db.session.query(Order.id).filter(Order.customer_id.is_(None)).first():
+        link_order_customers()
+    if db.session.query(Order.id).filter(Order.yarn_type_id.is_(None)).first():
+        link_order_yarn_types()
+    seed_yarn_types()
+    # Orders from before the daily report rollup existed
+    if not db.session.query(OrderDailyRollup.day).first() and db.session.query(Order.id).first():
+        rebuild_order_rollups()
+    # Orders from before agent workloads were tracked
+    if not db.session.query(AgentWorkload.agent_id).first() and db.session.query(Order.id).first():
+        rebuild_agent_workload()
+
+def seed_db():
+    """Create the default admin, agent and user accounts for roles that have none"""
+    # PBKDF2 is deliberately slow, so hash each default password only once
+    password_hashes = {}
+    def default_password_hash(password):
+        if password not in password_hashes:
+            password_hashes[password] = generate_password_hash(password)
+        return password_hashes[password]
+    
+    # Create admin user if it doesn't exist
+    if User.query.filter_by(role='admin').count() == 0:
+        admin = User(
+            username='admin',
+            email='admin@yarnsystem.com',
+            password_hash=default_password_hash('admin123'),
+            role='admin'
+        )
+        db.session.add(admin)
+        bump_reference_version('users')
+        db.session.commit()
+    
+    # Create sample agents if none exist
+    if User.query.filter_by(role='agent').count() == 0:
+        for i in range(1, 6):
+            db.session.add(User(username=f'agent{i}', email=f'agent{i}@yarnsystem.com', password_hash=default_password_hash('agent123'), role='agent'))
+        bump_reference_version('users')
+        db.session.commit()
+    
+    # Create sample users if none exist
+    if User.query.filter_by(role='user').count() == 0:
+        for i in range(1, 6):
+            db.session.add(User(username=f'user{i}', email=f'user{i}@yarnsystem.com', password_hash=default_password_hash('user123'), role='user'))
+        bump_reference_version('users')
+        db.session.commit()
+
 def create_tables():
+    """Create the schema and default accounts; returns False if that failed"""
     try:
         with app.app_context():
-            db.create_all()
-            
-            # Create admin user if it doesn't exist
-            if User.query.filter_by(role='admin').count() == 0:
-                admin = User(
-                    username='admin',
-                    email='admin@yarnsystem.com',
-                    password_hash=generate_password_hash('admin123'),
-                    role='admin'
-                )
-                db.session.add(admin)
-                db.session.commit()
-            
-            # Create sample agents if none exist
-            if User.query.filter_by(role='agent').count() == 0:
-                agents = [
-                    User(username='agent1', email='agent1@yarnsystem.com', password_hash=generate_password_hash('agent123'), role='agent'),
-                    User(username='agent2', email='agent2@yarnsystem.com', password_hash=generate_password_hash('agent123'), role='agent'),
-                    User(username='agent3', email='agent3@yarnsystem.com', password_hash=generate_password_hash('agent123'), role='agent'),
-                    User(username='agent4', email='agent4@yarnsystem.com', password_hash=generate_password_hash('agent123'), role='agent'),
-                    User(username='agent5', email='agent5@yarnsystem.com', password_hash=generate_password_hash('agent123'), role='agent')
-                ]
-                for agent in agents:
-                    db.session.add(agent)
-                db.session.commit()
-            
-            # Create sample users if none exist
-            if User.query.filter_by(role='user').count() == 0:
-                users = [
-                    User(username='user1', email='user1@yarnsystem.com', password_hash=generate_password_hash('user123'), role='user'),
-                    User(username='user2', email='user2@yarnsystem.com', password_hash=generate_password_hash('user123'), role='user'),
-                    User(username='user3', email='user3@yarnsystem.com', password_hash=generate_password_hash('user123'), role='user'),
-                    User(username='user4', email='user4@yarnsystem.com', password_hash=generate_password_hash('user123'), role='user'),
-                    User(username='user5', email='user5@yarnsystem.com', password_hash=generate_password_hash('user123'), role='user')
-                ]
-                for user in users:
-                    db.session.add(user)
-                db.session.commit()
+            init_db()
+            seed_db()
+        return True
     except Exception as e:
         print(f"Database initialization error: {e}")
-        # Don't crash the app if database initialization fails
-        pass
+        # Don't crash the app if database initialization fails; the next request tries again
+        return False
+
+# Set AUTO_INIT_DB=0 when `flask init-db` runs as a deploy step
+AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1') == '1'
+_schema_ready = not AUTO_INIT_DB
+_schema_lock = threading.Lock()
+
+@app.before_request
+def ensure_schema():
+    """Create the schema lazily on the first request rather than on import"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            _schema_ready = create_tables()
+
+def dispose_engines(close=True):
+    """Drop pooled connections; in a forked child pass close=False so the parent's sockets stay untouched"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+def prepare_for_fork():
+    """Run once in a preloading master: create the schema, then drop connections before workers fork"""
+    global _schema_ready
+    if not _schema_ready:
+        # Left unset on failure, so each worker's first request tries again
+        _schema_ready = create_tables()
+    dispose_engines()
+
+@app.cli.command('init-db')
+@click.option('--seed/--no-seed', default=True, show_default=True, help='Create the default accounts.')
+def init_db_command(seed):
+    """Create database tables and default accounts."""
+    init_db()
+    if seed:
+        seed_db()
+    click.echo('Database initialized')
 
 @app.route('/confirm_order/<int:order_id>')
+@query_budget(4)
 def confirm_order(order_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1269,20 +3910,22 @@ def confirm_order(order_id):
         flash('Permission denied', 'error')
         return redirect(url_for('dashboard'))
     
-    order = Order.query.get(order_id)
+    order = Order.query.options(db.joinedload(Order.agent)).get(order_id)
     if not order:
         flash('Order not found', 'error')
         return redirect(url_for('dashboard'))
     
     # Get all assigned agents
-    assigned_agents = OrderAgent.query.filter_by(order_id=order_id).all()
+    assigned_agents = OrderAgent.query.filter_by(order_id=order_id).options(db.joinedload(OrderAgent.agent)).all()
     agents = [oa.agent for oa in assigned_agents]
     if order.assigned_agent and order.agent not in agents:
         agents.append(order.agent)
+    workloads = agent_workloads([agent.id for agent in agents])
     
-    return render_template('confirm_order.html', order=order, agents=agents, user=user)
+    return render_template('confirm_order.html', order=order, agents=agents, workloads=workloads, user=user)
 
 @app.route('/test_message/<int:order_id>')
+@query_budget(4)
 def test_message(order_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1308,6 +3951,7 @@ def test_message(order_id):
     return f"Test message created for order {order_id}"
 
 @app.route('/confirm_order_action', methods=['POST'])
+@query_budget(28)
 def confirm_order_action():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1317,20 +3961,34 @@ def confirm_order_action():
         return jsonify({'success': False, 'message': 'Permission denied'})
     
     order_id = request.json['order_id']
-    selected_agent_id = request.json['selected_agent_id']
     
     order = Order.query.get(order_id)
     if not order:
         return jsonify({'success': False, 'message': 'Order not found'})
     
+    if request.json['selected_agent_id'] == 'auto':
+        # The least-loaded of the agents already on the order
+        eligible = {row.agent_id for row in db.session.query(OrderAgent.agent_id).filter_by(order_id=order_id)}
+        if order.assigned_agent:
+            eligible.add(order.assigned_agent)
+        selected_agent_id = least_loaded_agent(eligible)
+        if not selected_agent_id:
+            return jsonify({'success': False, 'message': 'No active agent on this order'})
+    else:
+        selected_agent_id = int(request.json['selected_agent_id'])
+    
     # Update order status to Confirmed and assign single agent
-    order.status = 'Confirmed'
+    before = rollup_entry(order)
     order.assigned_agent = selected_agent_id
+    change_order_status(order, 'Confirmed', user.id)
+    bump_order_rollups([before], [rollup_entry(order)])
+    log_order_changes([order.id])
     
     # Remove all other agent assignments
     OrderAgent.query.filter_by(order_id=order_id).delete()
     
     db.session.commit()
+    invalidate_order_caches()
     
     # Log audit
     log_audit(user.id, 'order_confirmed', 'order', order.id, 
@@ -1340,6 +3998,7 @@ def confirm_order_action():
 
 
 @app.route('/delete_order', methods=['POST'])
+@query_budget(17)
 def delete_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -1354,37 +4013,253 @@ def delete_order():
     if not order:
         return jsonify({'success': False, 'message': 'Order not found'})
     
-    # Store order info for audit log before deletion
-    order_info = f"Order {order.order_id} - {order.customer_name} - ${order.amount_usd}"
+    # Child rows, chat tags and contract files are removed by the shared purge helper
+    purge_orders([order.id], user_id=user.id)
     
-    # Delete related records first (due to foreign key constraints)
-    ChatMessage.query.filter_by(order_id=order_id).delete()
-    OrderAgent.query.filter_by(order_id=order_id).delete()
-    Contract.query.filter_by(order_id=order_id).delete()
-    AuditLog.query.filter_by(entity_type='order', entity_id=order_id).delete()
+    return jsonify({'success': True, 'message': 'Order deleted successfully'})
+
+@app.route('/delete_orders', methods=['POST'])
+@query_budget(21)
+def delete_orders():
+    """Delete or archive many orders at once"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
     
-    # Delete the order
-    db.session.delete(order)
-    db.session.commit()
+    user = User.query.get(session['user_id'])
+    if user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Permission denied'})
     
-    # Log audit
-    log_audit(user.id, 'order_deleted', 'order', order_id, f"Deleted {order_info}")
+    try:
+        order_ids = [int(order_id) for order_id in request.json['order_ids']]
+        action = request.json.get('action', 'delete')
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Invalid request data'})
     
-    return jsonify({'success': True, 'message': 'Order deleted successfully'})
+    if action == 'delete':
+        count = purge_orders(order_ids, user_id=user.id)
+        return jsonify({'success': True, 'deleted': count, 'message': f'{count} orders deleted'})
+    elif action == 'archive':
+        count = archive_orders(order_ids, user_id=user.id)
+        cards = [order_card(order, user) for order in Order.query.filter(Order.id.in_(order_ids)).all()]
+        return jsonify({'success': True, 'archived': count, 'cards': cards, 'message': f'{count} orders archived'})
+    
+    return jsonify({'success': False, 'message': 'Invalid action'})
+
+@app.cli.command('purge-archived')
+@click.option('--older-than-days', default=365, show_default=True, help='Only purge orders archived this many days ago.')
+@click.option('--batch-size', default=BULK_BATCH_SIZE, show_default=True, help='Orders deleted per transaction.')
+def purge_archived_command(older_than_days, batch_size):
+    """Permanently delete archived orders older than the given age."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    order_ids = [row.id for row in db.session.query(Order.id).filter(Order.status == 'Archived', Order.updated_at < cutoff)]
+    deleted = purge_orders(order_ids, batch_size=batch_size)
+    click.echo(f"Purged {deleted} archived orders")
+
+@app.route('/restore_orders', methods=['POST'])
+@query_budget(29)
+def restore_orders():
+    """Bring orders back from cold storage into the live tables"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    user = User.query.get(session['user_id'])
+    if user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Permission denied'})
+    
+    try:
+        order_ids = [int(order_id) for order_id in request.json['order_ids']]
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Invalid request data'})
+    
+    restored, skipped = restore_archived_orders(order_ids)
+    
+    for order_id in restored:
+        log_audit(user.id, 'order_restored', 'order', order_id, f"Restored order {order_id} from cold storage")
+    
+    return jsonify({'success': True, 'restored': restored, 'skipped': skipped})
+
+@app.cli.command('archive-cold-orders')
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True, help='Move orders archived this many days ago.')
+@click.option('--batch-size', default=BULK_BATCH_SIZE, show_default=True, help='Orders moved per transaction.')
+def archive_cold_orders_command(older_than_days, batch_size):
+    """Move old archived orders into cold storage."""
+    moved = move_to_cold_storage(older_than_days, batch_size)
+    click.echo(f"Moved {moved} archived orders to cold storage")
+
+@app.cli.command('chat-retention')
+@click.option('--older-than-days', default=CHAT_RETENTION_DAYS, show_default=True, help='Only touch messages at least this old.')
+@click.option('--action', type=click.Choice(['delete', 'archive']), default=CHAT_RETENTION_ACTION, show_default=True,
+              help='Delete old messages, or move their archived orders to cold storage.')
+@click.option('--batch-size', default=BULK_BATCH_SIZE, show_default=True, help='Rows handled per transaction.')
+def chat_retention_command(older_than_days, action, batch_size):
+    """Prune or archive old chat messages on archived orders."""
+    affected = apply_chat_retention(older_than_days, action, batch_size)
+    if action == 'archive':
+        click.echo(f"Moved {affected} archived orders with old chat to cold storage")
+    else:
+        click.echo(f"Deleted {affected} chat messages")
+
+@app.cli.command('restore-orders')
+@click.argument('order_ids', nargs=-1, type=int, required=True)
+def restore_orders_command(order_ids):
+    """Restore orders from cold storage by their original ids."""
+    restored, skipped = restore_archived_orders(order_ids)
+    click.echo(f"Restored {len(restored)} orders")
+    if skipped:
+        click.echo(f"Skipped (id or PO number in use): {', '.join(str(order_id) for order_id in skipped)}")
+
+def presence_ids(values):
+    """Distinct integer ids from a lookup request, capped at PRESENCE_LOOKUP_LIMIT"""
+    ids = []
+    for value in values:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            continue
+        if value not in ids:
+            ids.append(value)
+        if len(ids) >= PRESENCE_LOOKUP_LIMIT:
+            break
+    return ids
+
+def visible_order_ids(user_id, order_ids):
+    """The order ids the user may see on the board; admins see every order, so they cost no query"""
+    if not order_ids:
+        return []
+    user = User.query.get(user_id)
+    if user.role == 'admin':
+        return order_ids
+    visible = {row.id for row in dashboard_orders(user, {}).with_entities(Order.id).filter(Order.id.in_(order_ids))}
+    return [order_id for order_id in order_ids if order_id in visible]
+
+@app.route('/api/presence', methods=['GET', 'POST'])
+@query_budget(2)
+@rate_limit(20, burst=5)
+def presence_lookup():
+    """Heartbeat (POST) plus a batch lookup of online users and order viewers, answered from the presence store alone"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        order_id = presence_ids([data.get('order_id')])
+        if data.get('leaving'):
+            # Sent as a beacon when the page closes, so the view ends now rather than at expiry
+            presence.leave(user_id, order_id[0] if order_id else 0)
+            return jsonify({'success': True})
+        user_ids, order_ids = data.get('users') or [], presence_ids(order_id + list(data.get('orders') or []))
+        order_ids = visible_order_ids(user_id, order_ids)
+        # Viewing an order the user may not open does not count
+        presence.touch(user_id, session.get('username'), order_id[0] if order_id and order_id[0] in order_ids else 0)
+    else:
+        user_ids = request.args.get('users', '').split(',')
+        order_ids = visible_order_ids(user_id, presence_ids(request.args.get('orders', '').split(',')))
+    
+    viewers = {}
+    for order_id, users in presence.viewers(order_ids).items():
+        # Other people only; a page already knows its own user is there
+        others = [{'id': viewer_id, 'username': username} for viewer_id, username in users if viewer_id != user_id]
+        if others:
+            viewers[str(order_id)] = others
+    return jsonify({'success': True, 'online': sorted(presence.online(presence_ids(user_ids))), 'viewers': viewers})
+
+# A tab polls every 5s (12 a minute), so 60 leaves room for about five open tabs; the burst
+# covers the catch-up poll when a tab becomes visible again and any follow-up `more` pages
+@app.route('/api/changes')
+@query_budget(6)
+@rate_limit(60, burst=20)
+def order_changes_feed():
+    """Board cards changed since a cursor, so open dashboards patch themselves instead of reloading"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        # No cursor yet: start from the newest change
+        return jsonify({'success': True, 'cursor': latest_change_id(), 'cards': [], 'removed': []})
+    
+    rows = db.session.query(OrderChange.id, OrderChange.order_id, OrderChange.changed_at) \
+        .filter(OrderChange.id > since).order_by(OrderChange.id).limit(CHANGE_FEED_BATCH).all()
+    if not rows:
+        return jsonify({'success': True, 'cursor': since, 'cards': [], 'removed': []})
+    
+    # Changes before the oldest kept one were pruned; the client has to reload the board
+    if rows[0].id > since + 1 and since < (db.session.query(db.func.min(OrderChange.id)).scalar() or 0) - 1:
+        return jsonify({'success': True, 'reset': True, 'cursor': rows[-1].id})
+    
+    # Ids are handed out before commit, so a recent gap may be a write still in flight: keep the cursor
+    # in front of it and send the later changes again next time
+    cursor = since
+    settled_before = datetime.utcnow() - timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS)
+    for row in rows:
+        if row.id != cursor + 1 and row.changed_at > settled_before:
+            break
+        cursor = row.id
+    
+    changed_ids = list(dict.fromkeys(row.order_id for row in rows))
+    user = User.query.get(session['user_id'])
+    orders = dashboard_orders(user, request.args).filter(Order.id.in_(changed_ids)).options(db.selectinload(Order.agent)).all()
+    visible = {order.id for order in orders}
+    
+    return jsonify({
+        'success': True,
+        'cursor': cursor,
+        # A cursor held back at a gap would only fetch the same batch again straight away
+        'more': len(rows) == CHANGE_FEED_BATCH and cursor == rows[-1].id,
+        'cards': [order_card(order, user) for order in orders],
+        # Deleted, moved to cold storage, or no longer visible to this user or filter
+        'removed': [order_id for order_id in changed_ids if order_id not in visible],
+    })
+
+def prune_order_changes(older_than_hours=None):
+    """Delete change-feed entries older than the retention window; returns rows deleted"""
+    older_than_hours = CHANGE_FEED_RETENTION_HOURS if older_than_hours is None else older_than_hours
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    deleted = OrderChange.query.filter(OrderChange.changed_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+@app.cli.command('prune-order-changes')
+@click.option('--older-than-hours', default=CHANGE_FEED_RETENTION_HOURS, show_default=True, help='Keep changes newer than this.')
+def prune_order_changes_command(older_than_hours):
+    """Delete old entries from the dashboard change feed."""
+    deleted = prune_order_changes(older_than_hours)
+    click.echo(f"Pruned {deleted} order changes")
+
+@app.route('/api/customers')
+@query_budget(2)
+@rate_limit(120, burst=20)
+def customer_autocomplete():
+    """Customer names starting with ?q= (any word), for pickers and filters"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        limit = 10
+    index = customer_index()
+    matches = index.search(request.args.get('q', ''), limit=limit)
+    return jsonify({'success': True, 'customers': [{'id': customer_id, 'name': index.names[customer_id]} for customer_id in matches]})
+
+@app.cli.command('link-catalogs')
+@click.option('--batch-size', default=BULK_BATCH_SIZE, show_default=True, help='Orders updated per transaction.')
+def link_catalogs_command(batch_size):
+    """Deduplicate customer and yarn type names and link existing orders to the catalog rows."""
+    linked, created = link_order_customers(batch_size)
+    click.echo(f"Linked {linked} orders to customers ({created} customers created)")
+    linked, created = link_order_yarn_types(batch_size)
+    click.echo(f"Linked {linked} orders to yarn types ({created} yarn types created)")
 
 if __name__ == '__main__':
     create_tables()
     app.run(debug=True, port=5001)
 
-# Initialize database when imported (for serverless)
-try:
-    create_tables()
-except Exception as e:
-    print(f"Initial database setup failed: {e}")
-    # Continue anyway - tables will be created on first request
-
 # Add a simple test route for debugging
 @app.route('/api/test')
+@query_budget(0)
 def api_test():
     return jsonify({
         'status': 'working',
@@ -0,0 +1 @@
+"""Performance benchmarks for the Yarn Purchasing System (run with `python -m benchmarks.<name>`)."""
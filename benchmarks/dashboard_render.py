@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Dashboard render benchmark for the order-card fragment cache and the Jinja
+bytecode cache.
+
+It seeds a throwaway SQLite database with N orders and times GET /dashboard
+for an admin three ways: with fragment caching disabled, on the first
+(cold) render, and on warm renders. It also times template loading with
+and without the persistent bytecode cache.
+
+    python -m benchmarks.dashboard_render --orders 5000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATUSES = ['New Order', 'Under Booking', 'Booked', 'Received Contract', 'Archived']
+YARN_TYPES = ['Cotton 30s', 'Combed Cotton 40s', 'Merino Wool', 'Silk Blend', 'Polyester 150D', 'Viscose 30s']
+
+
+def seed_orders(app_module, count):
+    db, Order, User = app_module.db, app_module.Order, app_module.User
+    agent_ids = [user.id for user in User.query.filter_by(role='agent').all()]
+    now = datetime.utcnow()
+    rows = [{
+        'order_id': f"PO-{i:06d}",
+        'customer_name': f"Customer {i % 400}",
+        'yarn_type': random.choice(YARN_TYPES),
+        'quantity_kg': round(random.uniform(100, 5000), 2),
+        'startup_date': date.today() + timedelta(days=random.randint(-200, 60)),
+        'order_type': random.choice(['Local', 'Export']),
+        'amount_usd': round(random.uniform(500, 50000), 2),
+        'status': random.choice(STATUSES),
+        'created_by': 1,
+        'assigned_agent': random.choice(agent_ids),
+        'created_at': now - timedelta(minutes=i),
+        'updated_at': now - timedelta(minutes=i),
+        'version': 1,
+    } for i in range(count)]
+    db.session.execute(db.insert(Order), rows)
+    db.session.commit()
+
+
+def time_requests(client, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get('/dashboard')
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return round(statistics.median(timings), 1)
+
+
+def time_template_load(app_module, use_bytecode_cache):
+    env = app_module.app.jinja_env
+    saved = env.bytecode_cache
+    env.bytecode_cache = saved if use_bytecode_cache else None
+    env.cache.clear()
+    start = time.perf_counter()
+    env.get_template('futuristic-dashboard.html')
+    env.get_template('_order_card.html')
+    elapsed = (time.perf_counter() - start) * 1000
+    env.bytecode_cache = saved
+    return round(elapsed, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp, 'jinja')
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.init_db()
+        app_module.seed_db()
+        seed_orders(app_module, args.orders)
+        admin_id = app_module.User.query.filter_by(role='admin').first().id
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=admin_id, username='admin', role='admin')
+
+    # Prime the bytecode cache, then measure template loading both ways
+    time_template_load(app_module, True)
+    template_load = {
+        'without_bytecode_cache_ms': time_template_load(app_module, False),
+        'with_bytecode_cache_ms': time_template_load(app_module, True),
+    }
+
+    app_module.FRAGMENT_CACHE_SIZE = 0
+    uncached = time_requests(client, args.repeat)
+
+    app_module.FRAGMENT_CACHE_SIZE = args.orders * 2
+    app_module.fragment_cache.max_entries = args.orders * 2
+    app_module.fragment_cache.clear()
+    cold = time_requests(client, 1)
+    warm = time_requests(client, args.repeat)
+
+    print(json.dumps({
+        'orders': args.orders,
+        'dashboard_without_fragment_cache_ms': uncached,
+        'dashboard_cold_fragment_cache_ms': cold,
+        'dashboard_warm_fragment_cache_ms': warm,
+        'fragment_cache_hits': app_module.fragment_cache.hits,
+        'template_load': template_load,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for benchmarks.
+
+Bulk-inserts users, agents, customers, orders (with secondary agents), chat messages
+with agent tags and contract rows into the configured database. Rows are
+generated from a seeded RNG, so the same arguments always produce the same
+dataset. Traffic is skewed like production: a small set of hot orders gets a
+large share of the chat messages.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.datagen --orders 100000 --messages 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATUSES = ['New Order', 'Under Booking', 'Booked', 'Received Contract', 'Archived']
+YARN_TYPES = ['Cotton 30s', 'Combed Cotton 40s', 'Merino Wool', 'Silk Blend', 'Polyester 150D', 'Viscose 30s']
+MESSAGE_WORDS = ['price', 'booking', 'shipment', 'sample', 'lot', 'confirm', 'contract', 'delivery', 'quality', 'rate',
+                 'spinner', 'mill', 'LC', 'invoice', 'dyeing', 'count', 'twist', 'cone', 'pallet', 'update']
+
+# Dataset presets; "full" is the production-sized target
+SCALES = {
+    'small': {'users': 20, 'agents': 5, 'orders': 2000, 'messages': 20000, 'contracts': 500},
+    'medium': {'users': 100, 'agents': 20, 'orders': 20000, 'messages': 200000, 'contracts': 5000},
+    'full': {'users': 500, 'agents': 50, 'orders': 100000, 'messages': 1000000, 'contracts': 25000},
+}
+
+# Share of messages that land on the hottest 1% of orders
+HOT_MESSAGE_SHARE = 0.2
+# Share of messages that tag an agent
+TAGGED_MESSAGE_SHARE = 0.1
+# Share of orders with a second agent in order_agent
+MULTI_AGENT_SHARE = 0.15
+BATCH_SIZE = 20000
+
+
+def insert_batches(app_module, model, rows):
+    """Insert an iterable of row dicts in executemany batches"""
+    db = app_module.db
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def generate(app_module, users, agents, orders, messages, contracts, seed=42):
+    """Populate the database; returns row counts and timings. Must run inside an app context."""
+    db = app_module.db
+    User, Customer, Order, OrderAgent = app_module.User, app_module.Customer, app_module.Order, app_module.OrderAgent
+    ChatMessage, ChatTag, Contract = app_module.ChatMessage, app_module.ChatTag, app_module.Contract
+    rng = random.Random(seed)
+    timings = {}
+    now = datetime.utcnow()
+
+    start = time.perf_counter()
+    # One hash for every generated account keeps generation fast
+    password_hash = app_module.generate_password_hash('bench123')
+    user_rows = [{'username': f"bench{seed}_agent{i}", 'email': f"bench{seed}_agent{i}@example.com", 'role': 'agent'} for i in range(agents)]
+    user_rows += [{'username': f"bench{seed}_user{i}", 'email': f"bench{seed}_user{i}@example.com", 'role': 'user'} for i in range(users)]
+    for row in user_rows:
+        row.update(password_hash=password_hash, created_at=now, is_active=True)
+    insert_batches(app_module, User, user_rows)
+    app_module.bump_reference_version('users')
+    db.session.commit()
+    agent_ids = [row.id for row in db.session.query(User.id).filter(User.role == 'agent')]
+    user_ids = [row.id for row in db.session.query(User.id).filter(User.role == 'user')]
+    admin_ids = [row.id for row in db.session.query(User.id).filter(User.role == 'admin')]
+    timings['users_s'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    customer_names = [f"Bench{seed} Customer {i}" for i in range(max(orders // 50, 1))]
+    insert_batches(app_module, Customer, (
+        {'name': name, 'normalized_name': app_module.normalize_name(name), 'created_at': now} for name in customer_names))
+    app_module.bump_reference_version('customers')
+    db.session.commit()
+    customer_ids = {row.name: row.id for row in db.session.query(Customer.id, Customer.name).filter(Customer.name.in_(customer_names))}
+    yarn_type_ids = {name: yarn.id for name, yarn in app_module.resolve_yarn_types(YARN_TYPES).items()}
+    db.session.commit()
+    
+    def order_rows():
+        for i in range(orders):
+            created = now - timedelta(minutes=orders - i)
+            customer_name = rng.choice(customer_names)
+            yarn_type = rng.choice(YARN_TYPES)
+            yield {
+                'order_id': f"BENCH-{seed}-{i:07d}",
+                'customer_name': customer_name,
+                'customer_id': customer_ids[customer_name],
+                'yarn_type': yarn_type,
+                'yarn_type_id': yarn_type_ids[yarn_type],
+                'quantity_kg': round(rng.uniform(100, 5000), 2),
+                'startup_date': date.today() + timedelta(days=rng.randint(-365, 60)),
+                'order_type': rng.choice(['Local', 'Export']),
+                'amount_usd': round(rng.uniform(500, 50000), 2),
+                'status': rng.choice(STATUSES),
+                'created_by': rng.choice(user_ids),
+                'assigned_agent': rng.choice(agent_ids) if rng.random() < 0.9 else None,
+                'created_at': created,
+                'updated_at': created,
+                'version': 1,
+            }
+    insert_batches(app_module, Order, order_rows())
+    order_ids = [row.id for row in db.session.query(Order.id).filter(Order.order_id.like(f"BENCH-{seed}-%")).order_by(Order.id)]
+    insert_batches(app_module, OrderAgent, (
+        {'order_id': order_id, 'agent_id': rng.choice(agent_ids), 'assigned_at': now}
+        for order_id in order_ids if rng.random() < MULTI_AGENT_SHARE
+    ))
+    timings['orders_s'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    hot_orders = order_ids[:max(len(order_ids) // 100, 1)]
+    senders = admin_ids + agent_ids + user_ids
+    first_message = (db.session.query(db.func.max(ChatMessage.id)).scalar() or 0) + 1
+    def message_rows():
+        for i in range(messages):
+            order_id = rng.choice(hot_orders) if rng.random() < HOT_MESSAGE_SHARE else rng.choice(order_ids)
+            yield {
+                'order_id': order_id,
+                'sender_id': rng.choice(senders),
+                'message': ' '.join(rng.choice(MESSAGE_WORDS) for _ in range(rng.randint(3, 25))),
+                'created_at': now - timedelta(seconds=messages - i),
+            }
+    insert_batches(app_module, ChatMessage, message_rows())
+    message_ids = [row.id for row in db.session.query(ChatMessage.id).filter(ChatMessage.id >= first_message)]
+    insert_batches(app_module, ChatTag, (
+        {'message_id': message_id, 'agent_id': rng.choice(agent_ids)}
+        for message_id in message_ids if rng.random() < TAGGED_MESSAGE_SHARE
+    ))
+    timings['messages_s'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    insert_batches(app_module, Contract, (
+        {
+            'order_id': order_id,
+            'filename': f"contract_{order_id}.pdf",
+            'file_path': f"uploads/bench_contract_{order_id}.pdf",
+            'uploaded_by': rng.choice(admin_ids + agent_ids),
+            'uploaded_at': now,
+        }
+        for order_id in rng.sample(order_ids, min(contracts, len(order_ids)))
+    ))
+    timings['contracts_s'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    # Rows were bulk-inserted around the ORM, so the report rollup and agent workloads are rebuilt once at the end
+    app_module.rebuild_order_rollups()
+    app_module.rebuild_agent_workload()
+    timings['rollups_s'] = round(time.perf_counter() - start, 2)
+
+    return {
+        'seed': seed,
+        'users': users,
+        'agents': agents,
+        'orders': orders,
+        'messages': messages,
+        'contracts': min(contracts, len(order_ids)),
+        'hot_order_ids': hot_orders[:5],
+        'timings': timings,
+    }
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='full', help='dataset preset (default: full)')
+    for name in ('users', 'agents', 'orders', 'messages', 'contracts'):
+        parser.add_argument(f"--{name}", type=int, help=f"override the preset's {name} count")
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def dataset_options(args):
+    options = dict(SCALES[args.scale])
+    for name in options:
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    options['seed'] = args.seed
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.init_db()
+        app_module.seed_db()
+        summary = generate(app_module, **dataset_options(args))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
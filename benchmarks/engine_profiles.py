@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the database engine profiles in app.py.
+
+Several processes (standing in for gunicorn workers) run a mixed read/write
+workload against the same database. It compares the old default (SQLite
+rollback journal, no busy timeout) with each named profile.
+
+    python -m benchmarks.engine_profiles --workers 8 --ops 400
+    python -m benchmarks.engine_profiles --postgres-url postgresql://localhost/bench
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, func, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+metadata = MetaData()
+bench_order = Table(
+    'bench_order', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('status', String(50), nullable=False),
+    Column('amount_usd', Float, nullable=False),
+)
+
+STATUSES = ['New Order', 'Under Booking', 'Booked', 'Received Contract', 'Archived']
+
+
+def make_engine(url, profile):
+    """Build an engine the way app.py would for the given profile"""
+    import app
+
+    if profile == 'sqlite-rollback':
+        # The pre-profile behaviour: rollback journal and no busy timeout
+        return create_engine(url, connect_args={'timeout': 0})
+
+    engine = create_engine(url, **app.ENGINE_PROFILES[profile]['engine_options'])
+    app.configure_engine(engine, profile)
+    return engine
+
+
+def worker(url, profile, ops, write_ratio, results):
+    engine = make_engine(url, profile)
+    latencies = []
+    errors = 0
+    for _ in range(ops):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if random.random() < write_ratio:
+                    conn.execute(bench_order.insert().values(status=random.choice(STATUSES), amount_usd=random.uniform(100, 5000)))
+                else:
+                    conn.execute(select(bench_order.c.status, func.count(), func.sum(bench_order.c.amount_usd)).group_by(bench_order.c.status)).all()
+        except Exception:
+            # "database is locked" and friends
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def run_profile(url, profile, workers, ops, write_ratio):
+    engine = make_engine(url, profile)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(bench_order.insert(), [{'status': random.choice(STATUSES), 'amount_usd': 1000.0} for _ in range(1000)])
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(url, profile, ops, write_ratio, results)) for _ in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in collected for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in collected)
+    total = len(latencies)
+    return {
+        'profile': profile,
+        'workers': workers,
+        'operations': total,
+        'errors': errors,
+        'throughput_ops_per_sec': round((total - errors) / elapsed, 1),
+        'p50_ms': round(latencies[total // 2] * 1000, 2),
+        'p95_ms': round(latencies[int(total * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=400, help='operations per worker')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--postgres-url', help='also benchmark the postgres profile against this database')
+    args = parser.parse_args()
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ['sqlite-rollback', 'sqlite']:
+            url = f"sqlite:///{os.path.join(tmp, profile + '.db')}"
+            reports.append(run_profile(url, profile, args.workers, args.ops, args.write_ratio))
+
+    if args.postgres_url:
+        reports.append(run_profile(args.postgres_url, 'postgres', args.workers, args.ops, args.write_ratio))
+
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Gunicorn worker class benchmark.
+
+Generates a dataset in a throwaway SQLite database, then starts gunicorn
+with gunicorn.conf.py once per worker class (sync, gthread, and gevent when
+it is installed). Each run is driven by concurrent keep-alive clients against
+/dashboard and /chat/<hot order> as the admin, and reports throughput and
+latency percentiles as JSON.
+
+    python -m benchmarks.gunicorn_workers --scale small --workers 3 --concurrency 16 --duration 10
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import SCALES
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urllib.parse.urlencode({'username': 'admin', 'password': 'admin123'})
+    conn.request('POST', '/login', body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f"login failed with {response.status}")
+    return cookie.split(';', 1)[0]
+
+
+def drive(port, path, cookie, concurrency, duration):
+    """Hit path from concurrent keep-alive clients for duration seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie, 'Accept-Encoding': 'gzip'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(response.status)
+                local.append((time.perf_counter() - start) * 1000)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None,
+    }
+
+
+def run_worker_class(worker_class, env, args, hot_order_id):
+    port = free_port()
+    env = dict(env, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_BIND=f"127.0.0.1:{port}",
+               WEB_CONCURRENCY=str(args.workers), GUNICORN_ACCESS_LOG='', GUNICORN_LOG_LEVEL='warning')
+    if args.threads:
+        env['GUNICORN_THREADS'] = str(args.threads)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        wait_until_up(port, process)
+        cookie = login(port)
+        results = {}
+        for name, path in (('dashboard', '/dashboard'), ('chat', f"/chat/{hot_order_id}")):
+            drive(port, path, cookie, args.concurrency, 1)  # warm up caches and connections
+            results[name] = drive(port, path, cookie, args.concurrency, args.duration)
+            print(f"{worker_class} {name}: {results[name]}", file=sys.stderr)
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() * 2 + 1)
+    parser.add_argument('--threads', type=int, help='threads per gthread worker (default: gunicorn.conf.py)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--worker-class', action='append', dest='worker_classes',
+                        help='worker class to run (repeatable; default: sync, gthread and gevent if installed)')
+    args = parser.parse_args()
+
+    worker_classes = args.worker_classes or ['sync', 'gthread'] + (['gevent'] if importlib.util.find_spec('gevent') else [])
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+               JINJA_CACHE_DIR=os.path.join(tmp, 'jinja'), CACHE_PATH=os.path.join(tmp, 'cache.db'))
+    generated = subprocess.run([sys.executable, '-m', 'benchmarks.datagen', '--scale', args.scale],
+                               cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    dataset = json.loads(generated.stdout[generated.stdout.index('{'):])
+
+    results = {
+        'cpu_count': os.cpu_count(),
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'dataset': {key: dataset[key] for key in ('orders', 'messages')},
+        'worker_classes': {},
+    }
+    for worker_class in worker_classes:
+        results['worker_classes'][worker_class] = run_worker_class(worker_class, env, args, dataset['hot_order_ids'][0])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
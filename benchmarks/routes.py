@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+In-process route benchmarks on a synthetic dataset.
+
+Generates a dataset with benchmarks.datagen (or reuses an existing database
+with --reuse), then times the main pages through Flask's test client:
+dashboard for each role, chat on a hot order, send_message, reports,
+admin_stats and export_orders. Page caches are cleared before every timed
+request so the numbers reflect the real query and render work.
+
+Results are printed as JSON. With --baseline the run is compared against a
+saved result file and the exit status is 1 if any case regressed by more
+than --threshold.
+
+    python -m benchmarks.routes --scale small --output current.json
+    python -m benchmarks.routes --scale small --baseline baseline.json --threshold 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import add_dataset_arguments, dataset_options, generate
+
+
+def login_as(client, user):
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(user_id=user.id, username=user.username, role=user.role)
+
+
+def build_cases(app_module, hot_order_id):
+    """(name, role, method, path, json body) for every benchmarked request"""
+    return [
+        ('dashboard_admin', 'admin', 'GET', '/dashboard', None),
+        ('dashboard_agent', 'agent', 'GET', '/dashboard', None),
+        ('dashboard_user', 'user', 'GET', '/dashboard', None),
+        ('chat', 'admin', 'GET', f"/chat/{hot_order_id}", None),
+        ('send_message', 'admin', 'POST', '/send_message', {'order_id': hot_order_id, 'message': 'Benchmark message'}),
+        ('reports', 'admin', 'GET', '/reports', None),
+        ('admin_stats', 'admin', 'GET', '/admin_stats', None),
+        ('export_orders', 'admin', 'GET', '/export_orders', None),
+    ]
+
+
+def clear_caches(app_module):
+    app_module.response_cache.clear()
+    app_module.fragment_cache.clear()
+
+
+def run_case(app_module, client, method, path, body, repeat, warmup):
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    statements = [0]
+    def count_statement(*args):
+        statements[0] += 1
+
+    timings = []
+    app_module.event.listen(engine, 'after_cursor_execute', count_statement)
+    try:
+        for i in range(warmup + repeat):
+            clear_caches(app_module)
+            statements[0] = 0
+            # Routes print debug output; keep it out of the JSON on stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                response = client.open(path, method=method, json=body)
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}")
+            if i >= warmup:
+                timings.append(elapsed)
+    finally:
+        app_module.event.remove(engine, 'after_cursor_execute', count_statement)
+
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 2),
+        'min_ms': round(timings[0], 2),
+        'queries': statements[0],
+        'response_bytes': len(response.data),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Per-case ratio against the baseline; returns (report, regressed case names)"""
+    report = {}
+    regressions = []
+    for name, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous:
+            continue
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else 1.0
+        regressed = ratio > 1 + threshold
+        report[name] = {
+            'baseline_ms': previous['median_ms'],
+            'current_ms': current['median_ms'],
+            'ratio': round(ratio, 3),
+            'baseline_queries': previous.get('queries'),
+            'current_queries': current['queries'],
+            'regressed': regressed,
+        }
+        if regressed:
+            regressions.append(name)
+    return report, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--only', action='append', help='run only the named case (repeatable)')
+    parser.add_argument('--reuse', metavar='DATABASE_URL', help='benchmark an existing generated database instead of generating one')
+    parser.add_argument('--output', help='also write the JSON result to this file')
+    parser.add_argument('--baseline', help='compare against a previous result file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before failing (default: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.reuse or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ.setdefault('JINJA_CACHE_DIR', os.path.join(tmp, 'jinja'))
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as app_module
+
+    with app_module.app.app_context():
+        if args.reuse:
+            dataset = {'reused': args.reuse}
+            hot_order_id = app_module.db.session.query(app_module.ChatMessage.order_id).group_by(
+                app_module.ChatMessage.order_id).order_by(app_module.db.func.count().desc()).limit(1).scalar()
+        else:
+            app_module.init_db()
+            app_module.seed_db()
+            dataset = generate(app_module, **dataset_options(args))
+            hot_order_id = dataset['hot_order_ids'][0]
+        User, Order = app_module.User, app_module.Order
+        admin = User.query.filter_by(role='admin').first()
+        order = Order.query.get(hot_order_id)
+        # Pick the agent and user with the most orders so their boards are realistic
+        agent = User.query.get(app_module.db.session.query(Order.assigned_agent).filter(Order.assigned_agent.isnot(None)).group_by(
+            Order.assigned_agent).order_by(app_module.db.func.count().desc()).limit(1).scalar())
+        user = User.query.get(order.created_by)
+        accounts = {'admin': admin, 'agent': agent, 'user': user}
+        for account in accounts.values():
+            app_module.db.session.expunge(account)
+
+    client = app_module.app.test_client()
+    cases = {}
+    for name, role, method, path, body in build_cases(app_module, hot_order_id):
+        if args.only and name not in args.only:
+            continue
+        login_as(client, accounts[role])
+        cases[name] = run_case(app_module, client, method, path, body, args.repeat, args.warmup)
+        print(f"{name}: {cases[name]['median_ms']} ms, {cases[name]['queries']} queries", file=sys.stderr)
+
+    results = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': app_module.DATABASE_URL.split('://', 1)[0],
+        'repeat': args.repeat,
+        'dataset': dataset,
+        'cases': cases,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results['comparison'], regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            exit_code = 1
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
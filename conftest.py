@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Shared setup for the in-process tests: the app is imported once against a
+temporary database, and each behavior test starts from empty tables.
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import tempfile
+
+import pytest
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'tests.db')}")
+os.environ.setdefault('JINJA_CACHE_DIR', os.path.join(TMP_DIR, 'jinja'))
+os.environ.setdefault('PROFILE_DIR', os.path.join(TMP_DIR, 'profiles'))
+os.environ.setdefault('CACHE_PATH', os.path.join(TMP_DIR, 'cache.db'))
+os.environ.setdefault('AUTO_INIT_DB', '0')
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+
+db = app_module.db
+cache_files = itertools.count()
+
+
+def reset_process_state():
+    """Forget everything the process remembers between requests"""
+    for cache in (app_module.response_cache, app_module.fragment_cache):
+        cache.clear()
+    for reference in (app_module.user_reference_data, app_module.customer_reference_data,
+                      app_module.yarn_type_reference_data):
+        reference._version = None
+    # A cache file of its own, so shared presence and rate-limit stores start empty too
+    app_module.CACHE_PATH = os.path.join(TMP_DIR, f"cache-{next(cache_files)}.db")
+    app_module.presence = app_module.PRESENCE_BACKENDS[app_module.PRESENCE_BACKEND]()
+    app_module.rate_limiter = app_module.RATE_LIMIT_BACKENDS[app_module.RATE_LIMIT_BACKEND]()
+    app_module.workload_agent_ids.clear()
+
+
+@pytest.fixture
+def fresh_db():
+    """Empty tables for one test, dropped again afterwards so later modules start clean"""
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+    reset_process_state()
+    yield db
+    with app_module.app.app_context():
+        db.session.remove()
+        db.drop_all()
+    reset_process_state()
+
+
+@pytest.fixture
+def users(fresh_db):
+    """{'admin': id, 'agent1': id, 'agent2': id, 'user': id}"""
+    with app_module.app.app_context():
+        rows = [app_module.User(username='admin', email='admin@example.com', password_hash='-', role='admin'),
+                app_module.User(username='agent1', email='agent1@example.com', password_hash='-', role='agent'),
+                app_module.User(username='agent2', email='agent2@example.com', password_hash='-', role='agent'),
+                app_module.User(username='user', email='user@example.com', password_hash='-', role='user')]
+        db.session.add_all(rows)
+        app_module.bump_reference_version('users')
+        db.session.commit()
+        return {row.username: row.id for row in rows}
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def login(client, user_id, role):
+    """Put the user in the client's session the way /login does"""
+    with app_module.app.app_context():
+        username = db.session.get(app_module.User, user_id).username
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(user_id=user_id, username=username, role=role)
+
+
+def make_order(created_by, order_id='PO-1000', **fields):
+    """Insert an order row directly; returns its primary key"""
+    values = dict(customer_name='Acme', yarn_type='Cotton 30s', quantity_kg=100, order_type='Local', amount_usd=50,
+                  startup_date=app_module.datetime(2030, 1, 1).date(), status='New Order')
+    values.update(fields)
+    with app_module.app.app_context():
+        order = app_module.Order(order_id=order_id, created_by=created_by, **values)
+        db.session.add(order)
+        db.session.commit()
+        return order.id
@@ -0,0 +1,61 @@
+"""
+Gunicorn settings for production (`gunicorn app:app` picks this file up automatically).
+
+The app is preloaded in the master, which creates the schema once. Workers are
+forked afterwards and start with empty connection pools. Every value can be
+overridden from the environment; see DEPLOYMENT.md.
+"""
+
+import multiprocessing
+import os
+import sys
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+
+# gthread suits this app: requests mostly wait on the database and each thread reuses pooled connections
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpu_count * 2 + 1, 12)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '200'))
+
+# Per-process caches would let each worker serve pages another worker's writes invalidated; the
+# app reads this when the preloaded (or forked) import runs, which is after this file
+if workers > 1:
+    os.environ.setdefault('CACHE_BACKEND', 'sqlite')
+
+if worker_class == 'gevent':
+    # Patch before the preloaded app creates its locks and sockets
+    from gevent import monkey
+    monkey.patch_all()
+
+# Import once in the master so workers share its memory pages and skip the import
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers now and then to cap slow memory growth; jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """Master hook, after preloading and before the first fork"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.prepare_for_fork()
+        server.log.info("Schema ready; connection pools emptied before forking workers")
+
+
+def post_fork(server, worker):
+    """Worker hook: never reuse database connections inherited from the master"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.dispose_engines(close=False)
@@ -646,6 +646,8 @@ function logout() {
 
 // Utility functions
 function moveCardToStatus(orderId, newStatus) {
+    const card = document.querySelector(`.card[data-order-id="${orderId}"]`);
+    
     fetch('/move_order', {
         method: 'POST',
         headers: {
@@ -653,17 +655,23 @@ function moveCardToStatus(orderId, newStatus) {
         },
         body: JSON.stringify({
             order_id: parseInt(orderId),
-            status: newStatus
+            status: newStatus,
+            version: card ? parseInt(card.dataset.version) : null
         })
     })
     .then(response => response.json())
     .then(data => {
-        if (!data.success) {
-            showNotification(data.message || 'Failed to move order', 'error');
-            // Revert the move
+        // The response carries the server's copy of the card; patch it in place
+        if (data.cards && data.cards.length) {
+            patchOrderCards(data.cards);
+        } else if (!data.success) {
             setTimeout(() => {
                 location.reload();
             }, 2000);
+        }
+        
+        if (!data.success) {
+            showNotification(data.message || 'Failed to move order', 'error');
         } else {
             showNotification('Order moved successfully!', 'success');
         }
@@ -678,6 +686,15 @@ function moveCardToStatus(orderId, newStatus) {
     });
 }
 
+// Rebind futuristic effects on cards replaced by patchOrderCards
+document.addEventListener('ordercard:patched', function(e) {
+    const card = e.detail.element;
+    card.addEventListener('dragstart', handleAdvancedDragStart);
+    card.addEventListener('dragend', handleAdvancedDragEnd);
+    card.addEventListener('mouseenter', handleCardHover);
+    card.addEventListener('mouseleave', handleCardLeave);
+});
+
 function showNotification(message, type) {
     const notification = document.createElement('div');
     notification.className = `notification notification-${type} fade-in`;
@@ -9,11 +9,20 @@ document.addEventListener('DOMContentLoaded', function() {
         initializeDragAndDrop();
     }
     
+    // Patch the board from the change feed instead of reloading
+    initializeChangeFeed();
+    
+    // Heartbeats and online/viewing indicators on the dashboard and chat pages
+    initializePresence();
+    
     // Initialize chat functionality if on chat page
     if (document.querySelector('.chat-container')) {
         initializeChat();
     }
     
+    // Customer name suggestions on order forms and filters
+    initializeCustomerAutocomplete();
+    
     // Initialize modals
     initializeModals();
     
@@ -131,6 +140,8 @@ function handleDrop(e) {
 function moveCard(orderId, newStatus) {
     showLoading(true);
     
+    const card = document.querySelector(`.card[data-order-id="${orderId}"]`);
+    
     fetch('/move_order', {
         method: 'POST',
         headers: {
@@ -138,16 +149,17 @@ function moveCard(orderId, newStatus) {
         },
         body: JSON.stringify({
             order_id: orderId,
-            new_status: newStatus
+            new_status: newStatus,
+            version: card ? parseInt(card.dataset.version) : null
         })
     })
     .then(response => response.json())
     .then(data => {
         showLoading(false);
+        // Server returns the current card either way, so patch instead of reloading
+        patchOrderCards(data.cards || []);
         if (!data.success) {
             showNotification(data.message, 'error');
-            // Revert the move
-            location.reload();
         } else {
             showNotification('Order moved successfully!', 'success');
         }
@@ -159,6 +171,228 @@ function moveCard(orderId, newStatus) {
     });
 }
 
+// Replace or move board cards with fresh markup returned by the server
+function patchOrderCards(cards) {
+    cards.forEach(cardData => {
+        const existing = document.querySelector(`.card[data-order-id="${cardData.id}"]`);
+        const column = document.querySelector(`.column[data-status="${cardData.status}"] .cards-container`);
+        
+        if (!column) {
+            // Order left the visible board (e.g. confirmed or deleted)
+            if (existing) {
+                existing.remove();
+            }
+            return;
+        }
+        
+        const template = document.createElement('template');
+        template.innerHTML = cardData.html.trim();
+        const element = template.content.firstElementChild;
+        
+        if (existing && existing.parentElement === column) {
+            existing.replaceWith(element);
+        } else {
+            if (existing) {
+                existing.remove();
+            }
+            column.prepend(element);
+        }
+        
+        element.addEventListener('dragstart', handleDragStart);
+        element.addEventListener('dragend', handleDragEnd);
+        document.dispatchEvent(new CustomEvent('ordercard:patched', { detail: { element: element } }));
+    });
+    
+    updateColumnCounts();
+}
+
+function updateColumnCounts() {
+    document.querySelectorAll('.column').forEach(column => {
+        const count = column.querySelector('.column-count');
+        if (count) {
+            count.textContent = column.querySelectorAll('.card').length;
+        }
+    });
+}
+
+window.patchOrderCards = patchOrderCards;
+
+// When the server sheds load (429/503), the time to wait until before asking again; 0 otherwise
+function retryAfter(response) {
+    if (response.status !== 429 && response.status !== 503) {
+        return 0;
+    }
+    return Date.now() + (parseInt(response.headers.get('Retry-After')) || 5) * 1000;
+}
+
+// Poll /api/changes from the cursor the page was rendered at and patch changed cards in place
+const CHANGE_POLL_INTERVAL = 5000;
+
+function initializeChangeFeed() {
+    const board = document.querySelector('.board-container[data-changes-cursor]');
+    if (!board) {
+        return;
+    }
+    
+    let cursor = board.dataset.changesCursor;
+    let polling = false;
+    let retryAt = 0;
+    
+    function pollChanges() {
+        if (polling || document.hidden || Date.now() < retryAt) {
+            return;
+        }
+        polling = true;
+        
+        // Send the page's own search and filters, so cards that stop matching are dropped
+        const params = new URLSearchParams(window.location.search);
+        params.set('since', cursor);
+        
+        fetch(`/api/changes?${params}`, { headers: { 'Accept': 'application/json' } })
+        .then(response => {
+            retryAt = retryAfter(response);
+            return retryAt ? null : response.json();
+        })
+        .then(data => {
+            polling = false;
+            if (!data) {
+                return;
+            }
+            if (data.reset) {
+                // The feed no longer reaches back to this page's cursor
+                location.reload();
+                return;
+            }
+            cursor = data.cursor;
+            
+            // Cards this tab already shows at the same version (e.g. its own moves) are left alone
+            const cards = (data.cards || []).filter(cardData => {
+                const existing = document.querySelector(`.card[data-order-id="${cardData.id}"]`);
+                const column = existing ? existing.closest('.column') : null;
+                return !existing || parseInt(existing.dataset.version) !== cardData.version ||
+                    !column || column.dataset.status !== cardData.status;
+            });
+            if (cards.length) {
+                patchOrderCards(cards);
+            }
+            
+            (data.removed || []).forEach(orderId => {
+                const existing = document.querySelector(`.card[data-order-id="${orderId}"]`);
+                if (existing) {
+                    existing.remove();
+                }
+            });
+            if (data.removed && data.removed.length) {
+                updateColumnCounts();
+            }
+            
+            if (data.more) {
+                pollChanges();
+            }
+        })
+        .catch(error => {
+            polling = false;
+            console.error('Error polling order changes:', error);
+        });
+    }
+    
+    setInterval(pollChanges, CHANGE_POLL_INTERVAL);
+    // Catch up as soon as a background tab becomes visible again
+    document.addEventListener('visibilitychange', pollChanges);
+}
+
+// Heartbeat while the page is visible; the server forgets a user PRESENCE_TTL seconds after the last one
+const PRESENCE_INTERVAL = 15000;
+
+function initializePresence() {
+    const container = document.querySelector('[data-presence-order]');
+    if (!container) {
+        return;
+    }
+    
+    const orderId = container.dataset.presenceOrder ? parseInt(container.dataset.presenceOrder) : null;
+    let viewers = {};
+    let retryAt = 0;
+    
+    function showViewers(card) {
+        const header = card.querySelector('.card-header');
+        let badge = card.querySelector('.card-viewers');
+        const people = viewers[card.dataset.orderId];
+        if (!people) {
+            if (badge) {
+                badge.remove();
+            }
+            return;
+        }
+        if (!badge && header) {
+            badge = document.createElement('span');
+            badge.className = 'card-viewers';
+            header.insertBefore(badge, header.querySelector('.card-status'));
+        }
+        if (badge) {
+            badge.innerHTML = `<i class="fas fa-eye"></i> ${people.length}`;
+            badge.title = 'Viewing: ' + people.map(person => person.username).join(', ');
+        }
+    }
+    
+    function showOnline(online) {
+        document.querySelectorAll('.participant-item[data-user-id]').forEach(item => {
+            const isOnline = online.has(parseInt(item.dataset.userId));
+            const indicator = item.querySelector('.online-indicator');
+            if (indicator) {
+                indicator.classList.toggle('online', isOnline);
+                indicator.classList.toggle('offline', !isOnline);
+            }
+            const status = item.querySelector('.participant-status');
+            if (status) {
+                status.innerHTML = isOnline ?
+                    '<span style="color: var(--status-green);">● Online</span>' :
+                    '<span style="color: rgba(255, 255, 255, 0.5);">● Offline</span>';
+            }
+        });
+    }
+    
+    function heartbeat() {
+        if (document.hidden || Date.now() < retryAt) {
+            return;
+        }
+        // One request both records the heartbeat and looks up everyone shown on the page
+        const users = Array.from(document.querySelectorAll('.participant-item[data-user-id]'), item => item.dataset.userId);
+        const orders = Array.from(document.querySelectorAll('.card[data-order-id]'), card => card.dataset.orderId);
+        
+        fetch('/api/presence', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ order_id: orderId, users: users, orders: orders })
+        })
+        .then(response => {
+            retryAt = retryAfter(response);
+            return retryAt ? null : response.json();
+        })
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            viewers = data.viewers || {};
+            showOnline(new Set(data.online || []));
+            document.querySelectorAll('.card[data-order-id]').forEach(showViewers);
+        })
+        .catch(error => console.error('Error sending presence heartbeat:', error));
+    }
+    
+    // Rendering the page already counted as a heartbeat; this first call fetches who else is here
+    heartbeat();
+    setInterval(heartbeat, PRESENCE_INTERVAL);
+    document.addEventListener('visibilitychange', heartbeat);
+    // Cards replaced by the change feed get their badge back straight away
+    document.addEventListener('ordercard:patched', event => showViewers(event.detail.element));
+    // End this page's view now rather than when it expires
+    window.addEventListener('pagehide', () => {
+        navigator.sendBeacon('/api/presence', new Blob([JSON.stringify({ order_id: orderId, leaving: true })],
+            { type: 'application/json' }));
+    });
+}
+
 function initializeChat() {
     const chatForm = document.getElementById('chatForm');
     const messageInput = document.getElementById('messageInput');
@@ -269,6 +503,50 @@ function refreshChatMessages() {
     }
 }
 
+// Wait for a pause in typing before asking the server
+const CUSTOMER_LOOKUP_DELAY = 200;
+
+function initializeCustomerAutocomplete() {
+    document.querySelectorAll('input[data-customer-autocomplete]').forEach((input, i) => {
+        const list = document.createElement('datalist');
+        list.id = `customerSuggestions${i}`;
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+        
+        let lastQuery = '';
+        let timer = null;
+        let controller = null;
+        const lookup = () => {
+            const query = input.value.trim();
+            if (!query || query === lastQuery) return;
+            lastQuery = query;
+            // Only the newest query matters; drop the one still in flight
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch(`/api/customers?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+                .then(response => response.json())
+                .then(data => {
+                    // Ignore answers to queries the user has typed past
+                    if (!data.success || query !== lastQuery) return;
+                    list.innerHTML = '';
+                    data.customers.forEach(customer => {
+                        const option = document.createElement('option');
+                        option.value = customer.name;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') console.error('Customer lookup failed:', error);
+                });
+        };
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(lookup, CUSTOMER_LOOKUP_DELAY);
+        });
+    });
+}
+
 function initializeModals() {
     // Close modals when clicking outside
     window.addEventListener('click', function(event) {
@@ -469,8 +747,8 @@ window.deleteOrder = function(orderId) {
                 // Show success message
                 alert('Order deleted successfully');
                 
-                // Reload the page to update the dashboard
-                location.reload();
+                // Keep the column counters in sync without reloading the board
+                updateColumnCounts();
             } else {
                 alert('Error: ' + data.message);
             }
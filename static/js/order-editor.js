@@ -3,6 +3,11 @@
 let formData = {};
 let originalFormData = {};
 let hasUnsavedChanges = false;
+// Field values the server-side draft already holds; autosave only sends what differs
+let lastSavedData = {};
+let autoSaveTimer = null;
+let draftConflict = false;
+const AUTO_SAVE_DELAY = 2000;
 
 // Initialize order editor
 document.addEventListener('DOMContentLoaded', function() {
@@ -15,6 +20,7 @@ document.addEventListener('DOMContentLoaded', function() {
 function initializeOrderEditor() {
     // Store original form data
     storeOriginalFormData();
+    restoreDraft();
     
     // Add real-time form monitoring
     const form = document.getElementById('orderForm');
@@ -42,17 +48,85 @@ function initializeOrderEditor() {
     window.addEventListener('beforeunload', handleBeforeUnload);
 }
 
-function storeOriginalFormData() {
+function collectFormValues() {
     const form = document.getElementById('orderForm');
     const inputs = form.querySelectorAll('input, select, textarea');
+    const values = {};
     
     inputs.forEach(input => {
-        if (input.name) {
-            originalFormData[input.name] = input.value;
+        if (!input.name || input.type === 'hidden') return;
+        if (input.type === 'checkbox') {
+            values[input.name] = values[input.name] || [];
+            if (input.checked) values[input.name].push(input.value);
+        } else {
+            values[input.name] = input.value;
+        }
+    });
+    if (values.agent_ids) values.agent_ids.sort();
+    return values;
+}
+
+function applyFormValues(values) {
+    const form = document.getElementById('orderForm');
+    form.querySelectorAll('input, select, textarea').forEach(input => {
+        if (!input.name || input.type === 'hidden' || values[input.name] === undefined) return;
+        if (input.type === 'checkbox') {
+            input.checked = values[input.name].includes(input.value);
+        } else {
+            input.value = values[input.name];
         }
     });
 }
 
+function storeOriginalFormData() {
+    originalFormData = collectFormValues();
+    lastSavedData = Object.assign({}, originalFormData);
+}
+
+function restoreDraft() {
+    // Unsaved edits from an earlier visit, rendered into the form by the server
+    const draft = JSON.parse(document.getElementById('orderForm').dataset.draft || 'null');
+    if (!draft || !Object.keys(draft).length) return;
+    
+    applyFormValues(draft);
+    lastSavedData = Object.assign({}, originalFormData, draft);
+    hasUnsavedChanges = true;
+    showNotification('Restored your unsaved changes', 'info');
+}
+
+function buildDraftPatch() {
+    // Fields changed since the last save; null drops a field that is back to the order's value
+    const current = collectFormValues();
+    const patch = {};
+    Object.keys(current).forEach(name => {
+        const value = JSON.stringify(current[name]);
+        if (value === JSON.stringify(lastSavedData[name])) return;
+        patch[name] = value === JSON.stringify(originalFormData[name]) ? null : current[name];
+    });
+    return {current, patch};
+}
+
+function postDraftPatch(url, patch) {
+    const form = document.getElementById('orderForm');
+    return fetch(url, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            order_id: form.querySelector('input[name="order_id"]').value,
+            base_version: form.querySelector('input[name="version"]').value,
+            patch: patch
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.conflict && !draftConflict) {
+            draftConflict = true;
+            showNotification(data.message, 'error');
+        }
+        return data;
+    });
+}
+
 function handleFieldChange(event) {
     const field = event.target;
     const fieldName = field.name;
@@ -60,6 +134,7 @@ function handleFieldChange(event) {
     if (fieldName) {
         formData[fieldName] = field.value;
         hasUnsavedChanges = true;
+        scheduleAutoSave();
         
         // Update section status
         updateSectionStatus(field);
@@ -85,26 +160,20 @@ function updateSectionStatus(field) {
     }
 }
 
+function normalizeCatalogName(name) {
+    // Same key as the server: case, punctuation and repeated whitespace are ignored
+    return name.toLowerCase().replace(/[^\p{L}\p{N}_\s]/gu, ' ').trim().split(/\s+/).join(' ');
+}
+
 function updateYarnPreview() {
-    const yarnType = document.getElementById('yarnType').value.toLowerCase();
+    const yarnType = normalizeCatalogName(document.getElementById('yarnType').value);
     const preview = document.querySelector('.yarn-preview-large');
+    const catalog = document.getElementById('yarnTypes');
     
-    if (preview) {
-        let gradient = '#667eea, #764ba2'; // Default
-        
-        if (yarnType.includes('cotton')) {
-            gradient = '#ff6b6b, #4ecdc4';
-        } else if (yarnType.includes('wool')) {
-            gradient = '#a8e6cf, #ffd93d';
-        } else if (yarnType.includes('silk')) {
-            gradient = '#ff9a9e, #fecfef';
-        } else if (yarnType.includes('polyester')) {
-            gradient = '#667eea, #764ba2';
-        } else if (yarnType.includes('acrylic')) {
-            gradient = '#4facfe, #00f2fe';
-        } else if (yarnType.includes('blend')) {
-            gradient = '#fa709a, #fee140';
-        }
+    if (preview && catalog) {
+        // Colors come precomputed from the yarn type catalog; new types get theirs when saved
+        const match = Array.from(catalog.options).find(option => normalizeCatalogName(option.value) === yarnType);
+        const gradient = match ? match.dataset.gradient : catalog.dataset.defaultGradient;
         
         preview.style.background = `linear-gradient(45deg, ${gradient})`;
         
@@ -285,24 +354,30 @@ function initializeAutoSave() {
     });
 }
 
+function scheduleAutoSave() {
+    // Coalesce a burst of keystrokes into one patch
+    clearTimeout(autoSaveTimer);
+    autoSaveTimer = setTimeout(autoSave, AUTO_SAVE_DELAY);
+}
+
 function autoSave() {
-    if (!hasUnsavedChanges) return;
+    clearTimeout(autoSaveTimer);
+    if (!hasUnsavedChanges || draftConflict) return;
     
-    const form = document.getElementById('orderForm');
-    const formData = new FormData(form);
+    const {current, patch} = buildDraftPatch();
+    if (!Object.keys(patch).length) return;
     
     // Show auto-save indicator
     showAutoSaveIndicator();
     
-    fetch('/auto_save_order', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    postDraftPatch('/auto_save_order', patch)
     .then(data => {
         if (data.success) {
+            lastSavedData = current;
             hasUnsavedChanges = false;
             showAutoSaveSuccess();
+        } else {
+            showAutoSaveError();
         }
     })
     .catch(error => {
@@ -388,14 +463,15 @@ function initializeFieldEffects() {
 function resetForm() {
     if (hasUnsavedChanges) {
         if (confirm('Are you sure you want to reset all changes? This action cannot be undone.')) {
-            const form = document.getElementById('orderForm');
-            const inputs = form.querySelectorAll('input, select, textarea');
+            applyFormValues(originalFormData);
             
-            inputs.forEach(input => {
-                if (input.name && originalFormData[input.name] !== undefined) {
-                    input.value = originalFormData[input.name];
-                }
-            });
+            // Drop the saved draft as well
+            const {current, patch} = buildDraftPatch();
+            if (Object.keys(patch).length) {
+                postDraftPatch('/auto_save_order', patch).then(data => {
+                    if (data.success) lastSavedData = current;
+                });
+            }
             
             hasUnsavedChanges = false;
             updateYarnPreview();
@@ -414,16 +490,13 @@ function resetForm() {
 }
 
 function saveDraft() {
-    const form = document.getElementById('orderForm');
-    const formData = new FormData(form);
+    clearTimeout(autoSaveTimer);
+    const {current, patch} = buildDraftPatch();
     
-    fetch('/save_draft', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    postDraftPatch('/save_draft', patch)
     .then(data => {
         if (data.success) {
+            lastSavedData = current;
             hasUnsavedChanges = false;
             showNotification('Draft saved successfully!', 'success');
         } else {
@@ -446,8 +519,10 @@ function submitForm() {
     submitBtn.innerHTML = '<div class="loading"></div> Updating...';
     submitBtn.disabled = true;
     
+    clearTimeout(autoSaveTimer);
     fetch('/update_order', {
         method: 'POST',
+        headers: {'Accept': 'application/json'},
         body: formData
     })
     .then(response => response.json())
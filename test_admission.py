@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Admission control: per-user token buckets answer 429 with Retry-After,
+and a full concurrency pool answers 503.
+"""
+
+import pytest
+
+from conftest import app_module, login
+
+
+def test_buckets_are_shared_between_workers_by_default(tmp_path):
+    assert app_module.RATE_LIMIT_BACKEND == 'sqlite'
+    path = str(tmp_path / 'cache.db')
+    # Two limiter instances on one file stand in for two worker processes
+    one, other = app_module.SQLiteRateLimiter(path=path), app_module.SQLiteRateLimiter(path=path)
+
+    assert one.take('send_message:1', 0.5, 2) == 0
+    assert other.take('send_message:1', 0.5, 2) == 0
+    assert one.take('send_message:1', 0.5, 2) == pytest.approx(2, abs=0.1)
+
+
+def test_over_the_limit_gets_429_with_retry_after(client, users):
+    login(client, users['agent1'], 'agent')
+    # Presence heartbeats: 5 at once, then 20 a minute (one every 3 seconds)
+    for _ in range(5):
+        assert client.post('/api/presence', json={}).status_code == 200
+
+    response = client.post('/api/presence', json={})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json()['success'] is False
+
+
+def test_buckets_are_per_user(client, users):
+    login(client, users['agent1'], 'agent')
+    for _ in range(6):
+        client.post('/api/presence', json={})
+
+    login(client, users['agent2'], 'agent')
+    assert client.post('/api/presence', json={}).status_code == 200
+
+
+def test_limits_can_be_switched_off(client, users, monkeypatch):
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_ENABLED', False)
+    login(client, users['agent1'], 'agent')
+
+    assert {client.post('/api/presence', json={}).status_code for _ in range(10)} == {200}
+
+
+def test_full_report_pool_gets_503(client, users, monkeypatch):
+    monkeypatch.setattr(app_module, 'CONCURRENCY_WAIT_SECONDS', 0.01)
+    pool = app_module.concurrency_pools['reports']
+    # Every slot is busy with another report
+    for _ in range(pool.limit):
+        assert pool.acquire(timeout=0)
+    try:
+        login(client, users['admin'], 'admin')
+        response = client.get('/reports/cycle_times', headers={'Accept': 'text/html'})
+    finally:
+        for _ in range(pool.limit):
+            pool.release()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.mimetype == 'text/plain'
+    assert client.get('/reports/cycle_times').status_code == 200
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Least-loaded assignment: the pick order, the routes that use it, and two
+picks at once not landing on the same agent.
+"""
+
+import pytest
+from sqlalchemy import exc as sa_exc
+
+from conftest import app_module, db, login, make_order
+
+User, AgentWorkload = app_module.User, app_module.AgentWorkload
+
+
+@pytest.fixture
+def agents(users):
+    """Three agents with loads set by each test; returns their ids in creation order"""
+    with app_module.app.app_context():
+        third = User(username='agent3', email='agent3@example.com', password_hash='-', role='agent')
+        db.session.add(third)
+        app_module.bump_reference_version('users')
+        db.session.commit()
+        return [users['agent1'], users['agent2'], third.id]
+
+
+def set_loads(loads):
+    """{agent id: (open orders, open kg)}"""
+    with app_module.app.app_context():
+        AgentWorkload.query.delete()
+        db.session.add_all([AgentWorkload(agent_id=agent_id, open_orders=count, open_kg=kg)
+                            for agent_id, (count, kg) in loads.items()])
+        db.session.commit()
+
+
+def pick(eligible_ids=None):
+    with app_module.app.app_context():
+        agent_id = app_module.least_loaded_agent(eligible_ids)
+        db.session.rollback()
+        return agent_id
+
+
+def test_fewest_open_orders_wins_then_fewest_kg_then_lowest_id(agents):
+    first, second, third = agents
+    set_loads({first: (2, 10.0), second: (1, 500.0), third: (1, 100.0)})
+    assert pick() == third
+
+    set_loads({first: (1, 100.0), second: (1, 100.0), third: (1, 100.0)})
+    assert pick() == first
+
+
+def test_only_active_and_eligible_agents_are_picked(agents):
+    first, second, third = agents
+    set_loads({first: (0, 0.0), second: (1, 0.0), third: (2, 0.0)})
+    with app_module.app.app_context():
+        User.query.filter_by(id=first).update({'is_active': False})
+        app_module.bump_reference_version('users')
+        db.session.commit()
+
+    assert pick() == second
+    assert pick({third}) == third
+    assert pick({first}) is None
+
+
+def test_agents_without_a_workload_row_count_as_idle(agents):
+    first, second, third = agents
+    set_loads({first: (1, 0.0), second: (1, 0.0)})
+
+    assert pick() == third
+
+
+def test_auto_assigned_orders_spread_over_the_agents(client, users, agents):
+    login(client, users['admin'], 'admin')
+    form = {'yarn_type': 'Cotton 30s', 'quantity_kg': '10', 'startup_date': '2030-01-01', 'order_type': 'Local',
+            'amount_usd': '5', 'auto_assign': '1'}
+    for customer in ('Alpha', 'Beta', 'Gamma', 'Delta'):
+        client.post('/create_order', data=dict(form, customer_name=customer))
+
+    with app_module.app.app_context():
+        assigned = [order.assigned_agent for order in app_module.Order.query.order_by(app_module.Order.id)]
+        loads = {row.agent_id: row.open_orders for row in AgentWorkload.query}
+    assert assigned == agents + [agents[0]]
+    assert loads == {agents[0]: 2, agents[1]: 1, agents[2]: 1}
+
+
+def test_confirm_auto_picks_among_the_orders_own_agents(client, users, agents):
+    first, second, third = agents
+    set_loads({first: (5, 0.0), second: (3, 0.0), third: (0, 0.0)})
+    order = make_order(users['admin'], assigned_agent=first)
+    with app_module.app.app_context():
+        db.session.add(app_module.OrderAgent(order_id=order, agent_id=second))
+        db.session.commit()
+    login(client, users['admin'], 'admin')
+
+    payload = client.post('/confirm_order_action', json={'order_id': order, 'selected_agent_id': 'auto'}).get_json()
+
+    assert payload['success'] is True
+    with app_module.app.app_context():
+        assert db.session.get(app_module.Order, order).assigned_agent == second
+
+
+def test_a_second_pick_cannot_use_the_same_stale_front(agents):
+    first, second, third = agents
+    set_loads({first: (0, 0.0), second: (1, 0.0), third: (2, 0.0)})
+
+    with app_module.app.app_context():
+        # Still holds its pick: the assignment has not committed yet
+        assert app_module.least_loaded_agent() == first
+        with app_module.app.app_context():
+            db.session.execute(db.text('PRAGMA busy_timeout = 0'))
+            with pytest.raises(sa_exc.OperationalError):
+                app_module.least_loaded_agent()
+            db.session.rollback()
+        AgentWorkload.query.filter_by(agent_id=first).update({'open_orders': 2})
+        db.session.commit()
+
+    # Once the first assignment is in, the next pick sees its load
+    assert pick() == second
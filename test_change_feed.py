@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+The dashboard change feed: cursor movement, gaps left by writes still in
+flight, removals, pruned history and paging.
+"""
+
+import pytest
+
+from conftest import app_module, db, login, make_order
+
+OrderChange = app_module.OrderChange
+
+
+def add_changes(*changes):
+    """(change id, order id, seconds ago) rows, inserted with explicit ids so tests can leave gaps"""
+    now = app_module.datetime.utcnow()
+    with app_module.app.app_context():
+        db.session.add_all([OrderChange(id=change_id, order_id=order_id, changed_at=now - app_module.timedelta(seconds=age))
+                            for change_id, order_id, age in changes])
+        db.session.commit()
+
+
+def poll(client, since='', **filters):
+    response = client.get('/api/changes', query_string=dict(filters, since=since))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.fixture
+def admin_client(client, users):
+    login(client, users['admin'], 'admin')
+    return client
+
+
+def test_first_poll_starts_at_the_newest_change(admin_client, users):
+    add_changes((1, 10, 60), (2, 11, 60))
+
+    assert poll(admin_client) == {'success': True, 'cursor': 2, 'cards': [], 'removed': []}
+
+
+def test_poll_returns_changed_cards_and_advances_the_cursor(admin_client, users):
+    order = make_order(users['admin'])
+    add_changes((1, order, 60), (2, order, 60))
+
+    payload = poll(admin_client, since=0)
+
+    assert payload['cursor'] == 2
+    assert [card['id'] for card in payload['cards']] == [order]
+    assert payload['removed'] == [] and payload['more'] is False
+    assert poll(admin_client, since=2) == {'success': True, 'cursor': 2, 'cards': [], 'removed': []}
+
+
+def test_cursor_waits_in_front_of_a_recent_gap(admin_client, users):
+    order = make_order(users['admin'])
+    # Change 2 may belong to a transaction that has not committed yet
+    add_changes((1, order, 60), (3, order, 0))
+
+    assert poll(admin_client, since=0)['cursor'] == 1
+
+
+def test_cursor_passes_a_gap_once_it_has_settled(admin_client, users):
+    order = make_order(users['admin'])
+    # Rolled back long ago: nothing will ever fill change 2
+    add_changes((1, order, 60), (3, order, 60))
+
+    assert poll(admin_client, since=0)['cursor'] == 3
+
+
+def test_deleted_and_filtered_out_orders_are_removed(admin_client, users):
+    local = make_order(users['admin'], 'PO-1001', order_type='Local')
+    export = make_order(users['admin'], 'PO-1002', order_type='Export')
+    add_changes((1, local, 60), (2, export, 60), (3, 999, 60))
+
+    payload = poll(admin_client, since=0, order_type='Local')
+
+    assert [card['id'] for card in payload['cards']] == [local]
+    assert payload['removed'] == [export, 999]
+
+
+def test_orders_an_agent_cannot_see_are_removed(client, users):
+    theirs = make_order(users['admin'], 'PO-1001', assigned_agent=users['agent1'])
+    others = make_order(users['admin'], 'PO-1002', assigned_agent=users['agent2'])
+    add_changes((1, theirs, 60), (2, others, 60))
+    login(client, users['agent1'], 'agent')
+
+    payload = poll(client, since=0)
+
+    assert [card['id'] for card in payload['cards']] == [theirs]
+    assert payload['removed'] == [others]
+
+
+def test_a_cursor_older_than_the_kept_history_resets_the_board(admin_client, users):
+    add_changes((5, 10, 60), (6, 10, 60))
+
+    assert poll(admin_client, since=2) == {'success': True, 'reset': True, 'cursor': 6}
+
+
+def test_more_is_set_when_a_full_batch_was_consumed(admin_client, users, monkeypatch):
+    monkeypatch.setattr(app_module, 'CHANGE_FEED_BATCH', 2)
+    add_changes((1, 10, 60), (2, 11, 60), (3, 12, 60))
+
+    payload = poll(admin_client, since=0)
+
+    assert payload['cursor'] == 2 and payload['more'] is True
+    assert poll(admin_client, since=2)['more'] is False
+
+
+def test_more_is_not_set_while_the_cursor_waits_at_a_gap(admin_client, users, monkeypatch):
+    monkeypatch.setattr(app_module, 'CHANGE_FEED_BATCH', 2)
+    add_changes((1, 10, 60), (3, 11, 0), (4, 12, 0))
+
+    payload = poll(admin_client, since=0)
+
+    # Asking again at once would return the same batch
+    assert payload['cursor'] == 1 and payload['more'] is False
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Cold storage: archived orders move to the archive tables with their child
+rows and come back unchanged, unless their id or PO number was reused.
+"""
+
+import os
+
+import pytest
+
+from conftest import TMP_DIR, app_module, db, login, make_order
+
+Order, ArchivedOrder = app_module.Order, app_module.ArchivedOrder
+
+
+@pytest.fixture
+def archived_order(users):
+    """An archived order with chat, a tag, a secondary agent and a contract"""
+    order_id = make_order(users['admin'], 'PO-1001', status='Archived', customer_name='Acme Yarns', amount_usd=75,
+                          assigned_agent=users['agent1'])
+    with app_module.app.app_context():
+        db.session.add_all([
+            app_module.ChatMessage(order_id=order_id, sender_id=users['admin'], message='Tagged',
+                                   tagged_agents=[app_module.ChatTag(agent_id=users['agent1'])]),
+            app_module.ChatMessage(order_id=order_id, sender_id=users['agent1'], message='Untagged'),
+            app_module.OrderAgent(order_id=order_id, agent_id=users['agent2']),
+            app_module.Contract(order_id=order_id, filename='c.pdf', file_path=os.path.join(TMP_DIR, 'c.pdf'),
+                                uploaded_by=users['admin']),
+        ])
+        db.session.commit()
+    return order_id
+
+
+def snapshot(order_id):
+    """What a restored order must still have"""
+    with app_module.app.app_context():
+        order = db.session.get(Order, order_id)
+        return {
+            'order': (order.order_id, order.customer_name, order.amount_usd, order.status, order.assigned_agent),
+            'agents': sorted(row.agent_id for row in order.assigned_agents),
+            'contracts': [(row.filename, row.file_path) for row in order.contracts],
+            'messages': sorted((msg.message, [tag.agent_id for tag in msg.tagged_agents]) for msg in order.chat_messages),
+        }
+
+
+def move_to_cold(order_ids):
+    with app_module.app.app_context():
+        return app_module.move_orders_to_cold_storage(order_ids)
+
+
+def test_round_trip_keeps_the_order_and_its_child_rows(client, users, archived_order):
+    before = snapshot(archived_order)
+
+    assert move_to_cold([archived_order]) == 1
+    with app_module.app.app_context():
+        assert db.session.get(Order, archived_order) is None
+        assert app_module.ChatMessage.query.count() == 0
+        assert ArchivedOrder.query.filter_by(original_id=archived_order).count() == 1
+
+    login(client, users['admin'], 'admin')
+    payload = client.post('/restore_orders', json={'order_ids': [archived_order]}).get_json()
+
+    assert payload == {'success': True, 'restored': [archived_order], 'skipped': []}
+    assert snapshot(archived_order) == before
+    with app_module.app.app_context():
+        assert ArchivedOrder.query.count() == 0
+        assert app_module.ArchivedChatMessage.query.count() == 0
+
+
+def test_restore_skips_an_order_whose_po_number_was_reused(client, users, archived_order):
+    move_to_cold([archived_order])
+    make_order(users['admin'], 'PO-1001', id=archived_order + 1)
+
+    login(client, users['admin'], 'admin')
+    payload = client.post('/restore_orders', json={'order_ids': [archived_order]}).get_json()
+
+    assert payload == {'success': True, 'restored': [], 'skipped': [archived_order]}
+    with app_module.app.app_context():
+        assert ArchivedOrder.query.filter_by(original_id=archived_order).count() == 1
+
+
+def test_restore_skips_an_order_whose_id_was_reused(client, users, archived_order):
+    move_to_cold([archived_order])
+    make_order(users['admin'], 'PO-2002', id=archived_order)
+
+    login(client, users['admin'], 'admin')
+    payload = client.post('/restore_orders', json={'order_ids': [archived_order]}).get_json()
+
+    assert payload == {'success': True, 'restored': [], 'skipped': [archived_order]}
+    with app_module.app.app_context():
+        assert db.session.get(Order, archived_order).order_id == 'PO-2002'
+
+
+def test_move_after_an_interrupted_run_neither_duplicates_nor_keeps_the_order(users, archived_order, monkeypatch):
+    # The first run commits the archive copy, then dies before deleting the hot rows
+    def crash(order_ids):
+        raise RuntimeError('worker killed')
+    monkeypatch.setattr(app_module, 'delete_order_rows', crash)
+    with pytest.raises(RuntimeError):
+        move_to_cold([archived_order])
+    with app_module.app.app_context():
+        db.session.rollback()
+    monkeypatch.undo()
+
+    assert move_to_cold([archived_order]) == 1
+    with app_module.app.app_context():
+        assert db.session.get(Order, archived_order) is None
+        assert ArchivedOrder.query.filter_by(original_id=archived_order).count() == 1
+        assert app_module.ArchivedChatMessage.query.count() == 2
+
+
+def test_move_copies_an_order_that_reused_an_archived_id(users, archived_order):
+    move_to_cold([archived_order])
+    reused = make_order(users['admin'], 'PO-2002', id=archived_order, status='Archived')
+
+    assert move_to_cold([reused]) == 1
+    with app_module.app.app_context():
+        numbers = sorted(row.order_id for row in ArchivedOrder.query.filter_by(original_id=archived_order))
+    assert numbers == ['PO-1001', 'PO-2002']
+
+
+def test_restore_advances_the_postgres_id_sequence(client, users, archived_order, monkeypatch):
+    move_to_cold([archived_order])
+    advanced = []
+    monkeypatch.setattr(app_module, 'advance_order_id_sequence', advanced.append)
+
+    login(client, users['admin'], 'admin')
+    client.post('/restore_orders', json={'order_ids': [archived_order]})
+
+    assert advanced == [archived_order]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Customer matching in the dashboard search and the reports filter, and
+catalog edits that only change a name's spelling.
+"""
+
+from conftest import app_module, db, login, make_order
+
+Order, ArchivedOrder = app_module.Order, app_module.ArchivedOrder
+
+
+def link_customers():
+    with app_module.app.app_context():
+        app_module.link_order_customers()
+
+
+def test_dashboard_search_matches_inside_a_customer_name(users):
+    make_order(users['admin'], 'PO-1', customer_name='Acme Yarn Ltd')
+    make_order(users['admin'], 'PO-2', customer_name='Northwind')
+    link_customers()
+
+    with app_module.app.app_context():
+        admin = db.session.get(app_module.User, users['admin'])
+        found = lambda text: sorted(order.order_id for order in app_module.dashboard_orders(admin, {'search': text}))
+        assert found('cme') == ['PO-1']
+        assert found('Yarn') == ['PO-1']
+        assert found('wind') == ['PO-2']
+
+
+def test_a_short_search_is_one_predicate_however_many_customers_match(users):
+    for number in range(40):
+        make_order(users['admin'], f"PO-{number}", customer_name=f"Mill {number}")
+    link_customers()
+
+    with app_module.app.app_context():
+        admin = db.session.get(app_module.User, users['admin'])
+        query = app_module.dashboard_orders(admin, {'search': 'm'})
+        assert query.count() == 40
+        assert len(query.statement.compile().params) < 10
+
+
+def test_report_filter_matches_live_and_cold_rows_the_same_way(users):
+    make_order(users['admin'], 'PO-1', customer_name='Acme Yarn Ltd', amount_usd=10)
+    with app_module.app.app_context():
+        db.session.add(ArchivedOrder(original_id=99, order_id='PO-0', customer_name='Acme Yarn Ltd', yarn_type='Cotton 30s',
+                                     quantity_kg=5, startup_date=app_module.datetime(2030, 1, 1).date(), order_type='Local',
+                                     amount_usd=7, status='New Order', created_by=users['admin']))
+        db.session.commit()
+    link_customers()
+
+    with app_module.app.app_context():
+        for text in ('cme', 'Yarn Ltd', 'Acme'):
+            rows = app_module.report_totals(None, None, None, text, None)
+            assert sorted(amount for status, order_type, count, amount in rows) == [7, 10], text
+
+
+def test_a_spelling_only_edit_reaches_the_catalog(client, users):
+    order = make_order(users['admin'], 'PO-1', customer_name='acme yarn', yarn_type='cotton 30s')
+    login(client, users['admin'], 'admin')
+
+    response = client.post('/update_order', data={'order_id': order, 'customer_name': 'Acme Yarn', 'yarn_type': 'Cotton 30s'},
+                           headers={'Accept': 'application/json'})
+
+    assert response.get_json()['success'] is True
+    with app_module.app.app_context():
+        row = db.session.get(Order, order)
+        assert row.customer_id is not None and row.customer_name == row.customer.name
+        assert row.yarn_type == db.session.get(app_module.YarnType, row.yarn_type_id).name
+        assert row.version == 2
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Engine profiles: DB_PROFILE validation and per-bind options derived from
+each database URL.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import TMP_DIR, app_module
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_app(code, **env):
+    """Import app in a fresh interpreter with extra environment, then run code; returns the finished process"""
+    env = dict({name: value for name, value in os.environ.items() if name != 'DB_PROFILE'},
+               DATABASE_URL=f"sqlite:///{os.path.join(TMP_DIR, 'profiles.db')}", AUTO_INIT_DB='0', **env)
+    return subprocess.run([sys.executable, '-c', f"import app\n{code}"], cwd=APP_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_profile_follows_the_url():
+    assert app_module.select_engine_profile('sqlite:////tmp/a.db') == 'sqlite'
+    assert app_module.select_engine_profile('postgresql://db/app') == 'postgres'
+    assert app_module.select_engine_profile('postgres://db/app') == 'postgres'
+    assert app_module.select_engine_profile('mysql://db/app') == 'default'
+
+
+def test_override_must_name_a_profile_that_suits_the_url():
+    assert app_module.select_engine_profile('postgresql://db/app', 'default') == 'default'
+    assert app_module.select_engine_profile('sqlite:////tmp/a.db', 'sqlite') == 'sqlite'
+    with pytest.raises(ValueError, match='Unknown DB_PROFILE'):
+        app_module.select_engine_profile('sqlite:////tmp/a.db', 'postgress')
+    with pytest.raises(ValueError, match='does not fit'):
+        app_module.select_engine_profile('postgresql://db/app', 'sqlite')
+
+
+def test_unknown_profile_fails_the_import_with_a_clear_message():
+    result = import_app('', DB_PROFILE='fast')
+
+    assert result.returncode != 0
+    assert "Unknown DB_PROFILE 'fast'; expected one of sqlite, postgres, default" in result.stderr
+
+
+def test_each_bind_is_configured_from_its_own_url():
+    code = (
+        "with app.app.app_context():\n"
+        "    for key, engine in sorted(app.db.engines.items(), key=lambda item: str(item[0])):\n"
+        "        with engine.connect() as conn:\n"
+        "            mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()\n"
+        "        print(key, type(engine.pool).__name__, mode)\n"
+    )
+    result = import_app(code, ARCHIVE_DATABASE_URL=f"sqlite:///{os.path.join(TMP_DIR, 'profiles-archive.db')}")
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-2:] == ['None TimedQueuePool wal', 'archive TimedQueuePool wal']
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the serverless entry point.
+Vercel imports app.py on every cold start, so importing it must stay cheap
+and must not touch the database.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Self time of the `app` module body, excluding Flask/SQLAlchemy imports
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', '200'))
+
+
+def measure_import(database_path):
+    """Import app in a fresh interpreter and return (self_ms, cumulative_ms)"""
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+
+    # Lines look like: "import time:     54580 |     431937 | app"
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == 'app':
+            self_us = int(parts[0].split(':')[1])
+            return self_us / 1000, int(parts[1]) / 1000
+
+    raise AssertionError('app not found in -X importtime output')
+
+
+def test_import_does_not_touch_database():
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, 'import_check.db')
+        measure_import(database_path)
+        assert not os.path.exists(database_path), 'importing app created the database'
+
+
+def test_import_time_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        self_ms, cumulative_ms = measure_import(os.path.join(tmp, 'import_check.db'))
+        print(f"app import: {self_ms:.1f} ms self, {cumulative_ms:.1f} ms cumulative")
+        assert self_ms < IMPORT_TIME_BUDGET_MS, (
+            f"app module body took {self_ms:.1f} ms (budget {IMPORT_TIME_BUDGET_MS:.0f} ms)"
+        )
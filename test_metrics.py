@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+The /metrics exposition: metric types and the per-connection statement timer.
+"""
+
+import pytest
+from sqlalchemy import exc as sa_exc
+
+from conftest import app_module, db
+
+
+def test_cache_hits_and_misses_are_counters(fresh_db):
+    cache = app_module.fragment_cache
+    cache.get('key')
+    cache.set('key', 'value')
+    cache.get('key')
+
+    text = app_module.metrics.render()
+
+    assert '# TYPE cache_hits_total counter' in text
+    assert '# TYPE cache_misses_total counter' in text
+    assert '# TYPE cache_hit_ratio gauge' in text
+    assert f'cache_hits_total{{cache="fragment"}} {cache.hits}' in text and cache.hits >= 1
+    assert f'cache_misses_total{{cache="fragment"}} {cache.misses}' in text and cache.misses >= 1
+    assert 'cache_hits{' not in text and 'cache_misses{' not in text
+
+
+def test_a_failed_statement_does_not_leave_its_start_time_behind(fresh_db):
+    with app_module.app.app_context():
+        connection = db.session.connection()
+        with pytest.raises(sa_exc.OperationalError):
+            connection.exec_driver_sql('SELECT * FROM no_such_table')
+        assert connection.info.get('query_start') == []
+        db.session.rollback()
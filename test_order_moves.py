@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Request validation for the board's move endpoint.
+"""
+
+import pytest
+
+from conftest import app_module, login, make_order
+
+
+@pytest.fixture
+def admin_client(client, users):
+    login(client, users['admin'], 'admin')
+    return client
+
+
+@pytest.mark.parametrize('version', ['', 'abc', [1]])
+def test_move_order_rejects_malformed_version(admin_client, version):
+    response = admin_client.post('/move_order', json={'order_id': 1, 'status': 'Booked', 'version': version})
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': 'Invalid version'}
+
+
+def move(client, *moves):
+    return client.post('/move_orders', json={'moves': [dict(zip(('order_id', 'status', 'version'), m)) for m in moves]})
+
+
+def test_move_orders_moves_every_order_with_a_current_version(admin_client, users):
+    first, second = make_order(users['admin'], 'PO-1001'), make_order(users['admin'], 'PO-1002')
+
+    payload = move(admin_client, (first, 'Booked', 1), (second, 'Under Booking', 1)).get_json()
+
+    assert payload['success'] is True
+    assert sorted(payload['moved']) == [first, second]
+    assert payload['conflicts'] == [] and payload['errors'] == []
+    with app_module.app.app_context():
+        statuses = {order.id: (order.status, order.version) for order in app_module.Order.query}
+    assert statuses == {first: ('Booked', 2), second: ('Under Booking', 2)}
+
+
+def test_move_orders_reports_conflicts_and_errors_alongside_moves(admin_client, users):
+    fresh, stale = make_order(users['admin'], 'PO-1001'), make_order(users['admin'], 'PO-1002')
+
+    payload = move(admin_client, (fresh, 'Booked', 1), (stale, 'Booked', 7), (999, 'Booked', 1)).get_json()
+
+    # The batch is partly applied: the fresh card moves, the stale one comes back as it is now
+    assert payload['success'] is False
+    assert payload['moved'] == [fresh]
+    assert payload['conflicts'] == [stale]
+    assert payload['errors'] == [{'order_id': 999, 'message': 'Order not found'}]
+    cards = {card['id']: card for card in payload['cards']}
+    assert set(cards) == {fresh, stale}
+    with app_module.app.app_context():
+        assert app_module.Order.query.get(stale).status == 'New Order'
+        assert app_module.Order.query.get(fresh).status == 'Booked'
+
+
+def test_move_orders_refuses_agents(client, users):
+    order = make_order(users['admin'])
+    login(client, users['agent1'], 'agent')
+
+    payload = move(client, (order, 'Booked', 1)).get_json()
+
+    assert payload == {'success': False, 'message': 'Agents cannot move orders between lists'}
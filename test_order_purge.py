@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Bulk delete and archive: every child row goes with a deleted order, and
+contract files are removed in the background.
+"""
+
+import os
+
+import pytest
+
+from conftest import TMP_DIR, app_module, db, login, make_order
+
+
+def add_children(order_id, users, name):
+    """Chat with a tag, an agent assignment and a contract with a file on disk; returns the file path"""
+    file_path = os.path.join(TMP_DIR, f"{name}.pdf")
+    with open(file_path, 'wb') as f:
+        f.write(b'%PDF-1.4')
+    with app_module.app.app_context():
+        db.session.add_all([
+            app_module.ChatMessage(order_id=order_id, sender_id=users['admin'], message='Tagged',
+                                   tagged_agents=[app_module.ChatTag(agent_id=users['agent1'])]),
+            app_module.OrderAgent(order_id=order_id, agent_id=users['agent1']),
+            app_module.Contract(order_id=order_id, filename=f"{name}.pdf", file_path=file_path, uploaded_by=users['admin']),
+        ])
+        db.session.commit()
+    return file_path
+
+
+def child_counts(order_id):
+    with app_module.app.app_context():
+        message_ids = db.select(app_module.ChatMessage.id).where(app_module.ChatMessage.order_id == order_id)
+        return {
+            'messages': app_module.ChatMessage.query.filter_by(order_id=order_id).count(),
+            'tags': app_module.ChatTag.query.filter(app_module.ChatTag.message_id.in_(message_ids)).count(),
+            'agents': app_module.OrderAgent.query.filter_by(order_id=order_id).count(),
+            'contracts': app_module.Contract.query.filter_by(order_id=order_id).count(),
+        }
+
+
+@pytest.fixture
+def admin_client(client, users):
+    login(client, users['admin'], 'admin')
+    return client
+
+
+def test_delete_removes_child_rows_and_contract_files(admin_client, users):
+    doomed, kept = make_order(users['admin'], 'PO-1001'), make_order(users['admin'], 'PO-1002')
+    doomed_file, kept_file = add_children(doomed, users, 'doomed'), add_children(kept, users, 'kept')
+
+    payload = admin_client.post('/delete_orders', json={'order_ids': [doomed, 999], 'action': 'delete'}).get_json()
+
+    assert payload['success'] is True and payload['deleted'] == 1
+    assert child_counts(doomed) == {'messages': 0, 'tags': 0, 'agents': 0, 'contracts': 0}
+    assert child_counts(kept) == {'messages': 1, 'tags': 1, 'agents': 1, 'contracts': 1}
+    with app_module.app.app_context():
+        assert db.session.get(app_module.Order, doomed) is None
+        audit = app_module.AuditLog.query.filter_by(action='order_deleted').all()
+        assert [row.entity_id for row in audit] == [doomed]
+    # Files go through the background cleaner after the commit
+    app_module.file_cleanup_queue.join()
+    assert not os.path.exists(doomed_file)
+    assert os.path.exists(kept_file)
+
+
+def test_delete_queues_files_only_after_the_rows_are_gone(admin_client, users, monkeypatch):
+    order = make_order(users['admin'])
+    file_path = add_children(order, users, 'queued')
+    queued = []
+    monkeypatch.setattr(app_module, 'queue_file_removal', lambda paths: queued.append((list(paths), child_counts(order))))
+
+    admin_client.post('/delete_orders', json={'order_ids': [order], 'action': 'delete'})
+
+    assert queued == [([file_path], {'messages': 0, 'tags': 0, 'agents': 0, 'contracts': 0})]
+
+
+def test_archive_audits_only_the_orders_it_moved(admin_client, users):
+    fresh = make_order(users['admin'], 'PO-1001')
+    already = make_order(users['admin'], 'PO-1002', status='Archived')
+
+    payload = admin_client.post('/delete_orders', json={'order_ids': [fresh, already, 999], 'action': 'archive'}).get_json()
+
+    assert payload['success'] is True and payload['archived'] == 1
+    with app_module.app.app_context():
+        assert db.session.get(app_module.Order, fresh).status == 'Archived'
+        assert [row.entity_id for row in app_module.AuditLog.query.filter_by(action='order_archived')] == [fresh]
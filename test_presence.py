@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Presence: heartbeats are shared between workers, and users only show up as
+viewers of orders they may open.
+"""
+
+import pytest
+
+from conftest import app_module, login, make_order
+
+
+def heartbeat(client, order_id=None, orders=(), users=()):
+    response = client.post('/api/presence', json={'order_id': order_id, 'orders': list(orders), 'users': list(users)})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_presence_is_shared_between_workers_by_default(tmp_path):
+    assert app_module.PRESENCE_BACKEND == 'sqlite'
+    path = str(tmp_path / 'cache.db')
+    # Two store instances on one file stand in for two worker processes
+    one, other = app_module.SQLitePresence(path=path), app_module.SQLitePresence(path=path)
+
+    one.touch(1, 'agent1', 42)
+
+    assert other.online([1, 2]) == {1}
+    assert other.viewers([42]) == {42: [(1, 'agent1')]}
+
+
+def test_viewers_of_an_order_are_listed(client, users):
+    order = make_order(users['admin'], assigned_agent=users['agent1'])
+    login(client, users['agent1'], 'agent')
+    heartbeat(client, order_id=order)
+
+    login(client, users['admin'], 'admin')
+    payload = heartbeat(client, orders=[order], users=[users['agent1'], users['agent2']])
+
+    assert payload['online'] == [users['agent1']]
+    assert payload['viewers'] == {str(order): [{'id': users['agent1'], 'username': 'agent1'}]}
+
+
+def test_an_agent_cannot_view_an_order_they_may_not_open(client, users):
+    order = make_order(users['admin'], assigned_agent=users['agent2'])
+    login(client, users['agent1'], 'agent')
+    heartbeat(client, order_id=order)
+
+    login(client, users['admin'], 'admin')
+    assert heartbeat(client, orders=[order])['viewers'] == {}
+    # Still online, just not viewing that order
+    assert heartbeat(client, users=[users['agent1']])['online'] == [users['agent1']]
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_an_agent_cannot_see_who_views_an_order_they_may_not_open(client, users, method):
+    order = make_order(users['admin'], assigned_agent=users['agent2'])
+    login(client, users['agent2'], 'agent')
+    heartbeat(client, order_id=order)
+
+    login(client, users['agent1'], 'agent')
+    if method == 'GET':
+        payload = client.get(f"/api/presence?orders={order}").get_json()
+    else:
+        payload = heartbeat(client, orders=[order])
+
+    assert payload['viewers'] == {}
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Query budgets for every route.
+
+Each route is exercised in-process against a small synthetic dataset, the
+dataset is grown several times over, and the route is exercised again. The
+number of SQL statements must stay within the route's @query_budget and must
+not change with the size of the data; a lazy relationship loaded per row in
+a view or template makes it grow.
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+
+import pytest
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'budget.db')}"
+os.environ['JINJA_CACHE_DIR'] = os.path.join(TMP_DIR, 'jinja')
+os.environ['PROFILE_DIR'] = os.path.join(TMP_DIR, 'profiles')
+os.environ['AUTO_INIT_DB'] = '0'
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+from benchmarks.datagen import generate
+
+db = app_module.db
+User, Order, OrderAgent = app_module.User, app_module.Order, app_module.OrderAgent
+ChatMessage, ChatTag, Contract = app_module.ChatMessage, app_module.ChatTag, app_module.Contract
+
+# Dataset sizes per round; each round adds to the previous one
+ROUNDS = [
+    {'users': 4, 'agents': 3, 'orders': 40, 'messages': 200, 'contracts': 15, 'seed': 1},
+    {'users': 16, 'agents': 9, 'orders': 240, 'messages': 1500, 'contracts': 90, 'seed': 2},
+]
+
+
+def targets():
+    """Ids each round's requests act on, picked fresh because earlier rounds delete orders"""
+    hot_order_id = db.session.query(ChatMessage.order_id).group_by(ChatMessage.order_id).order_by(
+        db.func.count().desc(), ChatMessage.order_id).limit(1).scalar()
+    hot_order = db.session.get(Order, hot_order_id)
+    agents = [row.id for row in db.session.query(User.id).filter_by(role='agent').order_by(User.id).limit(2)]
+    spare = [row.id for row in db.session.query(Order.id).filter(Order.id != hot_order_id, Order.status != 'Archived')
+             .order_by(Order.id.desc()).limit(12)]
+    contract = Contract.query.filter_by(order_id=hot_order_id).first() or Contract.query.first()
+    contract_path = os.path.join(TMP_DIR, f"contract_{contract.id}.pdf")
+    with open(contract_path, 'wb') as f:
+        f.write(b'%PDF-1.4 budget test')
+    contract.file_path = contract_path
+
+    admin_id = User.query.filter_by(role='admin').first().id
+
+    # Same starting state every round so transitions, assignments and tags take the same path
+    viscose = app_module.resolve_yarn_types(['Viscose 30s'])['Viscose 30s']
+    # A startup date of their own each round, so every round finds the same report rollup rows
+    report_day = app_module.datetime(2001, 1, 1).date() + app_module.timedelta(days=spare[0])
+    Order.query.filter(Order.id.in_(spare)).update({'status': 'New Order', 'assigned_agent': agents[0], 'yarn_type': viscose.name,
+                                                    'yarn_type_id': viscose.id, 'startup_date': report_day, 'order_type': 'Local'},
+                                                   synchronize_session=False)
+    # The first page of every round reloads the yarn type catalog
+    app_module.bump_reference_version('yarn_types')
+    OrderAgent.query.filter(OrderAgent.order_id.in_(spare[:10])).delete(synchronize_session=False)
+    # Rollup rows are inserted on the first transition of a day and incremented after that
+    app_module.StageMetric.query.delete(synchronize_session=False)
+    hot_order.assigned_agent = agents[0]
+    OrderAgent.query.filter_by(order_id=hot_order_id).delete()
+    db.session.add_all([OrderAgent(order_id=hot_order_id, agent_id=tagged) for tagged in agents])
+    # Every role has tagged messages on the hot order, so every eager loader has rows to load
+    for sender_id in (admin_id, agents[0], hot_order.created_by):
+        db.session.add(ChatMessage(order_id=hot_order_id, sender_id=sender_id, message='Tagged',
+                                   tagged_agents=[ChatTag(agent_id=agents[0])]))
+
+    # Two orders in cold storage to restore, with the same amount of chat and assignments each round
+    cold = spare[10:12]
+    message_ids = db.select(ChatMessage.id).where(ChatMessage.order_id.in_(cold))
+    ChatTag.query.filter(ChatTag.message_id.in_(message_ids)).delete(synchronize_session=False)
+    for model in (ChatMessage, OrderAgent, Contract):
+        model.query.filter(model.order_id.in_(cold)).delete(synchronize_session=False)
+    for order_id in cold:
+        db.session.add_all([
+            ChatMessage(order_id=order_id, sender_id=admin_id, message='Tagged', tagged_agents=[ChatTag(agent_id=agents[0])]),
+            ChatMessage(order_id=order_id, sender_id=admin_id, message='Untagged'),
+            OrderAgent(order_id=order_id, agent_id=agents[0]),
+        ])
+    Order.query.filter(Order.id.in_(cold)).update({'status': 'Archived', 'updated_at': app_module.datetime(2000, 1, 1)},
+                                                  synchronize_session=False)
+    db.session.commit()
+
+    picked = {
+        'admin': admin_id,
+        'agent': agents[0],
+        'user': hot_order.created_by,
+        'hot_order': hot_order_id,
+        'hot_order_po': hot_order.order_id,
+        'agents': agents,
+        'spare': spare[:10],
+        'cold': cold,
+        'contract': contract.id,
+        'edit_user': agents[0],
+        'report_day': report_day.isoformat(),
+    }
+    app_module.move_to_cold_storage(0, 100)
+    app_module.rebuild_order_rollups()
+    app_module.rebuild_agent_workload()
+    # The change feed cases read back what this round's requests changed
+    picked['changes_cursor'] = app_module.latest_change_id()
+    return picked
+
+
+def upload(name):
+    return (io.BytesIO(b'budget test file'), name)
+
+
+# (case name, role, method, path, request kwargs); callables receive the round's targets
+CASES = [
+    ('index', None, 'GET', '/', {}),
+    ('health', None, 'GET', '/health', {}),
+    ('api_test', None, 'GET', '/api/test', {}),
+    ('login_page', None, 'GET', '/login', {}),
+    ('login', None, 'POST', '/login', {'data': {'username': 'admin', 'password': 'admin123'}}),
+    ('register_page', None, 'GET', '/register', {}),
+    ('register', None, 'POST', '/register', lambda t: {'data': {
+        'username': f"budget{t['hot_order']}", 'email': f"budget{t['hot_order']}@example.com", 'password': 'pw', 'role': 'user'}}),
+    ('dashboard_admin', 'admin', 'GET', '/dashboard', {}),
+    ('dashboard_agent', 'agent', 'GET', '/dashboard', {}),
+    ('dashboard_user', 'user', 'GET', '/dashboard', {}),
+    ('dashboard_search', 'admin', 'GET', '/dashboard?search=Customer&order_type=Export', {}),
+    ('chat_admin', 'admin', 'GET', lambda t: f"/chat/{t['hot_order']}", {}),
+    ('chat_agent', 'agent', 'GET', lambda t: f"/chat/{t['hot_order']}", {}),
+    ('chat_user', 'user', 'GET', lambda t: f"/chat/{t['hot_order']}", {}),
+    ('edit_order', 'admin', 'GET', lambda t: f"/edit_order/{t['hot_order']}", {}),
+    ('edit_user', 'admin', 'GET', lambda t: f"/edit_user/{t['edit_user']}", {}),
+    ('contracts_admin', 'admin', 'GET', '/contracts', {}),
+    ('contracts_agent', 'agent', 'GET', '/contracts', {}),
+    ('reports', 'admin', 'GET', '/reports', {}),
+    ('customer_autocomplete', 'user', 'GET', '/api/customers?q=cust&limit=20', {}),
+    ('reports_filtered', 'admin', 'GET', '/reports?order_type=Export&customer=Customer', {}),
+    ('reports_drilldown', 'admin', 'GET', lambda t: f"/reports?status=Archived&agent={t['agent']}&start_date=2000-01-01", {}),
+    ('cycle_times', 'admin', 'GET', '/reports/cycle_times', {}),
+    ('cycle_times_by_day', 'admin', 'GET', lambda t: f"/reports/cycle_times?group_by=day&agent={t['agent']}&start_date=2000-01-01", {}),
+    ('profile', 'admin', 'GET', '/profile', {}),
+    ('admin_stats', 'admin', 'GET', '/admin_stats', {}),
+    ('export_orders', 'admin', 'GET', '/export_orders', {}),
+    ('admin_panel', 'admin', 'GET', '/admin_panel', {}),
+    ('metrics', 'admin', 'GET', '/metrics', {}),
+    ('confirm_order', 'admin', 'GET', lambda t: f"/confirm_order/{t['hot_order']}", {}),
+    ('download_contract', 'admin', 'GET', lambda t: f"/download_contract/{t['contract']}", {}),
+    ('send_message', 'admin', 'POST', '/send_message', lambda t: {'json': {
+        'order_id': t['hot_order'], 'message': 'Budget check', 'tagged_agents': t['agents']}}),
+    ('test_message', 'admin', 'GET', lambda t: f"/test_message/{t['hot_order']}", {}),
+    ('clear_chat', 'admin', 'POST', '/clear_chat', lambda t: {'json': {'order_id': t['spare'][9]}}),
+    ('upload_file', 'admin', 'POST', '/upload_file', lambda t: {'data': {
+        'order_id': t['hot_order'], 'file': upload('notes.txt')}}),
+    ('create_order', 'admin', 'POST', '/create_order', lambda t: {'data': {
+        'customer_name': f"Budget Customer {t['spare'][0]}", 'yarn_type': 'Cotton 30s', 'quantity_kg': '100',
+        'startup_date': t['report_day'], 'order_type': 'Local', 'amount_usd': '1000', 'agent_ids': t['agents']}}),
+    ('create_order_auto', 'admin', 'POST', '/create_order', lambda t: {'data': {
+        'customer_name': f"Budget Customer {t['spare'][0]}", 'yarn_type': 'Cotton 30s', 'quantity_kg': '100',
+        'startup_date': t['report_day'], 'order_type': 'Local', 'amount_usd': '1000', 'auto_assign': '1'}}),
+    ('move_order', 'admin', 'POST', '/move_order', lambda t: {'json': {'order_id': t['spare'][0], 'status': 'Under Booking'}}),
+    ('move_orders', 'admin', 'POST', '/move_orders', lambda t: {'json': {
+        'moves': [{'order_id': order_id, 'status': 'Under Booking'} for order_id in t['spare'][1:4]]}}),
+    ('assign_order', 'admin', 'POST', '/assign_order', lambda t: {'json': {'order_id': t['spare'][4], 'agent_ids': t['agents']}}),
+    ('assign_order_auto', 'admin', 'POST', '/assign_order', lambda t: {'json': {'order_id': t['spare'][4], 'auto': True}}),
+    ('assign_multiple_agents', 'admin', 'POST', '/assign_multiple_agents', lambda t: {'json': {
+        'order_id': t['spare'][5], 'agent_ids': t['agents']}}),
+    ('auto_save_order', 'admin', 'POST', '/auto_save_order', lambda t: {'json': {
+        'order_id': t['spare'][6], 'patch': {'quantity_kg': '110', 'agent_ids': t['agents']}}}),
+    ('save_draft', 'admin', 'POST', '/save_draft', lambda t: {'json': {
+        'order_id': t['spare'][6], 'patch': {'quantity_kg': '120', 'notes': 'ignored'}}}),
+    ('update_order', 'admin', 'POST', '/update_order', lambda t: {'data': {
+        'order_id': t['spare'][6], 'customer_name': f"Budget Customer {t['spare'][6]}", 'yarn_type': 'Cotton 30s', 'quantity_kg': '120',
+        'startup_date': t['report_day'], 'order_type': 'Local', 'amount_usd': '1200', 'status': 'Booked',
+        'assigned_agent': t['agents'][0], 'agent_ids': t['agents']}}),
+    ('upload_contract', 'admin', 'POST', '/upload_contract', lambda t: {'data': {
+        'order_id': t['spare'][6], 'contract_file': upload('contract.pdf')}}),
+    ('confirm_order_action', 'admin', 'POST', '/confirm_order_action', lambda t: {'json': {
+        'order_id': t['spare'][7], 'selected_agent_id': t['agents'][0]}}),
+    ('confirm_order_auto', 'admin', 'POST', '/confirm_order_action', lambda t: {'json': {
+        'order_id': t['spare'][5], 'selected_agent_id': 'auto'}}),
+    ('update_profile', 'user', 'POST', '/update_profile', {'data': {'email': ''}}),
+    ('update_user', 'admin', 'POST', '/update_user', lambda t: {'json': {'user_id': t['edit_user'], 'action': 'activate'}}),
+    ('delete_order', 'admin', 'POST', '/delete_order', lambda t: {'json': {'order_id': t['spare'][8]}}),
+    ('archive_orders', 'admin', 'POST', '/delete_orders', lambda t: {'json': {'order_ids': t['spare'][1:4], 'action': 'archive'}}),
+    ('delete_orders', 'admin', 'POST', '/delete_orders', lambda t: {'json': {'order_ids': [t['spare'][9]], 'action': 'delete'}}),
+    ('restore_orders', 'admin', 'POST', '/restore_orders', lambda t: {'json': {'order_ids': t['cold']}}),
+    ('order_changes_start', 'agent', 'GET', '/api/changes', {}),
+    ('order_changes_admin', 'admin', 'GET', lambda t: f"/api/changes?since={t['changes_cursor']}", {}),
+    ('order_changes_agent', 'agent', 'GET', lambda t: f"/api/changes?since={t['changes_cursor']}&order_type=Local", {}),
+    ('presence_heartbeat', 'agent', 'POST', '/api/presence', lambda t: {'json': {
+        'order_id': t['hot_order'], 'users': t['agents'], 'orders': t['spare']}}),
+    ('presence_lookup', 'admin', 'GET', lambda t: f"/api/presence?users={','.join(map(str, t['agents']))}&orders={t['hot_order']}", {}),
+    ('logout', 'admin', 'GET', '/logout', {}),
+]
+
+
+def run_round(client, size):
+    """Grow the dataset, then return {case: (endpoint, status, statement count)}"""
+    with app_module.app.app_context():
+        generate(app_module, **size)
+        t = targets()
+
+    results = {}
+    for name, role, method, path, kwargs in CASES:
+        path = path(t) if callable(path) else path
+        kwargs = kwargs(t) if callable(kwargs) else kwargs
+        with client.session_transaction() as sess:
+            sess.clear()
+            if role:
+                sess.update(user_id=t[role], role=role)
+        # Page caches would hide the queries being measured
+        app_module.response_cache.clear()
+        app_module.fragment_cache.clear()
+        with app_module.count_queries() as queries, contextlib.redirect_stdout(io.StringIO()):
+            response = client.open(path, method=method, **kwargs)
+        assert response.status_code < 400, f"{name}: {method} {path} returned {response.status_code}"
+        endpoint = app_module.app.url_map.bind('').match(path.split('?')[0], method=method)[0]
+        results[name] = (endpoint, queries.count, queries.statements)
+    return results
+
+
+def measure_rounds():
+    """{case: (endpoint, count in round 1, count in round 2, ...)}"""
+    rounds = run_rounds()
+    return {name: (rounds[0][name][0],) + tuple(results[name][1] for results in rounds) for name in rounds[0]}
+
+
+@pytest.fixture(scope='module')
+def rounds():
+    return run_rounds()
+
+
+def run_rounds():
+    cwd = os.getcwd()
+    # upload_contract saves into ./uploads
+    os.chdir(TMP_DIR)
+    try:
+        with app_module.app.app_context():
+            app_module.init_db()
+            app_module.seed_db()
+        client = app_module.app.test_client()
+        return [run_round(client, size) for size in ROUNDS]
+    finally:
+        os.chdir(cwd)
+
+
+def test_every_route_is_exercised(rounds):
+    exercised = {endpoint for endpoint, count, statements in rounds[0].values()}
+    routes = {rule.endpoint for rule in app_module.app.url_map.iter_rules()} - {'static', 'view_profile'}
+    assert routes <= exercised, f"routes without a query budget check: {sorted(routes - exercised)}"
+
+
+def test_every_route_declares_a_budget():
+    routes = {rule.endpoint for rule in app_module.app.url_map.iter_rules()} - {'static'}
+    missing = sorted(routes - set(app_module.QUERY_BUDGETS))
+    assert not missing, f"routes without @query_budget: {missing}"
+
+
+@pytest.mark.parametrize('name', [case[0] for case in CASES])
+def test_route_within_budget(rounds, name):
+    for results in rounds:
+        endpoint, count, statements = results[name]
+        budget = app_module.QUERY_BUDGETS[endpoint]
+        assert count <= budget, f"{name} issued {count} statements (budget {budget}):\n" + '\n'.join(statements)
+
+
+@pytest.mark.parametrize('name', [case[0] for case in CASES])
+def test_query_count_independent_of_data_size(rounds, name):
+    counts = [results[name][1] for results in rounds]
+    assert len(set(counts)) == 1, f"{name} query count grows with the dataset: {counts}"
+
+
+if __name__ == '__main__':
+    # Print the measured counts per round, useful when setting a new route's budget
+    for name, (endpoint, *counts) in sorted(measure_rounds().items()):
+        print(f"{name:24} {endpoint:24} budget={app_module.QUERY_BUDGETS.get(endpoint)} counts={counts}")
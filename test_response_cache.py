@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Cached admin pages are only served to users who are still active admins.
+"""
+
+import pytest
+
+from conftest import app_module, db, login
+
+ADMIN_PAGES = ['/admin_stats', '/reports', '/reports/cycle_times']
+
+
+@pytest.mark.parametrize('path', ADMIN_PAGES)
+@pytest.mark.parametrize('change', [{'role': 'agent'}, {'is_active': False}])
+def test_cached_admin_page_rechecks_the_stored_user(client, users, path, change):
+    login(client, users['admin'], 'admin')
+    assert client.get(path).status_code == 200
+    with app_module.app.app_context():
+        app_module.User.query.filter_by(id=users['admin']).update(change)
+        db.session.commit()
+
+    # The session still says admin and the page is cached
+    response = client.get(path)
+    assert response.status_code == 302
+    assert response.location.endswith('/dashboard')
+
+
+
+def test_admin_stats_counts_new_users(client, users):
+    login(client, users['admin'], 'admin')
+    assert b'<div class="stat-number">4</div>' in client.get('/admin_stats').data
+    with app_module.app.app_context():
+        db.session.add(app_module.User(username='newcomer', email='newcomer@example.com', password_hash='-', role='user'))
+        app_module.bump_reference_version('users')
+        db.session.commit()
+
+    assert b'<div class="stat-number">5</div>' in client.get('/admin_stats').data
+
+
+def test_admin_stats_lists_new_messages(client, users):
+    with app_module.app.app_context():
+        order = app_module.Order(order_id='PO-1000', customer_name='Acme', yarn_type='Cotton', quantity_kg=1,
+                                 startup_date=app_module.datetime(2030, 1, 1).date(), order_type='Local',
+                                 amount_usd=1, created_by=users['admin'])
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+    login(client, users['admin'], 'admin')
+    assert b'Fresh message' not in client.get('/admin_stats').data
+    with app_module.app.app_context():
+        db.session.add(app_module.ChatMessage(order_id=order_id, sender_id=users['admin'], message='Fresh message'))
+        db.session.commit()
+
+    assert b'Fresh message' in client.get('/admin_stats').data
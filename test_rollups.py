@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+The report rollup (OrderDailyRollup), agent workloads (AgentWorkload) and
+cycle-time rollup (StageMetric) are kept current by every route that changes
+orders. After each route they must equal what the rebuild commands compute
+from scratch.
+"""
+
+import io
+
+import pytest
+
+from conftest import app_module, db, login
+
+Order = app_module.Order
+
+
+def nonzero(rows, keys, measures):
+    """Rows as sorted tuples; a row an increment brought back to zero equals a missing row"""
+    tuples = []
+    for row in rows:
+        amounts = tuple(round(getattr(row, column), 6) for column in measures)
+        if any(amounts):
+            tuples.append(tuple(getattr(row, column) for column in keys) + amounts)
+    return sorted(tuples, key=repr)
+
+
+def rollups():
+    return {
+        'daily': nonzero(app_module.OrderDailyRollup.query.all(), ('day', 'order_type', 'status', 'agent_id'),
+                         ('order_count', 'quantity_kg', 'amount_usd')),
+        'workload': nonzero(app_module.AgentWorkload.query.all(), ('agent_id',), ('open_orders', 'open_kg')),
+        'stages': nonzero(app_module.StageMetric.query.all(), ('day', 'stage', 'agent_id', 'yarn_type_id'),
+                          ('entered', 'exited', 'seconds_in_stage')),
+    }
+
+
+def assert_matches_rebuild(step):
+    with app_module.app.app_context():
+        incremental = rollups()
+        app_module.rebuild_order_rollups()
+        app_module.rebuild_agent_workload()
+        app_module.rebuild_stage_metrics()
+        rebuilt = rollups()
+    for name in rebuilt:
+        assert incremental[name] == rebuilt[name], f"{name} drifted from a rebuild after {step}"
+
+
+def create(client, users, customer, **fields):
+    form = {'customer_name': customer, 'yarn_type': 'Cotton 30s', 'quantity_kg': '100', 'startup_date': '2030-01-01',
+            'order_type': 'Local', 'amount_usd': '50', 'agent_ids': [str(users['agent1']), str(users['agent2'])]}
+    form.update(fields)
+    client.post('/create_order', data=form)
+    with app_module.app.app_context():
+        return Order.query.filter_by(customer_name=customer).one().id
+
+
+def move_to_cold(order_ids):
+    with app_module.app.app_context():
+        app_module.move_orders_to_cold_storage(order_ids)
+
+
+def version(order_id):
+    with app_module.app.app_context():
+        return db.session.get(Order, order_id).version
+
+
+def test_every_order_route_keeps_the_rollups_equal_to_a_rebuild(client, users, monkeypatch, tmp_path):
+    # upload_contract saves into ./uploads
+    monkeypatch.chdir(tmp_path)
+    login(client, users['admin'], 'admin')
+    orders = {}
+
+    def create_orders():
+        orders['a'] = create(client, users, 'Alpha')
+        orders['b'] = create(client, users, 'Beta', order_type='Export', quantity_kg='40', startup_date='2030-02-01')
+
+    steps = [
+        ('create_order', create_orders),
+        ('move_order', lambda: client.post('/move_order', json={'order_id': orders['a'], 'status': 'Under Booking'})),
+        ('move_orders', lambda: client.post('/move_orders', json={'moves': [
+            {'order_id': orders['a'], 'status': 'Booked'}, {'order_id': orders['b'], 'status': 'Under Booking'}]})),
+        ('update_order', lambda: client.post('/update_order', data={
+            'order_id': orders['a'], 'version': version(orders['a']), 'quantity_kg': '250', 'order_type': 'Export',
+            'startup_date': '2030-03-01', 'assigned_agent': str(users['agent2']), 'agent_ids': [str(users['agent2'])]},
+            headers={'Accept': 'application/json'})),
+        ('update_order status', lambda: client.post('/update_order', data={
+            'order_id': orders['b'], 'status': 'Booked', 'agent_ids': [str(users['agent1'])]},
+            headers={'Accept': 'application/json'})),
+        ('assign_order', lambda: client.post('/assign_order', json={'order_id': orders['b'], 'agent_ids': [users['agent2']]})),
+        ('assign_order auto', lambda: client.post('/assign_order', json={'order_id': orders['a'], 'auto': True})),
+        ('assign_multiple_agents', lambda: client.post('/assign_multiple_agents', json={
+            'order_id': orders['b'], 'agent_ids': [users['agent1'], users['agent2']]})),
+        ('upload_contract', lambda: client.post('/upload_contract', data={
+            'order_id': orders['b'], 'contract_file': (io.BytesIO(b'%PDF-1.4'), 'contract.pdf')})),
+        ('confirm_order_action', lambda: client.post('/confirm_order_action', json={
+            'order_id': orders['b'], 'selected_agent_id': users['agent1']})),
+        ('delete_orders archive', lambda: client.post('/delete_orders', json={'order_ids': [orders['a']], 'action': 'archive'})),
+        ('cold storage', lambda: move_to_cold([orders['a']])),
+        ('restore_orders', lambda: client.post('/restore_orders', json={'order_ids': [orders['a']]})),
+        ('delete_order', lambda: client.post('/delete_order', json={'order_id': orders['b']})),
+        ('delete_orders delete', lambda: client.post('/delete_orders', json={'order_ids': [orders['a']], 'action': 'delete'})),
+    ]
+    for step, action in steps:
+        response = action()
+        if getattr(response, 'is_json', False):
+            assert response.get_json()['success'], step
+        assert_matches_rebuild(step)
+
+    # Both orders were deleted in the end, taking their transitions with them
+    with app_module.app.app_context():
+        assert Order.query.count() == 0
+        assert app_module.OrderStatusTransition.query.count() == 0
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Lazy schema creation: a failed attempt is retried rather than marked done.
+"""
+
+import contextlib
+import io
+
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def schema_pending(fresh_db, monkeypatch):
+    """The schema not yet created, with init_db counting its calls and failing the first"""
+    calls = []
+
+    def flaky_init_db():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError('database not reachable yet')
+
+    monkeypatch.setattr(app_module, '_schema_ready', False)
+    monkeypatch.setattr(app_module, 'init_db', flaky_init_db)
+    monkeypatch.setattr(app_module, 'seed_db', lambda: None)
+    return calls
+
+
+def test_a_failed_first_request_leaves_the_schema_to_the_next_one(client, schema_pending):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        client.get('/login')
+    assert 'database not reachable yet' in output.getvalue()
+    assert app_module._schema_ready is False
+
+    client.get('/login')
+    client.get('/login')
+    assert app_module._schema_ready is True
+    assert schema_pending == [0, 1]
+
+
+def test_a_failed_preload_leaves_the_schema_to_the_workers(schema_pending):
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_module.prepare_for_fork()
+    assert app_module._schema_ready is False
+
+    app_module.prepare_for_fork()
+    assert app_module._schema_ready is True
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Errors while update_order applies and commits changes.
+"""
+
+import logging
+
+from conftest import app_module, db, login, make_order
+
+JSON = {'Accept': 'application/json'}
+
+
+def post_update(client, order, **fields):
+    return client.post('/update_order', data=dict(order_id=order, **fields), headers=JSON)
+
+
+def test_a_rejected_value_is_a_json_400_and_nothing_is_written(client, users, monkeypatch):
+    order = make_order(users['admin'])
+    login(client, users['admin'], 'admin')
+
+    def reject(order, changes, user_id):
+        order.quantity_kg = changes['quantity_kg']
+        raise ValueError('quantity out of range')
+
+    monkeypatch.setattr(app_module, 'apply_order_changes', reject)
+    response = post_update(client, order, quantity_kg='5')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': 'Error updating order: quantity out of range'}
+    with app_module.app.app_context():
+        assert db.session.get(app_module.Order, order).quantity_kg == 100
+
+
+def test_a_bug_reaches_the_error_handler_and_the_log(client, users, monkeypatch, caplog):
+    order = make_order(users['admin'])
+    login(client, users['admin'], 'admin')
+
+    def broken(order, changes, user_id):
+        raise KeyError('rollup_entry')
+
+    monkeypatch.setattr(app_module, 'apply_order_changes', broken)
+    with caplog.at_level(logging.ERROR, logger=app_module.app.logger.name):
+        response = post_update(client, order, quantity_kg='5')
+
+    assert response.status_code == 500
+    assert response.get_json() == {'success': False, 'message': 'Internal server error'}
+    assert any(record.exc_info and record.exc_info[0] is KeyError for record in caplog.records)
+
+
+def test_a_bug_on_a_form_post_gets_the_plain_error_page(client, users, monkeypatch):
+    order = make_order(users['admin'])
+    login(client, users['admin'], 'admin')
+    monkeypatch.setattr(app_module, 'apply_order_changes', lambda *args: 1 / 0)
+
+    response = client.post('/update_order', data={'order_id': order, 'quantity_kg': '5'})
+
+    assert response.status_code == 500
+    assert response.mimetype == 'text/html'
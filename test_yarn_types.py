@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+The yarn type catalog after init_db: the picker's default types and the
+card colors of each family.
+"""
+
+from conftest import app_module, db, login, make_order
+
+YarnType = app_module.YarnType
+
+
+def test_init_db_seeds_the_picker_on_a_fresh_database(client, users):
+    with app_module.app.app_context():
+        app_module.init_db()
+    order = make_order(users['admin'])
+    login(client, users['admin'], 'admin')
+
+    page = client.get(f"/edit_order/{order}").get_data(as_text=True)
+
+    for name in app_module.DEFAULT_YARN_TYPES:
+        assert f'<option value="{name}"' in page
+
+
+def test_seeding_twice_adds_nothing(users):
+    with app_module.app.app_context():
+        app_module.init_db()
+        app_module.init_db()
+        names = sorted(row.name for row in YarnType.query)
+    assert names == sorted(app_module.DEFAULT_YARN_TYPES)
+
+
+def test_only_cotton_wool_and_silk_have_their_own_colors(users):
+    with app_module.app.app_context():
+        app_module.init_db()
+        colors = {row.name: (row.color_start, row.color_end) for row in YarnType.query}
+    assert colors['Cotton'] == ('#ff6b6b', '#4ecdc4')
+    assert colors['Wool'] == ('#a8e6cf', '#ffd93d')
+    assert colors['Silk'] == ('#ff9a9e', '#fecfef')
+    for name in ('Polyester', 'Acrylic', 'Blend'):
+        assert colors[name] == app_module.DEFAULT_YARN_COLORS
+
+
+def test_stored_colors_that_no_longer_match_their_family_are_fixed(users):
+    with app_module.app.app_context():
+        db.session.add(YarnType(name='Acrylic 2/28', normalized_name='acrylic 2 28', family='acrylic',
+                                color_start='#4facfe', color_end='#00f2fe'))
+        db.session.commit()
+        stale = app_module.yarn_catalog()
+
+        app_module.init_db()
+
+        row = YarnType.query.filter_by(normalized_name='acrylic 2 28').one()
+        assert (row.color_start, row.color_end) == app_module.DEFAULT_YARN_COLORS
+
+    # The next request sees the new version and reloads the cached catalog
+    with app_module.app.app_context():
+        assert app_module.yarn_type_info(row.id).gradient == ', '.join(app_module.DEFAULT_YARN_COLORS)
+        assert stale[row.id].gradient == '#4facfe, #00f2fe'